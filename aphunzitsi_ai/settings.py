@@ -27,6 +27,7 @@ ALLOWED_HOSTS = ["*"]
 SITE_ID=2
 
 INSTALLED_APPS = [
+    'daphne',  # ASGI runserver; serve with `daphne aphunzitsi_ai.asgi:application` for the async level views
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -53,7 +54,7 @@ SOCIALACCOUNT_PROVIDERS = {
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',  # Add WhiteNoise for static file serving
+    'core.middleware.AsyncWhiteNoiseMiddleware',  # WhiteNoise static file serving, async-capable for ASGI
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -61,7 +62,9 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'core.cache_middleware.NoCacheMiddleware',  # Prevent caching of authenticated pages
+    'core.middleware.LearnerContextMiddleware',  # request.learner: profile, age and difficulty, computed once
     'core.middleware.ProfileSetupMiddleware',
+    'core.middleware.LLMEndpointMiddleware',
     'allauth.account.middleware.AccountMiddleware',
 ]
 
@@ -83,6 +86,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'aphunzitsi_ai.wsgi.application'
+ASGI_APPLICATION = 'aphunzitsi_ai.asgi.application'
 
 
 # Database
@@ -212,6 +216,105 @@ SOCIALACCOUNT_FORMS = {
     'signup': 'core.allauth_forms.CustomSocialSignupForm',
 }
 
+# AI question pool (see core/ai_question_pool.py and `manage.py refill_question_pool`)
+AI_QUESTION_POOL_LOW_WATER_MARK = 10  # Refill a key when it holds fewer questions than this
+AI_QUESTION_POOL_TARGET_SIZE = 30  # Questions kept ready per (difficulty, age band, topic)
+AI_QUESTION_POOL_INLINE_REFILL = True  # Also refill low keys in a background thread of the web process
+
+# Level assembly (see core/level_assembly.py)
+LEVEL_ASSEMBLY_MAX_WORKERS = 16  # Threads shared by all level requests in a process
+LEVEL_ASSEMBLY_CONCURRENCY = 5  # AI generations in flight per level
+LEVEL_ASSEMBLY_TIMEOUT = 20  # Seconds before unfinished slots fall back to the database
+LEVEL_DEADLINE_SECONDS = 2.5  # Total time a level request may spend; AI slots not ready by then come from the database
+LEVEL_STREAM_FIRST_BATCH_SIZE = 1  # Items in the first AI batch of a streamed level with no database items to lead with
+
+# Batched AI generation (see core/ai_batch.py)
+LLM_BATCH_SIZE = 5  # Items requested per chat completion
+LLM_BATCH_MAX_ROUNDS = 2  # Completions per batch, the extra rounds only re-request invalid items
+
+# Persistent LLM response cache (see core/llm_cache.py)
+LLM_CACHE_ENABLED = True
+LLM_CACHE_PATH = BASE_DIR / 'llm_cache.sqlite3'
+LLM_CACHE_TTL = 7 * 24 * 3600  # Seconds a cached response stays servable
+LLM_CACHE_MAX_ENTRIES = 5000  # Least-recently-used responses are evicted past this size
+LLM_CACHE_VARIANTS = 5  # Distinct responses collected per key before it starts serving hits
+LLM_CACHE_REFRESH_PROBABILITY = 0.2  # Share of lookups on a full key that miss, to swap in a new variant
+
+# Per-model circuit breaker around Groq calls (see core/llm_client.py)
+LLM_BREAKER_FAILURE_THRESHOLD = 3  # Consecutive failed or slow calls before the breaker opens
+LLM_BREAKER_RESET_TIMEOUT = 30  # Seconds open before a single probe call is let through
+LLM_BREAKER_SLOW_CALL_SECONDS = 10  # Calls slower than this count as failures
+
+# Shared async Groq client used by the async level views (see core/llm_client.py)
+LLM_HTTP_MAX_CONNECTIONS = 200  # Connections the pool opens at most, i.e. completions in flight per process
+LLM_HTTP_MAX_KEEPALIVE = 50  # Idle connections kept open for reuse
+LLM_HTTP_KEEPALIVE_EXPIRY = 30  # Seconds an idle connection is kept
+LLM_HTTP_TIMEOUT = 30  # Seconds before a completion request times out (sync calls too; less inside a level's deadline)
+
+# Latency-aware model routing (see core/llm_router.py)
+LLM_MODEL_TIERS = {  # Quality tiers, models in order of preference
+    'fast': ["llama-3.1-8b-instant", "gemma2-9b-it"],
+    'quality': ["llama-3.3-70b-versatile", "mixtral-8x7b-32768"],
+}
+LLM_ROUTER_WINDOW = 50  # Most recent calls per model the rolling stats are computed over
+LLM_ROUTER_WINDOW_SECONDS = 300  # Calls older than this drop out of the stats
+LLM_ROUTER_MIN_SAMPLES = 5  # Calls needed before a model's error rate can rule it out
+LLM_ROUTER_MAX_ERROR_RATE = 0.25  # Models failing more often than this are skipped
+LLM_ROUTER_EXPLORE_RATE = 0.05  # Share of calls sent to another model to keep its stats current
+
+# Coalescing identical in-flight AI batch generations (see core/single_flight.py)
+LLM_COALESCE_ENABLED = True
+LLM_COALESCE_BURST_SECONDS = 10  # Window of recent demand for a key that sizes a flight's spare items
+LLM_COALESCE_MAX_SPARE_ITEMS = 2  # Extra items a flight asks for at most, for requests still to come
+LLM_COALESCE_LEFTOVER_SECONDS = 120  # Unreserved items are handed to later requests for this long
+LLM_COALESCE_WAIT_SECONDS = 20  # Seconds a request waits on another request's flight
+
+# Hedged requests for slow riddle and math batches (see core/llm_hedging.py)
+LLM_HEDGE_ENABLED = True
+LLM_HEDGE_PERCENTILE = 90  # A call running longer than this percentile of its model's latency gets a hedge
+LLM_HEDGE_DEFAULT_DELAY_SECONDS = 2.0  # Hedge delay while a model has too few calls for a percentile
+LLM_HEDGE_MIN_DELAY_SECONDS = 0.3  # Never hedge sooner than this
+LLM_HEDGE_MAX_EXTRA_RATIO = 0.1  # Hedges sent at most, as a share of hedgeable calls
+LLM_HEDGE_MAX_WORKERS = 32  # Threads running sync calls that may be hedged
+
+# Client-side pacing under Groq's per-model rate limits (see core/llm_quota.py)
+LLM_QUOTA_ENABLED = True
+LLM_QUOTA_DEFAULT_LIMITS = {'rpm': 30, 'tpm': 6000}  # Requests and tokens per minute; match the account's Groq limits
+LLM_QUOTA_LIMITS = {}  # Per-model overrides, e.g. {'llama-3.3-70b-versatile': {'rpm': 30, 'tpm': 12000}}
+LLM_QUOTA_RESERVE = {'interactive': 0.0, 'prefetch': 0.25, 'background': 0.5}  # Share of each bucket a class must leave for higher ones
+LLM_QUOTA_MAX_WAIT_SECONDS = 30  # Longest a call waits for quota (interactive calls at most until their level's deadline)
+
+# Completion backend: 'groq', 'stub' (core/llm_stub.py, for offline load and latency tests) or 'replay' (a recorded trace)
+LLM_BACKEND = os.getenv('LLM_BACKEND', 'groq')
+LLM_STUB_LATENCY_DISTRIBUTION = 'lognormal'  # 'fixed', 'uniform' or 'lognormal'
+LLM_STUB_LATENCY_MEDIAN = 0.8  # Seconds for a single-item completion
+LLM_STUB_LATENCY_SPREAD = 0.4  # Half-width for 'uniform', sigma for 'lognormal'
+LLM_STUB_LATENCY_PER_ITEM = 0.15  # Extra seconds per additional item in a batch
+LLM_STUB_MODEL_LATENCY_MEDIANS = {}  # Per-model overrides of LLM_STUB_LATENCY_MEDIAN, e.g. to exercise routing
+LLM_STUB_ERROR_RATE = 0.0  # Fraction of calls answered with a 500
+LLM_STUB_RATE_LIMIT_RATE = 0.0  # Fraction of calls answered with a 429
+
+# Recording and replaying LLM traffic (see core/llm_trace.py and the bench_levels command)
+LLM_TRACE_RECORD = os.getenv('LLM_TRACE_RECORD') or None  # Path of a JSONL file to append every request sent to
+LLM_REPLAY_TRACE = os.getenv('LLM_REPLAY_TRACE', str(BASE_DIR / 'llm_trace.jsonl'))  # Trace LLM_BACKEND = 'replay' answers from
+LLM_REPLAY_SPEED = 1.0  # Replay recorded latencies this many times faster
+
+# Server-side record of served questions (see core/seen_questions.py)
+SEEN_QUESTIONS_SESSION_RETENTION_DAYS = 30  # Sets of learners not signed in expire this long after their last update (prune_seen_questions)
+
+# Harvesting validated AI output into the question tables (see core/ai_harvest.py)
+AI_HARVEST_ENABLED = True
+AI_HARVEST_BATCH_SIZE = 25  # Queued items written per bulk_create
+AI_HARVEST_FLUSH_SECONDS = 60  # Write a partial batch once it has waited this long
+AI_GROWTH_RATIO = 0.2  # Share of each level still sent to the AI once the database can cover it
+
+# Per-call LLM instrumentation (see core/llm_metrics.py)
+LLM_METRICS_ENABLED = True
+LLM_METRICS_PERSIST = True  # Also write events to LLMMetricEvent for the llm_metrics command
+LLM_METRICS_FLUSH_SIZE = 50  # Events written per bulk_create
+LLM_METRICS_FLUSH_SECONDS = 30  # Write a partial batch once it has waited this long
+LLM_METRICS_RETENTION_DAYS = 14  # The llm_metrics command deletes older events
+
 
 
 
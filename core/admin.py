@@ -130,8 +130,8 @@ class MathGameLevelAdmin(admin.ModelAdmin):
 
 @admin.register(MathGameProblem)
 class MathGameProblemAdmin(admin.ModelAdmin):
-    list_display = ['problem_text', 'correct_answer', 'operation', 'level', 'is_active']
-    list_filter = ['level', 'operation', 'is_active']
+    list_display = ['problem_text', 'correct_answer', 'operation', 'level', 'source', 'age_band', 'is_active']
+    list_filter = ['level', 'operation', 'is_active', 'source', 'age_band']
     search_fields = ['problem_text']
     list_editable = ['is_active']
 
@@ -148,7 +148,7 @@ class UserMathProgressAdmin(admin.ModelAdmin):
 
 
 from django.contrib import admin
-from .models import QuizCategory, QuizQuestion, QuizLevel, QuizGameSession, UserQuizProgress
+from .models import QuizCategory, QuizQuestion, QuizLevel, QuizGameSession, UserQuizProgress, AIQuestionPoolItem
 
 @admin.register(QuizCategory)
 class QuizCategoryAdmin(admin.ModelAdmin):
@@ -159,8 +159,8 @@ class QuizCategoryAdmin(admin.ModelAdmin):
 
 @admin.register(QuizQuestion)
 class QuizQuestionAdmin(admin.ModelAdmin):
-    list_display = ['question_text', 'category', 'correct_option', 'points', 'is_active']
-    list_filter = ['category', 'is_active', 'category__difficulty']
+    list_display = ['question_text', 'category', 'correct_option', 'points', 'source', 'age_band', 'is_active']
+    list_filter = ['category', 'is_active', 'category__difficulty', 'source', 'age_band']
     search_fields = ['question_text', 'option_a', 'option_b', 'option_c', 'option_d']
     list_editable = ['is_active', 'points']
 
@@ -181,6 +181,13 @@ class UserQuizProgressAdmin(admin.ModelAdmin):
     list_display = ['user', 'highest_level', 'total_score', 'accuracy_rate', 'games_played']
     readonly_fields = ['created_at', 'updated_at']
 
+@admin.register(AIQuestionPoolItem)
+class AIQuestionPoolItemAdmin(admin.ModelAdmin):
+    list_display = ['question_text', 'difficulty', 'age_band', 'topic', 'created_at']
+    list_filter = ['difficulty', 'age_band', 'topic']
+    search_fields = ['question_text']
+    readonly_fields = ['created_at']
+
 from django.contrib import admin
 from .models import (
     RiddleCategory,
@@ -0,0 +1,108 @@
+"""
+Helpers for batched AI generation.
+
+The ai_*_generator modules can ask for several items in one chat completion
+against a JSON array schema. Every element is validated on its own; valid
+items are kept and only the missing slots are requested again, unless the
+level's deadline (core.deadlines) has passed.
+"""
+import json
+import logging
+from django.conf import settings
+from . import deadlines
+from .deadlines import DeadlineExceeded
+from .llm_client import CircuitOpenError
+from .llm_quota import QuotaExceeded
+from .llm_metrics import record_validation_failure
+
+logger = logging.getLogger(__name__)
+
+LLM_BATCH_SIZE = getattr(settings, 'LLM_BATCH_SIZE', 5)
+LLM_BATCH_MAX_ROUNDS = getattr(settings, 'LLM_BATCH_MAX_ROUNDS', 2)
+
+
+def parse_batch_items(content, items_key, model=None):
+    """
+    Pull the list of items out of a batch response: {"<items_key>": [...]} or
+    a bare list. Items are tagged with the model that wrote them under
+    'model' so harvesting can record it.
+    """
+    data = json.loads(content)
+    if isinstance(data, dict):
+        data = data.get(items_key, [])
+    if not isinstance(data, list):
+        raise ValueError(f"Batch response has no '{items_key}' list")
+    if model:
+        for item in data:
+            if isinstance(item, dict):
+                item['model'] = model
+    return data
+
+
+def collect_batch(request_items, validate, count, max_rounds=LLM_BATCH_MAX_ROUNDS, label="item"):
+    """
+    Fill `count` slots from batched completions.
+    request_items(n) returns a list of raw items from one completion and
+    validate(raw) returns the cleaned item or raises. Invalid elements are
+    dropped and only the missing slots are requested in the next round.
+    Returns a list of length count with None for slots that stayed empty.
+    """
+    items = []
+    for round_number in range(1, max_rounds + 1):
+        needed = count - len(items)
+        if needed <= 0:
+            break
+        if round_number > 1 and deadlines.deadline_passed():
+            logger.info(f"Not re-requesting {needed} AI {label}s: the level's deadline has passed")
+            break
+
+        try:
+            raw_items = request_items(needed)
+        except (CircuitOpenError, DeadlineExceeded, QuotaExceeded) as e:
+            logger.info(f"Skipping AI {label} batch of {needed}: {e}")
+            break
+        except Exception as e:
+            logger.error(f"AI {label} batch of {needed} failed in round {round_number}: {e}")
+            break
+
+        _keep_valid(raw_items, needed, validate, items, label, round_number, count)
+
+    return items + [None] * (count - len(items))
+
+
+async def acollect_batch(request_items, validate, count, max_rounds=LLM_BATCH_MAX_ROUNDS, label="item"):
+    """collect_batch for async generators: request_items(n) is a coroutine function"""
+    items = []
+    for round_number in range(1, max_rounds + 1):
+        needed = count - len(items)
+        if needed <= 0:
+            break
+        if round_number > 1 and deadlines.deadline_passed():
+            logger.info(f"Not re-requesting {needed} AI {label}s: the level's deadline has passed")
+            break
+
+        try:
+            raw_items = await request_items(needed)
+        except (CircuitOpenError, DeadlineExceeded, QuotaExceeded) as e:
+            logger.info(f"Skipping AI {label} batch of {needed}: {e}")
+            break
+        except Exception as e:
+            logger.error(f"AI {label} batch of {needed} failed in round {round_number}: {e}")
+            break
+
+        _keep_valid(raw_items, needed, validate, items, label, round_number, count)
+
+    return items + [None] * (count - len(items))
+
+
+def _keep_valid(raw_items, needed, validate, items, label, round_number, count):
+    rejected = 0
+    for raw in raw_items[:needed]:
+        try:
+            items.append(validate(raw))
+        except (ValueError, TypeError, KeyError, AttributeError) as e:
+            rejected += 1
+            logger.warning(f"Discarding invalid AI {label}: {e}")
+            record_validation_failure(label, e)
+
+    logger.info(f"AI {label} batch round {round_number}: {len(raw_items)} returned, {rejected} rejected, {count - len(items)} still missing")
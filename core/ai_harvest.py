@@ -0,0 +1,208 @@
+"""
+Harvest validated AI output into the question tables.
+
+Every AI quiz question, riddle and math problem that passes validation is
+queued here and written to QuizQuestion, RiddleQuestion or MathGameProblem
+with source='ai', the model that produced it and the learner's age band.
+Writes are buffered and go out with bulk_create once AI_HARVEST_BATCH_SIZE
+items are waiting (or AI_HARVEST_FLUSH_SECONDS have passed), after dropping
+items whose content_hash is already stored. Riddles are also checked against
+the near-duplicate index of stored riddles (see core.near_duplicates).
+Flushes that _add() triggers run on a background thread, one at a time, so
+that work never lands on a learner's level request.
+
+As the tables grow the level views serve mostly from the database and only
+send plan_ai_slots() of a level to the LLM to keep growing coverage.
+"""
+import atexit
+import hashlib
+import logging
+import math
+import re
+import threading
+import time
+from django.conf import settings
+from django.db import connection
+from .category_catalog import invalidate_category_catalog
+from .distractor_index import invalidate_distractor_index
+from .models import MathGameProblem, QuizQuestion, RiddleQuestion
+from .near_duplicates import NearDuplicateIndex, ensure_riddle_index, find_stored_riddle_duplicate, index_riddles, sketch
+from .sampling import invalidate_samplers
+
+logger = logging.getLogger(__name__)
+
+AI_HARVEST_ENABLED = getattr(settings, 'AI_HARVEST_ENABLED', True)
+AI_HARVEST_BATCH_SIZE = getattr(settings, 'AI_HARVEST_BATCH_SIZE', 25)
+AI_HARVEST_FLUSH_SECONDS = getattr(settings, 'AI_HARVEST_FLUSH_SECONDS', 60)
+AI_GROWTH_RATIO = getattr(settings, 'AI_GROWTH_RATIO', 0.2)
+
+_buffers = {QuizQuestion: [], RiddleQuestion: [], MathGameProblem: []}
+_buffer_lock = threading.Lock()
+_last_flush = time.monotonic()
+_flushing = False
+_riddle_index_checked = False
+
+
+def content_hash(*parts):
+    """Fingerprint of an item's text, ignoring case, punctuation and spacing"""
+    normalized = "|".join(" ".join(re.sub(r'[^\w\s]', ' ', str(part).lower()).split()) for part in parts)
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+def plan_ai_slots(needed, db_available):
+    """
+    How many of a level's `needed` slots to send to the LLM when
+    `db_available` stored items could be served instead. At least
+    AI_GROWTH_RATIO of the level keeps growing coverage; the rest comes from
+    the database unless it runs short.
+    """
+    growth = math.ceil(needed * AI_GROWTH_RATIO)
+    return min(needed, max(growth, needed - db_available))
+
+
+def harvest_quiz_question(category, question, ai_model, age_band):
+    """Queue a validated AI quiz question (generate_ai_question format) for QuizQuestion"""
+    options = question['options']
+    _add(QuizQuestion(
+        category=category,
+        question_text=question['question'],
+        option_a=str(options[0])[:200],
+        option_b=str(options[1])[:200],
+        option_c=str(options[2])[:200],
+        option_d=str(options[3])[:200],
+        correct_option=question['correct'],
+        explanation=question.get('explanation', ''),
+        source='ai',
+        ai_model=ai_model,
+        age_band=age_band,
+        content_hash=content_hash(question['question'])
+    ))
+
+
+def harvest_riddle(category, riddle, ai_model, age_band):
+    """Queue a validated AI riddle for RiddleQuestion"""
+    _add(RiddleQuestion(
+        category=category,
+        question_text=riddle['question'],
+        answer=riddle['answer'],
+        explanation=riddle.get('explanation', ''),
+        source='ai',
+        ai_model=ai_model,
+        age_band=age_band,
+        content_hash=content_hash(riddle['question'])
+    ))
+
+
+def harvest_math_problem(level, problem, ai_model, age_band):
+    """Queue a validated AI math problem for MathGameProblem"""
+    problem_text = str(problem['problem_text'])[:100]
+    _add(MathGameProblem(
+        level_id=level.pk,
+        problem_text=problem_text,
+        correct_answer=problem['correct_answer'],
+        operation=str(problem.get('operation', ''))[:5],
+        hint=problem.get('hint') or '',
+        source='ai',
+        ai_model=ai_model,
+        age_band=age_band,
+        content_hash=content_hash(level.pk, problem_text)
+    ))
+
+
+def _add(item):
+    global _flushing
+    if not AI_HARVEST_ENABLED:
+        return
+
+    with _buffer_lock:
+        _buffers[type(item)].append(item)
+        waiting = sum(len(items) for items in _buffers.values())
+        due = waiting >= AI_HARVEST_BATCH_SIZE or time.monotonic() - _last_flush >= AI_HARVEST_FLUSH_SECONDS
+        # Items queued while a flush runs wait for the next one
+        due = due and not _flushing
+        if due:
+            _flushing = True
+
+    if due:
+        threading.Thread(target=_flush_in_background, daemon=True).start()
+
+
+def _flush_in_background():
+    global _flushing
+    try:
+        flush_harvest()
+    except Exception:
+        logger.exception("Background harvest flush failed")
+    finally:
+        connection.close()
+        with _buffer_lock:
+            _flushing = False
+
+
+def flush_harvest():
+    """Write every queued item to its table. Returns how many rows were created."""
+    global _last_flush
+    with _buffer_lock:
+        pending = {model: items for model, items in _buffers.items() if items}
+        for model in pending:
+            _buffers[model] = []
+        _last_flush = time.monotonic()
+
+    created = 0
+    for model, items in pending.items():
+        try:
+            created += _bulk_insert(model, items)
+        except Exception:
+            logger.exception(f"Failed to harvest {len(items)} AI items into {model.__name__}")
+    return created
+
+
+def _bulk_insert(model, items):
+    unique = {}
+    for item in items:
+        unique.setdefault(item.content_hash, item)
+
+    existing = set(
+        model.objects.filter(content_hash__in=list(unique)).values_list('content_hash', flat=True)
+    )
+    new_items = [item for item_hash, item in unique.items() if item_hash not in existing]
+    if model is RiddleQuestion:
+        new_items = _drop_near_duplicate_riddles(new_items)
+    model.objects.bulk_create(new_items)
+    # bulk_create sends no post_save
+    invalidate_samplers(model)
+    if model is QuizQuestion:
+        invalidate_category_catalog('quiz')
+    if model is RiddleQuestion:
+        index_riddles(new_items)
+        invalidate_distractor_index()
+        invalidate_category_catalog('riddle')
+
+    logger.info(f"Harvested {len(new_items)} AI items into {model.__name__} ({len(items) - len(new_items)} duplicates skipped)")
+    return len(new_items)
+
+
+def _drop_near_duplicate_riddles(riddles):
+    global _riddle_index_checked
+    if not _riddle_index_checked:
+        # Riddles added outside harvesting/imports (seeds, admin) have no band keys yet
+        ensure_riddle_index()
+        _riddle_index_checked = True
+
+    batch_index = NearDuplicateIndex()
+    kept = []
+    for riddle in riddles:
+        riddle_sketch = sketch(riddle.question_text)
+        if batch_index.contains(riddle_sketch) or find_stored_riddle_duplicate(riddle_sketch):
+            continue
+        batch_index.add(riddle_sketch)
+        kept.append(riddle)
+    return kept
+
+
+@atexit.register
+def _flush_on_exit():
+    try:
+        flush_harvest()
+    except Exception:
+        pass
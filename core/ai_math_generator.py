@@ -1,27 +1,24 @@
 import json
 import logging
-import os
-from dotenv import load_dotenv
-from groq import Groq
-from django.conf import settings
-
-load_dotenv()
+from .ai_batch import acollect_batch, collect_batch, parse_batch_items
+from .llm_client import chat_completion, is_configured
+from .llm_hedging import ahedged_completion, hedged_completion
+from .llm_router import choose_model
+from .single_flight import acoalesce, coalesce
 
 logger = logging.getLogger(__name__)
 
-api_key = os.getenv('GROQ_API_KEY') or getattr(settings, 'GROQ_API_KEY', None)
-if api_key:
-    client = Groq(api_key=api_key)
-else:
-    client = None
-    logger.warning("GROQ_API_KEY not configured. Math AI generation will fall back to defaults.")
+MODEL_TIER = 'fast'  # LLM_MODEL_TIERS entry the calls are routed within
+BATCH_TOKENS_PER_ITEM = 150
+
+SYSTEM_PROMPT = "You are a fun tutor who makes learning exciting by creating engaging math problems for children. Always respond with valid JSON."
 
 
 def generate_ai_math_problem(difficulty, operations, min_value, max_value, age, problem_number=1):
     """
     Generate an AI math problem with JSON structure similar to quiz logic.
     """
-    if not client:
+    if not is_configured():
         raise ValueError("Groq client not available.")
 
     ops = operations or ['+']
@@ -45,12 +42,12 @@ Return valid JSON with this structure:
 
 Ensure correct_answer is an integer and matches the problem.
 """
-    response = client.chat.completions.create(
-        model="llama-3.1-8b-instant",
+    content = chat_completion(
+        model=choose_model(MODEL_TIER),
         messages=[
             {
                 "role": "system",
-                "content": "You are a fun tutor who makes learning exciting by creating engaging math problems for children. Always respond with valid JSON."
+                "content": SYSTEM_PROMPT
             },
             {
                 "role": "user",
@@ -59,7 +56,8 @@ Ensure correct_answer is an integer and matches the problem.
         ],
         temperature=0.8,
         max_tokens=400,
-        response_format={"type": "json_object"}
+        response_format={"type": "json_object"},
+        cache_params={'kind': 'math_problem', 'difficulty': difficulty, 'operations': ops, 'min_value': min_value, 'max_value': max_value, 'age': age}
 
         # "llama-3.1-8b-instant",
         # "llama-3.3-70b-versatile",
@@ -67,13 +65,112 @@ Ensure correct_answer is an integer and matches the problem.
         # "gemma2-9b-it"
     )
 
-    content = response.choices[0].message.content
-    data = json.loads(content)
+    return validate_ai_math_problem(json.loads(content))
 
+
+def validate_ai_math_problem(data):
+    """Check one AI math problem and return it, raising ValueError when it is unusable"""
     required_keys = ['problem_text', 'display_text', 'correct_answer', 'operation']
-    if not all(key in data for key in required_keys):
+    if not isinstance(data, dict) or not all(key in data for key in required_keys):
         raise ValueError("AI math problem missing required fields.")
 
-    data['correct_answer'] = int(data['correct_answer'])
+    for key in ('problem_text', 'display_text', 'operation'):
+        if not isinstance(data[key], str) or not data[key].strip():
+            raise ValueError(f"AI math problem {key} is not text.")
+    for key in ('tip', 'hint', 'explanation'):
+        if data.get(key) is not None and not isinstance(data[key], str):
+            raise ValueError(f"AI math problem {key} is not text.")
+
+    answer = data['correct_answer']
+    if isinstance(answer, bool) or not isinstance(answer, (int, float, str)):
+        raise ValueError("AI math problem correct_answer is not a number.")
+    try:
+        number = float(answer)
+    except ValueError:
+        raise ValueError("AI math problem correct_answer is not a number.")
+    if not number.is_integer():
+        raise ValueError("AI math problem correct_answer is not a whole number.")
+    data['correct_answer'] = int(number)
     return data
 
+
+def _math_problems_batch_request(difficulty, ops, min_value, max_value, age, n, fresh=False):
+    """chat_completion() arguments for a batch of n math problems"""
+    ops_text = ", ".join(ops)
+    prompt = f"""
+Create {n} different {difficulty} level math problems that only use these operations: {ops_text}.
+Use whole numbers between {min_value} and {max_value}.
+Target age: {age}. Vary between word-problems and expressions. Do not repeat a problem.
+
+Return valid JSON with exactly {n} items in "problems":
+{{
+  "problems": [
+    {{
+      "problem_text": "12 + 7",
+      "display_text": "12 + 7 = ?",
+      "correct_answer": 19,
+      "operation": "+",
+      "tip": "Add the numbers carefully.",
+      "hint": "Start by adding the tens first.",
+      "explanation": "12 plus 7 equals 19."
+    }}
+  ]
+}}
+
+Ensure every correct_answer is an integer and matches its problem.
+"""
+    return {
+        'model': choose_model(MODEL_TIER),
+        'messages': [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ],
+        'temperature': 0.8,
+        'max_tokens': BATCH_TOKENS_PER_ITEM * n + 100,
+        'response_format': {"type": "json_object"},
+        'cache_params': {'kind': 'math_problem_batch', 'difficulty': difficulty, 'operations': ops, 'min_value': min_value, 'max_value': max_value, 'age': age, 'count': n},
+        'fresh': fresh,
+    }
+
+
+def generate_ai_math_problems_batch(difficulty, operations, min_value, max_value, age, count, fresh=False):
+    """
+    Generate `count` AI math problems in one chat completion per round.
+    Identical requests in flight share the completion (see core.single_flight).
+    Returns a list of length count; slots that could not be filled are None.
+    fresh=True skips the response cache lookup, for callers after new content.
+    """
+    if not is_configured():
+        raise ValueError("Groq client not available.")
+
+    ops = operations or ['+']
+
+    def request_items(n):
+        request = _math_problems_batch_request(difficulty, ops, min_value, max_value, age, n, fresh)
+        content, model = hedged_completion(request, MODEL_TIER)
+        return parse_batch_items(content, 'problems', model=model)
+
+    return coalesce(
+        ('math_problem', difficulty, tuple(ops), min_value, max_value, age, fresh),
+        count,
+        lambda n: collect_batch(request_items, validate_ai_math_problem, n, label="math problem")
+    )
+
+
+async def agenerate_ai_math_problems_batch(difficulty, operations, min_value, max_value, age, count, fresh=False):
+    """generate_ai_math_problems_batch for the async level views"""
+    if not is_configured():
+        raise ValueError("Groq client not available.")
+
+    ops = operations or ['+']
+
+    async def request_items(n):
+        request = _math_problems_batch_request(difficulty, ops, min_value, max_value, age, n, fresh)
+        content, model = await ahedged_completion(request, MODEL_TIER)
+        return parse_batch_items(content, 'problems', model=model)
+
+    return await acoalesce(
+        ('math_problem', difficulty, tuple(ops), min_value, max_value, age, fresh),
+        count,
+        lambda n: acollect_batch(request_items, validate_ai_math_problem, n, label="math problem")
+    )
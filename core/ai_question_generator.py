@@ -1,35 +1,34 @@
-from groq import Groq
-from django.conf import settings
 import json
 import random
 import logging
+from .ai_batch import collect_batch, parse_batch_items
+from .llm_client import chat_completion
+from .llm_router import choose_model
+from .llm_metrics import record_fallback, record_validation_failure
+from .single_flight import coalesce
 
 logger = logging.getLogger(__name__)
 
-client = Groq(api_key=settings.GROQ_API_KEY)
+MODEL_TIER = 'fast'  # LLM_MODEL_TIERS entry the calls are routed within
+BATCH_TOKENS_PER_ITEM = 250
+
+SYSTEM_PROMPT = "You are a fun tutor who makes learning exciting by creating engaging quiz questions for children. Always respond with valid JSON. Create unique questions each time."
+
+QUESTION_TYPES = {
+    'easy': ['Presidents of Africa','basic fact', 'identification', 'matching','multiple choice', 'fill-in-blank'],
+    'medium': ['African natural resources','application', 'comparison', 'explanation', 'analysis', 'short answer', 'sequence'],
+    'hard': ['Malawian History','Mining in Africa','critical thinking', 'problem solving', 'evaluation', 'synthesis']
+}
 
 def generate_ai_question(difficulty, age, topic, question_number=1):
     """
     Generate an AI question with variety based on question number
     """
-    available_models = [
-        "llama-3.1-8b-instant",
-        "llama-3.3-70b-versatile",
-        "mixtral-8x7b-32768",
-        "gemma2-9b-it"
-    ]
-    
-    model = available_models[0]  # Use the first available model
-    #model = random.choice(available_models)
+    # Fastest healthy model of the tier (see core.llm_router)
+    model = choose_model(MODEL_TIER)
     
     # Add variety based on question number and topic
-    question_types = {
-        'easy': ['Presidents of Africa','basic fact', 'identification', 'matching','multiple choice', 'fill-in-blank'],
-        'medium': ['African natural resources','application', 'comparison', 'explanation', 'analysis', 'short answer', 'sequence'],
-        'hard': ['Malawian History','Mining in Africa','critical thinking', 'problem solving', 'evaluation', 'synthesis']
-    }
-    
-    q_types = question_types.get(difficulty, question_types['easy'])
+    q_types = QUESTION_TYPES.get(difficulty, QUESTION_TYPES['easy'])
     question_type = q_types[(question_number - 1) % len(q_types)]
     
     # Different prompts for variety
@@ -76,12 +75,12 @@ Respond with JSON:
     try:
         logger.info(f"Generating AI question {question_number} for {age}y/o, {difficulty}, {topic}")
         
-        response = client.chat.completions.create(
+        result_text = chat_completion(
             model=model,
             messages=[
                 {
                     "role": "system", 
-                    "content": "You are a fun tutor who makes learning exciting by creating engaging quiz questions for children. Always respond with valid JSON. Create unique questions each time."
+                    "content": SYSTEM_PROMPT
                 },
                 {
                     "role": "user", 
@@ -90,27 +89,22 @@ Respond with JSON:
             ],
             temperature=0.8,  # Higher temperature for more variety
             max_tokens=500,
-            response_format={"type": "json_object"}
+            response_format={"type": "json_object"},
+            cache_params={'kind': 'quiz_question', 'difficulty': difficulty, 'age': age, 'topic': topic, 'question_type': question_type}
         )
-        
-        result_text = response.choices[0].message.content
         logger.info(f"AI response received for question {question_number}")
         
-        result = json.loads(result_text)
-        
-        # Validate the response
-        required_keys = ['question', 'options', 'correct', 'explanation']
-        if all(key in result for key in required_keys):
-            if len(result['options']) == 4 and result['correct'] in ['A', 'B', 'C', 'D']:
-                logger.info(f"AI question {question_number} generated successfully")
-                return result
-            else:
-                raise ValueError("Invalid options or correct answer format")
-        else:
-            raise ValueError("Missing required fields in AI response")
+        try:
+            result = validate_ai_question(json.loads(result_text))
+        except ValueError as e:
+            record_validation_failure("question", e)
+            raise
+        logger.info(f"AI question {question_number} generated successfully")
+        return result
             
     except Exception as e:
         logger.error(f"AI question generation failed for question {question_number}: {e}")
+        record_fallback("question", "static", type(e).__name__)
         
         # Map difficulty to level number
         difficulty_to_level = {
@@ -132,6 +126,64 @@ Respond with JSON:
         }
 
 
+def validate_ai_question(result):
+    """Check one AI question and return it, raising ValueError when it is unusable"""
+    required_keys = ['question', 'options', 'correct', 'explanation']
+    if not isinstance(result, dict) or not all(key in result for key in required_keys):
+        raise ValueError("Missing required fields in AI response")
+    if not isinstance(result['options'], list) or len(result['options']) != 4 or result['correct'] not in ['A', 'B', 'C', 'D']:
+        raise ValueError("Invalid options or correct answer format")
+    return result
+
+
+def generate_ai_questions_batch(difficulty, age, topic, count, fresh=False):
+    """
+    Generate `count` AI questions with one chat completion per round.
+    Identical requests in flight share the completion (see core.single_flight).
+    Returns a list of length count; slots that could not be filled are None.
+    fresh=True skips the response cache lookup, for callers after new content.
+    """
+    q_types = QUESTION_TYPES.get(difficulty, QUESTION_TYPES['easy'])
+
+    def request_items(n):
+        prompt = f"""Create {n} different {difficulty} level quiz questions about {topic} for a {age}-year-old.
+Mix these question types: {', '.join(q_types)}.
+Make them engaging and educational. Do not repeat a question.
+
+Format your response as JSON with exactly {n} items in "questions":
+{{
+    "questions": [
+        {{
+            "question": "question here",
+            "options": ["A", "B", "C", "D"],
+            "correct": "A",
+            "explanation": "brief explanation"
+        }}
+    ]
+}}"""
+        logger.info(f"Generating batch of {n} AI questions for {age}y/o, {difficulty}, {topic}")
+        model = choose_model(MODEL_TIER)
+        content = chat_completion(
+            model=model,
+            messages=[
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0.8,
+            max_tokens=BATCH_TOKENS_PER_ITEM * n + 100,
+            response_format={"type": "json_object"},
+            cache_params={'kind': 'quiz_question_batch', 'difficulty': difficulty, 'age': age, 'topic': topic, 'count': n},
+            fresh=fresh
+        )
+        return parse_batch_items(content, 'questions', model=model)
+
+    return coalesce(
+        ('quiz_question', difficulty, age, topic, fresh),
+        count,
+        lambda n: collect_batch(request_items, validate_ai_question, n, label="question")
+    )
+
+
 def create_unique_fallback_question(level_number, index, difficulty, topic):
     """Create unique fallback questions"""
     fallbacks = [
@@ -0,0 +1,228 @@
+"""
+Pool of pre-generated AI quiz questions.
+
+get_quiz_level pops ready questions from the pool instead of waiting on Groq.
+The pool is keyed by (difficulty, age band, topic) and is kept above its
+low-water mark by the refill_question_pool management command, with an
+optional in-process background refill when a key runs low. Every generated
+question is also harvested into QuizQuestion (see core.ai_harvest); levels
+add the harvested copies of the pooled questions they serve to the learner's
+seen set (harvested_question_ids), so the copy is not served again later.
+
+Serving claims a batch of rows in one statement: SELECT ... FOR UPDATE SKIP
+LOCKED where the database has it, else (SQLite, where select_for_update does
+nothing) DELETE ... RETURNING, which says which rows this request removed.
+Either way concurrent levels never share a question. Refills skip questions
+already pooled for the key.
+"""
+import logging
+import threading
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count
+from .models import AIQuestionPoolItem, QuizCategory, QuizLevel, QuizQuestion
+from .game_utils import get_age_band, get_difficulty_by_age
+from .ai_question_generator import generate_ai_questions_batch
+from .ai_harvest import content_hash, flush_harvest, harvest_quiz_question
+from .llm_metrics import current_endpoint
+from .llm_quota import PREFETCH, call_priority
+from .level_assembly import fan_out_batches
+
+logger = logging.getLogger(__name__)
+
+POOL_LOW_WATER_MARK = getattr(settings, 'AI_QUESTION_POOL_LOW_WATER_MARK', 10)
+POOL_TARGET_SIZE = getattr(settings, 'AI_QUESTION_POOL_TARGET_SIZE', 30)
+POOL_INLINE_REFILL = getattr(settings, 'AI_QUESTION_POOL_INLINE_REFILL', True)
+
+# Age used in the generation prompt for each age band
+AGE_BAND_PROMPT_AGES = {
+    '3-6': 5,
+    '7-9': 8,
+    '10-12': 10,
+    '13+': 13,
+}
+
+_refilling_keys = set()
+_refilling_lock = threading.Lock()
+
+
+def select_quiz_categories(level, user_age=None):
+    """Categories a quiz level draws from for a learner of the given age"""
+    categories = QuizCategory.objects.filter(is_active=True)
+    age_difficulty = get_difficulty_by_age(user_age)
+    if age_difficulty:
+        categories = categories.filter(difficulty=age_difficulty)
+
+    # If no age-appropriate category, fall back to level's category
+    if not categories.exists():
+        categories = QuizCategory.objects.filter(pk=level.category_id)
+    return categories
+
+
+def pop_pool_questions(difficulty, age_band, topic, count):
+    """
+    Remove and return up to `count` pooled questions for a key.
+    Never calls the AI; schedules a background refill when the key runs low.
+    """
+    if count <= 0:
+        return []
+
+    pool = AIQuestionPoolItem.objects.filter(difficulty=difficulty, age_band=age_band, topic=topic).order_by('pk')
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            items = list(pool.select_for_update(skip_locked=True)[:count])
+            AIQuestionPoolItem.objects.filter(pk__in=[item.pk for item in items]).delete()
+    else:
+        items = []
+        candidates = list(pool[:count])
+        while candidates:
+            claimed = _delete_returning_pks([item.pk for item in candidates])
+            items += [item for item in candidates if item.pk in claimed]
+            if len(items) == count or len(claimed) == len(candidates):
+                break
+            # Rows claimed by a concurrent request: look again past them
+            candidates = list(pool.filter(pk__gt=candidates[-1].pk)[:count - len(items)])
+
+    if len(items) < count or get_pool_size(difficulty, age_band, topic) < POOL_LOW_WATER_MARK:
+        request_pool_refill(difficulty, age_band, topic)
+
+    return [item.to_ai_question() for item in items]
+
+
+def _delete_returning_pks(pks):
+    """Delete the pool rows with these pks in one statement; returns the pks this call removed"""
+    table = connection.ops.quote_name(AIQuestionPoolItem._meta.db_table)
+    placeholders = ", ".join(["%s"] * len(pks))
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {table} WHERE id IN ({placeholders}) RETURNING id", pks)
+        return {row[0] for row in cursor.fetchall()}
+
+
+def harvested_question_ids(questions):
+    """Ids of the QuizQuestion rows harvested from these pooled questions (pop_pool_questions output)"""
+    if not questions:
+        return []
+    hashes = [content_hash(question['question']) for question in questions]
+    return list(QuizQuestion.objects.filter(content_hash__in=hashes).values_list('pk', flat=True))
+
+
+def get_pool_size(difficulty, age_band, topic):
+    return AIQuestionPoolItem.objects.filter(
+        difficulty=difficulty, age_band=age_band, topic=topic
+    ).count()
+
+
+def get_pool_keys():
+    """All (difficulty, age_band, topic) keys get_quiz_level can ask for"""
+    keys = set()
+    ages = [None] + list(AGE_BAND_PROMPT_AGES.values())
+    for level in QuizLevel.objects.select_related('category'):
+        for age in ages:
+            category = select_quiz_categories(level, age).first()
+            topic = category.name if category else "general knowledge"
+            keys.add((level.category.difficulty, get_age_band(age), topic))
+    return sorted(keys)
+
+
+def refill_pool_key(difficulty, age_band, topic, target_size=POOL_TARGET_SIZE):
+    """Generate questions until the key holds target_size items. Returns how many were added."""
+    missing = target_size - get_pool_size(difficulty, age_band, topic)
+    if missing <= 0:
+        return 0
+
+    age = AGE_BAND_PROMPT_AGES.get(age_band, 10)
+    questions = fan_out_batches(
+        lambda count: generate_ai_questions_batch(
+            difficulty=difficulty,
+            age=age,
+            topic=topic,
+            count=count,
+            # Refills exist to add new questions, not replay cached ones
+            fresh=True
+        ),
+        missing,
+        timeout=None
+    )
+
+    # Failed generations are left for the next refill pass; questions already
+    # pooled for the key (or repeated in the batch) are skipped
+    pooled = set(
+        AIQuestionPoolItem.objects.filter(difficulty=difficulty, age_band=age_band, topic=topic)
+        .values_list('content_hash', flat=True)
+    )
+    new_items = []
+    for question in questions:
+        if question is None:
+            continue
+        question_hash = content_hash(question['question'])
+        if question_hash in pooled:
+            continue
+        pooled.add(question_hash)
+        new_items.append(AIQuestionPoolItem(
+            difficulty=difficulty,
+            age_band=age_band,
+            topic=topic,
+            question_text=question['question'],
+            options=question['options'],
+            correct_option=question['correct'],
+            explanation=question.get('explanation', ''),
+            content_hash=question_hash
+        ))
+
+    AIQuestionPoolItem.objects.bulk_create(new_items)
+    logger.info(f"Added {len(new_items)} questions to pool {difficulty}/{age_band}/{topic}")
+
+    # Keep a permanent copy in the question bank
+    categories = QuizCategory.objects.filter(name=topic)
+    category = categories.filter(difficulty=difficulty).first() or categories.first()
+    if category:
+        for question in questions:
+            if question is not None:
+                harvest_quiz_question(category, question, question.get('model', ''), age_band)
+        flush_harvest()
+    return len(new_items)
+
+
+def refill_question_pool(low_water_mark=POOL_LOW_WATER_MARK, target_size=POOL_TARGET_SIZE):
+    """Top up every pool key that is below its low-water mark. Returns how many questions were added."""
+    sizes = {
+        (row['difficulty'], row['age_band'], row['topic']): row['total']
+        for row in AIQuestionPoolItem.objects
+        .values('difficulty', 'age_band', 'topic')
+        .annotate(total=Count('id'))
+        .order_by()
+    }
+
+    added = 0
+    for key in get_pool_keys():
+        if sizes.get(key, 0) < low_water_mark:
+            added += refill_pool_key(*key, target_size=target_size)
+    return added
+
+
+def request_pool_refill(difficulty, age_band, topic):
+    """Refill a key in a background thread; at most one refill per key at a time"""
+    if not POOL_INLINE_REFILL:
+        return
+
+    key = (difficulty, age_band, topic)
+    with _refilling_lock:
+        if key in _refilling_keys:
+            return
+        _refilling_keys.add(key)
+
+    threading.Thread(target=_refill_in_background, args=key, daemon=True).start()
+
+
+def _refill_in_background(difficulty, age_band, topic):
+    current_endpoint.set('pool_refill')
+    # Runs on a request's behalf, but nobody waits on it: below interactive calls in the quota
+    call_priority.set(PREFETCH)
+    try:
+        refill_pool_key(difficulty, age_band, topic)
+    except Exception:
+        logger.exception(f"Background pool refill failed for {difficulty}/{age_band}/{topic}")
+    finally:
+        connection.close()
+        with _refilling_lock:
+            _refilling_keys.discard((difficulty, age_band, topic))
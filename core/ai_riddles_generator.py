@@ -1,24 +1,19 @@
-from groq import Groq
-from django.conf import settings
 import json
 import random
 import logging
-import os
-from dotenv import load_dotenv
-
-# Load environment variables
-load_dotenv()
+from .ai_batch import acollect_batch, collect_batch, parse_batch_items
+from .llm_client import chat_completion, is_configured
+from .llm_hedging import ahedged_completion, hedged_completion
+from .llm_router import choose_model
+from .llm_metrics import record_fallback, record_validation_failure
+from .single_flight import acoalesce, coalesce
 
 logger = logging.getLogger(__name__)
 
-# Get API key safely
-api_key = os.getenv('GROQ_API_KEY') or getattr(settings, 'GROQ_API_KEY', None)
+MODEL_TIER = 'fast'  # LLM_MODEL_TIERS entry the calls are routed within
+BATCH_TOKENS_PER_ITEM = 200
 
-if api_key:
-    client = Groq(api_key=api_key)
-else:
-    logger.warning("GROQ_API_KEY not found - using fallback riddles only")
-    client = None
+SYSTEM_PROMPT = "You are an educational AI that creates riddles for kids. Always reply in VALID JSON with question, answer, distractors[], and explanation."
 
 
 def generate_ai_riddle(difficulty, age, topic, riddle_number=1):
@@ -26,18 +21,13 @@ def generate_ai_riddle(difficulty, age, topic, riddle_number=1):
     Generate an AI riddle INCLUDING SMART DISTRACTORS.
     """
 
-    if not client:
+    if not is_configured():
         logger.error("Groq client not initialized - using fallback riddles")
+        record_fallback("riddle", "static", "not_configured")
         return create_unique_fallback_riddle(1, riddle_number - 1, difficulty, topic)
 
-    available_models = [
-        "llama-3.1-8b-instant",
-        "llama-3.3-70b-versatile",
-        "mixtral-8x7b-32768",
-        "gemma2-9b-it"
-    ]
-
-    model = available_models[0]
+    # Fastest healthy model of the tier (see core.llm_router)
+    model = choose_model(MODEL_TIER)
 
     # Topic types
     question_types = {
@@ -101,37 +91,33 @@ Return JSON only:
     try:
         logger.info(f"Generating AI riddle {riddle_number} for {age}y/o, {difficulty}, {topic}")
 
-        response = client.chat.completions.create(
+        result_text = chat_completion(
             model=model,
             messages=[
                 {
                     "role": "system",
-                    "content": "You are an educational AI that creates riddles for kids. Always reply in VALID JSON with question, answer, distractors[], and explanation."
+                    "content": SYSTEM_PROMPT
                 },
                 {"role": "user", "content": prompt}
             ],
             temperature=0.8,
             max_tokens=500,
-            response_format={"type": "json_object"}
+            response_format={"type": "json_object"},
+            cache_params={'kind': 'riddle', 'difficulty': difficulty, 'age': age, 'topic': topic, 'question_type': question_type}
         )
-
-        result_text = response.choices[0].message.content
         logger.info(f"AI response received for riddle {riddle_number}")
 
-        result = json.loads(result_text)
-
-        # REQUIRED FIELDS INCLUDING DISTRACTORS
-        required_keys = ['question', 'answer', 'explanation', 'distractors']
-
-        if all(key in result for key in required_keys):
-            if isinstance(result["distractors"], list) and len(result["distractors"]) == 3:
-                logger.info(f"AI riddle generated successfully with distractors")
-                return result
-
-        raise ValueError("AI response missing required fields or distractors")
+        try:
+            result = validate_ai_riddle(json.loads(result_text))
+        except ValueError as e:
+            record_validation_failure("riddle", e)
+            raise
+        logger.info(f"AI riddle generated successfully with distractors")
+        return result
 
     except Exception as e:
         logger.error(f"AI riddle generation failed: {e}")
+        record_fallback("riddle", "static", type(e).__name__)
 
         difficulty_to_level = {'easy': 1, 'medium': 2, 'hard': 3}
         level_number = difficulty_to_level.get(difficulty, 1)
@@ -149,6 +135,105 @@ Return JSON only:
         return fallback
 
 
+def validate_ai_riddle(result):
+    """Check one AI riddle and return it, raising ValueError when it is unusable"""
+    # REQUIRED FIELDS INCLUDING DISTRACTORS
+    required_keys = ['question', 'answer', 'explanation', 'distractors']
+
+    if not isinstance(result, dict) or not all(key in result for key in required_keys):
+        raise ValueError("AI response missing required fields or distractors")
+
+    # Options and near-duplicate checks expect text, so numbers or nulls must not get through
+    for key in ('question', 'answer', 'explanation'):
+        if not isinstance(result[key], str) or not result[key].strip():
+            raise ValueError(f"AI riddle {key} is not text")
+    distractors = result['distractors']
+    if not isinstance(distractors, list) or len(distractors) != 3:
+        raise ValueError("AI riddle needs exactly 3 distractors")
+    if not all(isinstance(distractor, str) and distractor.strip() for distractor in distractors):
+        raise ValueError("AI riddle distractors are not text")
+    options = {option.strip().lower() for option in [result['answer']] + distractors}
+    if len(options) != 4:
+        raise ValueError("AI riddle answer and distractors are not distinct")
+    return result
+
+
+def _riddles_batch_request(difficulty, age, topic, n, fresh=False):
+    """chat_completion() arguments for a batch of n riddles"""
+    prompt = f"""
+Create {n} different {difficulty} educational riddles about {topic} for a {age}-year-old.
+Be educational, simple, and engaging. Every riddle needs 1 correct answer AND
+3 plausible but wrong distractor answers. Do not repeat a riddle.
+
+Respond ONLY in JSON with exactly {n} items in "riddles":
+{{
+    "riddles": [
+        {{
+            "question": "riddle text",
+            "answer": "correct answer",
+            "distractors": ["wrong option 1", "wrong option 2", "wrong option 3"],
+            "explanation": "short explanation"
+        }}
+    ]
+}}
+"""
+    return {
+        'model': choose_model(MODEL_TIER),
+        'messages': [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ],
+        'temperature': 0.8,
+        'max_tokens': BATCH_TOKENS_PER_ITEM * n + 100,
+        'response_format': {"type": "json_object"},
+        'cache_params': {'kind': 'riddle_batch', 'difficulty': difficulty, 'age': age, 'topic': topic, 'count': n},
+        'fresh': fresh,
+    }
+
+
+def generate_ai_riddles_batch(difficulty, age, topic, count, fresh=False):
+    """
+    Generate `count` AI riddles (with distractors) in one chat completion per round.
+    Identical requests in flight share the completion (see core.single_flight).
+    Returns a list of length count; slots that could not be filled are None.
+    fresh=True skips the response cache lookup, for callers after new content.
+    """
+    if not is_configured():
+        logger.error("Groq client not initialized - no AI riddles in batch")
+        return [None] * count
+
+    def request_items(n):
+        logger.info(f"Generating batch of {n} AI riddles for {age}y/o, {difficulty}, {topic}")
+        request = _riddles_batch_request(difficulty, age, topic, n, fresh)
+        content, model = hedged_completion(request, MODEL_TIER)
+        return parse_batch_items(content, 'riddles', model=model)
+
+    return coalesce(
+        ('riddle', difficulty, age, topic, fresh),
+        count,
+        lambda n: collect_batch(request_items, validate_ai_riddle, n, label="riddle")
+    )
+
+
+async def agenerate_ai_riddles_batch(difficulty, age, topic, count, fresh=False):
+    """generate_ai_riddles_batch for the async level views"""
+    if not is_configured():
+        logger.error("Groq client not initialized - no AI riddles in batch")
+        return [None] * count
+
+    async def request_items(n):
+        logger.info(f"Generating batch of {n} AI riddles for {age}y/o, {difficulty}, {topic}")
+        request = _riddles_batch_request(difficulty, age, topic, n, fresh)
+        content, model = await ahedged_completion(request, MODEL_TIER)
+        return parse_batch_items(content, 'riddles', model=model)
+
+    return await acoalesce(
+        ('riddle', difficulty, age, topic, fresh),
+        count,
+        lambda n: acollect_batch(request_items, validate_ai_riddle, n, label="riddle")
+    )
+
+
 def create_unique_fallback_riddle(level_number, index, difficulty, topic):
     """
     Simple fallback riddles (no change).
@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        # Connect the signal receivers that keep the riddle distractor index,
+        # category and level catalogs, random samplers and riddle levels current
+        from . import category_catalog, distractor_index, level_catalog, riddle_level_sync, sampling  # noqa: F401
@@ -1,6 +1,7 @@
 """
 Middleware to prevent caching of authenticated pages and prevent back button access after logout
 """
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
 from django.utils.cache import add_never_cache_headers
 
 
@@ -9,14 +10,30 @@ class NoCacheMiddleware:
     Middleware to prevent caching of authenticated pages
     This prevents users from accessing cached pages after logout
     """
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
 
     def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
         response = self.get_response(request)
-        
+        return self._add_no_cache_headers(response, request.user.is_authenticated)
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        # request.user may still need loading from the database
+        is_authenticated = await sync_to_async(lambda: request.user.is_authenticated)()
+        return self._add_no_cache_headers(response, is_authenticated)
+
+    def _add_no_cache_headers(self, response, is_authenticated):
         # Add no-cache headers for authenticated pages
-        if request.user.is_authenticated:
+        if is_authenticated:
             add_never_cache_headers(response)
             # Additional cache control headers
             response['Cache-Control'] = 'no-cache, no-store, must-revalidate, max-age=0'
@@ -0,0 +1,134 @@
+"""
+Cached catalogs of the quiz and riddle categories for the category endpoints.
+
+The category endpoints used to count each category's active questions with
+one query per category, on every request. A catalog is the list of active
+categories of one game with their active question counts, read with a single
+annotated query and kept in process. Each request only filters it by the
+difficulties allowed for the learner's age.
+
+Every response carries an ETag, a digest of the categories it lists, and
+answers a matching If-None-Match with 304 Not Modified, so clients that
+revalidate download the list only when it changed.
+
+Catalogs are versioned like core.distractor_index: saving or deleting a
+category or question (signals, connected in CoreConfig.ready()) and bulk
+writes, which call invalidate_category_catalog() themselves, bump the
+version in the Django cache and the catalog is rebuilt on next use. With a
+per-process cache other workers pick up the change when their copy is
+CATEGORY_CATALOG_MAX_AGE_SECONDS old.
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.http import JsonResponse
+from django.utils.cache import get_conditional_response
+from .game_utils import get_allowed_difficulties
+from .models import QuizCategory, QuizQuestion, RiddleCategory, RiddleQuestion
+
+logger = logging.getLogger(__name__)
+
+CATEGORY_CATALOG_MAX_AGE_SECONDS = getattr(settings, 'CATEGORY_CATALOG_MAX_AGE_SECONDS', 300)
+
+# Catalog name -> category model and the name of its question count in responses
+CATALOGS = {
+    'quiz': (QuizCategory, 'question_count'),
+    'riddle': (RiddleCategory, 'riddle_count'),
+}
+_SOURCES = {
+    QuizCategory: 'quiz',
+    QuizQuestion: 'quiz',
+    RiddleCategory: 'riddle',
+    RiddleQuestion: 'riddle',
+}
+
+_lock = threading.Lock()
+_catalogs = {}  # name -> {'version', 'built_at', 'categories': [category dicts]}
+
+
+def _version_key(name):
+    return f'category_catalog_version_{name}'
+
+
+def invalidate_category_catalog(name):
+    """Mark every process's 'quiz' or 'riddle' catalog stale, after categories or questions changed"""
+    try:
+        cache.incr(_version_key(name))
+    except ValueError:
+        cache.set(_version_key(name), 1, None)
+
+
+@receiver(post_save, sender=QuizCategory)
+@receiver(post_delete, sender=QuizCategory)
+@receiver(post_save, sender=QuizQuestion)
+@receiver(post_delete, sender=QuizQuestion)
+@receiver(post_save, sender=RiddleCategory)
+@receiver(post_delete, sender=RiddleCategory)
+@receiver(post_save, sender=RiddleQuestion)
+@receiver(post_delete, sender=RiddleQuestion)
+def _content_changed(sender, **kwargs):
+    invalidate_category_catalog(_SOURCES[sender])
+
+
+def _build(name, version):
+    model, count_name = CATALOGS[name]
+    rows = model.objects.filter(is_active=True).annotate(
+        active_questions=Count('questions', filter=Q(questions__is_active=True))
+    )
+    categories = [
+        {
+            'id': category.id,
+            'name': category.name,
+            'difficulty': category.difficulty,
+            'color': category.color,
+            'icon': category.icon,
+            'description': category.description,
+            count_name: category.active_questions,
+        }
+        for category in rows
+    ]
+    logger.debug(f"Built {name} category catalog v{version}: {len(categories)} categories")
+    return {'version': version, 'built_at': time.monotonic(), 'categories': categories}
+
+
+def get_category_catalog(name):
+    """The active categories of the 'quiz' or 'riddle' game, with their active question counts"""
+    version = cache.get(_version_key(name), 0)
+    catalog = _catalogs.get(name)
+    if catalog is not None and catalog['version'] == version and time.monotonic() - catalog['built_at'] < CATEGORY_CATALOG_MAX_AGE_SECONDS:
+        return catalog['categories']
+    with _lock:
+        if _catalogs.get(name) is catalog:
+            _catalogs[name] = _build(name, version)
+        return _catalogs[name]['categories']
+
+
+def category_catalog_response(request, name):
+    """
+    JSON list of the catalog's categories the requesting learner's age
+    allows, with an ETag; 304 when the client's If-None-Match still matches
+    """
+    user = request.user if request.user.is_authenticated else None
+    allowed_difficulties = get_allowed_difficulties(user)
+    categories = [
+        category for category in get_category_catalog(name)
+        if category['difficulty'] and (allowed_difficulties is None or category['difficulty'] in allowed_difficulties)
+    ]
+    body = json.dumps({'categories': categories}, sort_keys=True).encode('utf-8')
+    etag = f'"{hashlib.blake2b(body, digest_size=12).hexdigest()}"'
+
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = JsonResponse({'categories': categories})
+    response['ETag'] = etag
+    # Cached copies are fine as long as they are revalidated
+    response['Cache-Control'] = 'private, no-cache'
+    response['Vary'] = 'Cookie'
+    return response
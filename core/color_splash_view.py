@@ -5,7 +5,8 @@ from django.views.decorators.http import require_http_methods
 import json
 import random
 from .models import ColorSplashLevel, FruitColor, ColorPalette, ColorSplashSession, UserColorProgress
-from .game_utils import get_age_from_birthdate, get_difficulty_by_age
+from .game_utils import get_learner
+from .level_catalog import get_level
 
 def color_splash_game(request):
     """Render the Color Splash game page"""
@@ -17,13 +18,10 @@ def get_color_level_data(request):
     level = int(request.GET.get('level', 1))
     
     # Get user age for difficulty adjustment
-    user = request.user if request.user.is_authenticated else None
-    user_age = None
-    if user and hasattr(user, 'profile') and user.profile.date_of_birth:
-        user_age = get_age_from_birthdate(user.profile.date_of_birth)
+    user_age = get_learner(request).age
     
     try:
-        level_config = ColorSplashLevel.objects.get(level_number=level)
+        level_config = get_level('color_splash', level)
         required_matches = level_config.required_matches
         grid_size = level_config.grid_size
         
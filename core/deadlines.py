@@ -0,0 +1,129 @@
+"""
+End-to-end deadline budget for level requests.
+
+Level views run inside level_budget() (decorated with with_level_budget): a
+request gets LEVEL_DEADLINE_SECONDS in total, and the budget travels in a
+context variable, so it reaches every generation call the level makes,
+including the ones level_assembly runs in worker threads and the ones a
+streamed level makes after the view returned.
+
+- llm_client caps each completion's timeout at the time left and raises
+  DeadlineExceeded instead of sending a call once it is spent. A call cut
+  short by the deadline is not held against the model's circuit breaker.
+- ai_batch stops re-requesting invalid items, level_assembly stops waiting
+  on batches and single_flight stops waiting on another request's flight
+  when the deadline passes.
+- The level views stop retrying and fill the remaining slots from the
+  database (or generated math problems).
+
+Views count the time they wait on AI generations with spending('ai') and
+their database and fallback work with spending('db'); budget_report() says
+how the budget was used and is returned with the level.
+"""
+import asyncio
+import contextvars
+import functools
+import time
+from contextlib import contextmanager
+from django.conf import settings
+
+LEVEL_DEADLINE_SECONDS = getattr(settings, 'LEVEL_DEADLINE_SECONDS', 2.5)
+
+_current_budget = contextvars.ContextVar('level_budget', default=None)
+
+
+class DeadlineExceeded(Exception):
+    """Raised instead of starting AI work once the level's deadline has passed"""
+
+
+@contextmanager
+def level_budget(seconds=LEVEL_DEADLINE_SECONDS):
+    """Run the block (and everything it hands work to) against a deadline seconds from now"""
+    started = time.monotonic()
+    budget = {
+        'started': started,
+        'deadline': started + seconds,
+        'seconds': seconds,
+        'ai_ms': 0.0,
+        'db_ms': 0.0,
+    }
+    token = _current_budget.set(budget)
+    try:
+        yield budget
+    finally:
+        _current_budget.reset(token)
+
+
+def with_level_budget(view):
+    """Run a (sync or async) level view inside level_budget()"""
+    if asyncio.iscoroutinefunction(view):
+        @functools.wraps(view)
+        async def wrapper(*args, **kwargs):
+            with level_budget():
+                return await view(*args, **kwargs)
+    else:
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            with level_budget():
+                return view(*args, **kwargs)
+    return wrapper
+
+
+def remaining():
+    """Seconds left before the current deadline (never negative), None outside a level budget"""
+    budget = _current_budget.get()
+    if budget is None:
+        return None
+    return max(0.0, budget['deadline'] - time.monotonic())
+
+
+def deadline_passed():
+    """True when the current level's deadline has passed"""
+    return remaining() == 0
+
+
+def clamp_timeout(timeout):
+    """timeout (seconds or None for none) cut down to the time left before the deadline"""
+    left = remaining()
+    if left is None:
+        return timeout
+    return left if timeout is None else min(timeout, left)
+
+
+@contextmanager
+def spending(kind):
+    """Count the block's wall-clock time as `kind` ('ai' or 'db') work of the current budget"""
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        budget = _current_budget.get()
+        if budget is not None:
+            budget[f'{kind}_ms'] += (time.monotonic() - started) * 1000
+
+
+def timed(iterable, kind):
+    """Yield from iterable, counting the time spent waiting on each item as `kind` work"""
+    iterator = iter(iterable)
+    while True:
+        with spending(kind):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+def budget_report():
+    """How the current level's budget was used, for its response; None outside a level budget"""
+    budget = _current_budget.get()
+    if budget is None:
+        return None
+    elapsed = time.monotonic() - budget['started']
+    return {
+        'deadline_ms': round(budget['seconds'] * 1000),
+        'ai_ms': round(budget['ai_ms']),
+        'db_ms': round(budget['db_ms']),
+        'elapsed_ms': round(elapsed * 1000),
+        'exceeded': elapsed > budget['seconds'],
+    }
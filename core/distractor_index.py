@@ -0,0 +1,126 @@
+"""
+In-process index of riddle answers to draw multiple-choice distractors from.
+
+The answers of every active RiddleQuestion are read once and bucketed by
+category and answer shape ('a ...' phrases, other phrases, single words,
+numbers), each bucket a list of distinct answers. sample_distractors() draws
+k distinct answers from the buckets with random.sample over index ranges, so
+a riddle's options cost O(k), not a copy and shuffle of every answer. It
+prefers answers of the riddle's category and shape, then of its shape in any
+category, then any answer, so distractors read like the correct answer.
+
+The index is versioned. Saving or deleting a RiddleQuestion (signals,
+connected in CoreConfig.ready()) and bulk inserts, which send no signals and
+call invalidate_distractor_index() themselves, bump the version in the
+Django cache; the index is rebuilt on its next use after the version
+changes. With a per-process cache other workers pick up the change when
+their copy is DISTRACTOR_INDEX_MAX_AGE_SECONDS old.
+"""
+import logging
+import random
+import re
+import threading
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .models import RiddleQuestion
+
+logger = logging.getLogger(__name__)
+
+DISTRACTOR_INDEX_MAX_AGE_SECONDS = getattr(settings, 'DISTRACTOR_INDEX_MAX_AGE_SECONDS', 300)
+
+VERSION_CACHE_KEY = 'riddle_distractor_index_version'
+
+_lock = threading.Lock()
+_index = None  # {'version', 'built_at', 'buckets': {(category_id, shape): [answers]}}
+
+
+def answer_shape(answer):
+    """Rough form of an answer: 'article' ('A piano', 'The moon'), 'phrase', 'word' or 'number'"""
+    words = answer.split()
+    if not words:
+        return 'word'
+    if re.fullmatch(r'-?\d+([.,]\d+)?', answer.strip()):
+        return 'number'
+    if len(words) > 1 and words[0].lower() in ('a', 'an', 'the', 'your'):
+        return 'article'
+    return 'phrase' if len(words) > 1 else 'word'
+
+
+def invalidate_distractor_index():
+    """Mark every process's index stale, after riddles were added, changed or removed"""
+    try:
+        cache.incr(VERSION_CACHE_KEY)
+    except ValueError:
+        cache.set(VERSION_CACHE_KEY, 1, None)
+
+
+@receiver(post_save, sender=RiddleQuestion)
+@receiver(post_delete, sender=RiddleQuestion)
+def _riddle_changed(sender, **kwargs):
+    invalidate_distractor_index()
+
+
+def _build(version):
+    buckets = {}
+    seen = set()
+    for category_id, answer in RiddleQuestion.objects.filter(is_active=True).values_list('category_id', 'answer'):
+        answer = (answer or '').strip()
+        if not answer:
+            continue
+        shape = answer_shape(answer)
+        normalized = answer.lower()
+        # Each answer once per bucket
+        for key in ((category_id, shape), (None, shape), (None, None)):
+            if (key, normalized) not in seen:
+                seen.add((key, normalized))
+                buckets.setdefault(key, []).append(answer)
+    logger.debug(f"Built riddle distractor index v{version}: {len(buckets.get((None, None), []))} distinct answers")
+    return {'version': version, 'built_at': time.monotonic(), 'buckets': buckets}
+
+
+def _current_index():
+    global _index
+    version = cache.get(VERSION_CACHE_KEY, 0)
+    index = _index
+    if index is not None and index['version'] == version and time.monotonic() - index['built_at'] < DISTRACTOR_INDEX_MAX_AGE_SECONDS:
+        return index
+    with _lock:
+        if _index is index:
+            _index = _build(version)
+        return _index
+
+
+def _draw(bucket, k, excluded):
+    """Up to k answers of bucket not in excluded (lowercased); adds them to excluded"""
+    # Each excluded answer occurs at most once in a bucket, so drawing len(excluded) extra covers them
+    picks = []
+    for position in random.sample(range(len(bucket)), min(len(bucket), k + len(excluded))):
+        answer = bucket[position]
+        if answer.lower() not in excluded:
+            excluded.add(answer.lower())
+            picks.append(answer)
+            if len(picks) == k:
+                break
+    return picks
+
+
+def sample_distractors(correct_answer, k, category_id=None, exclude=()):
+    """
+    k distinct riddle answers (fewer when the database has too few) other
+    than correct_answer and `exclude`, preferring answers of the same
+    category and shape as correct_answer.
+    """
+    if k <= 0:
+        return []
+    buckets = _current_index()['buckets']
+    shape = answer_shape(correct_answer or '')
+    excluded = {answer.strip().lower() for answer in (correct_answer, *exclude) if answer}
+    picks = []
+    for key in dict.fromkeys(((category_id, shape), (None, shape), (None, None))):
+        picks += _draw(buckets.get(key, []), k - len(picks), excluded)
+        if len(picks) == k:
+            break
+    return picks
@@ -1,7 +1,13 @@
 """
 Utility functions for age-based game filtering
+
+A request's LearnerContext (request.learner, set by
+core.middleware.LearnerContextMiddleware; get_learner() builds one for
+requests that skipped it) holds the learner's profile, age, difficulty, age
+band and allowed difficulties, each computed at most once per request.
 """
 from datetime import date
+from functools import cached_property
 
 def get_age_from_birthdate(birthdate):
     """Calculate age from date of birth"""
@@ -42,34 +48,47 @@ def get_age_range_for_difficulty(difficulty):
     }
     return difficulty_map.get(difficulty, None)
 
-def filter_by_age_appropriate(user, queryset, difficulty_field='difficulty'):
+def get_age_band(age):
     """
-    Filter a queryset by user's age-appropriate difficulty level
-    Args:
-        user: User instance
-        queryset: Django queryset to filter
-        difficulty_field: Name of the difficulty field in the model
-    Returns:
-        Filtered queryset
+    Map user age to the age band used to key pre-generated content
+    Returns: '3-6', '7-9', '10-12' or '13+'
     """
-    if not user or not hasattr(user, 'profile'):
-        # If no user or profile, return all active items
-        return queryset.filter(**{f'{difficulty_field}__isnull': False})
+    if age is None:
+        return '10-12'  # Matches the default age of 10 used for AI generation
     
-    profile = user.profile
-    age = get_age_from_birthdate(profile.date_of_birth)
+    if age <= 6:
+        return '3-6'
+    elif age <= 9:
+        return '7-9'
+    elif age <= 12:
+        return '10-12'
+    else:
+        return '13+'
+
+def get_allowed_difficulties(user):
+    """
+    Difficulties appropriate for a user's age: their age's difficulty and
+    the easier ones, or None when every difficulty is allowed (no user,
+    profile or age)
+    """
+    if isinstance(user, LearnerContext):
+        return user.allowed_difficulties
     
+    if not user or not hasattr(user, 'profile'):
+        return None
+    
+    return _allowed_difficulties_for_age(get_age_from_birthdate(user.profile.date_of_birth))
+
+def _allowed_difficulties_for_age(age):
     if age is None:
-        # If no age, return all difficulties
-        return queryset.filter(**{f'{difficulty_field}__isnull': False})
+        return None
     
     difficulty = get_difficulty_by_age(age)
     
     if difficulty is None:
-        # If difficulty can't be determined, return all
-        return queryset.filter(**{f'{difficulty_field}__isnull': False})
+        return None
     
-    # Filter by difficulty level and easier levels
+    # Difficulty level and easier levels
     difficulty_ordering = ['easy', 'medium', 'hard', 'expert']
     allowed_difficulties = []
     
@@ -78,5 +97,63 @@ def filter_by_age_appropriate(user, queryset, difficulty_field='difficulty'):
         if diff == difficulty:
             break
     
+    return allowed_difficulties
+
+def filter_by_age_appropriate(user, queryset, difficulty_field='difficulty'):
+    """
+    Filter a queryset by user's age-appropriate difficulty level
+    Args:
+        user: User instance or LearnerContext
+        queryset: Django queryset to filter
+        difficulty_field: Name of the difficulty field in the model
+    Returns:
+        Filtered queryset
+    """
+    allowed_difficulties = get_allowed_difficulties(user)
+    if allowed_difficulties is None:
+        # No user, profile or age: return all items
+        return queryset.filter(**{f'{difficulty_field}__isnull': False})
+    
     return queryset.filter(**{f'{difficulty_field}__in': allowed_difficulties})
 
+class LearnerContext:
+    """The requesting learner's age details, computed on first use and kept for the request"""
+
+    def __init__(self, request):
+        self.request = request
+
+    @cached_property
+    def user(self):
+        user = self.request.user
+        return user if user.is_authenticated else None
+
+    @cached_property
+    def profile(self):
+        if self.user is None or not hasattr(self.user, 'profile'):
+            return None
+        return self.user.profile
+
+    @cached_property
+    def age(self):
+        """Age in years, or None when unknown"""
+        return get_age_from_birthdate(self.profile.date_of_birth) if self.profile else None
+
+    @cached_property
+    def difficulty(self):
+        return get_difficulty_by_age(self.age)
+
+    @cached_property
+    def age_band(self):
+        return get_age_band(self.age)
+
+    @cached_property
+    def allowed_difficulties(self):
+        """See get_allowed_difficulties"""
+        return _allowed_difficulties_for_age(self.age)
+
+def get_learner(request):
+    """The request's LearnerContext, created if no middleware set one"""
+    learner = getattr(request, 'learner', None)
+    if learner is None:
+        learner = request.learner = LearnerContext(request)
+    return learner
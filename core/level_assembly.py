@@ -0,0 +1,178 @@
+"""
+Shared executor for assembling game levels.
+
+Level views hand every per-item AI generation to fan_out() at once instead of
+calling the generator slot by slot, so a level costs roughly the slowest call
+rather than the sum of all of them. Slots that fail or time out come back as
+None and the view substitutes database or fallback items for just those.
+The timeout is cut to the level's deadline when it has one (core.deadlines).
+The iter_* variants yield slots as they complete, for the streaming views;
+afan_out_batches does the same fan-out on the event loop for the async views.
+"""
+import asyncio
+import contextvars
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from django.conf import settings
+from .ai_batch import LLM_BATCH_SIZE
+from .deadlines import clamp_timeout
+
+logger = logging.getLogger(__name__)
+
+LEVEL_ASSEMBLY_MAX_WORKERS = getattr(settings, 'LEVEL_ASSEMBLY_MAX_WORKERS', 16)
+LEVEL_ASSEMBLY_CONCURRENCY = getattr(settings, 'LEVEL_ASSEMBLY_CONCURRENCY', 5)
+LEVEL_ASSEMBLY_TIMEOUT = getattr(settings, 'LEVEL_ASSEMBLY_TIMEOUT', 20)
+# Streaming levels with nothing to send before the AI answers request this
+# many items on their own, so the first one arrives without waiting on a full batch
+LEVEL_STREAM_FIRST_BATCH_SIZE = getattr(settings, 'LEVEL_STREAM_FIRST_BATCH_SIZE', 1)
+
+# One pool per process, shared by every level request
+_executor = ThreadPoolExecutor(
+    max_workers=LEVEL_ASSEMBLY_MAX_WORKERS,
+    thread_name_prefix='level-assembly'
+)
+
+
+def fan_out(generate, count, timeout=LEVEL_ASSEMBLY_TIMEOUT, max_concurrency=LEVEL_ASSEMBLY_CONCURRENCY):
+    """
+    Run generate(index) for every slot in range(count) concurrently.
+    At most max_concurrency calls are in flight for this level; results are
+    collected as they complete. Returns one entry per slot, None for slots
+    that raised or did not finish within timeout seconds (None = no limit).
+    Each call runs in a copy of the caller's context (e.g. the endpoint
+    llm_metrics attributes calls to).
+    """
+    results = [None] * count
+    for index, result in iter_fan_out(generate, count, timeout=timeout, max_concurrency=max_concurrency):
+        results[index] = result
+    return results
+
+
+def iter_fan_out(generate, count, timeout=LEVEL_ASSEMBLY_TIMEOUT, max_concurrency=LEVEL_ASSEMBLY_CONCURRENCY):
+    """
+    Like fan_out, but yields (index, result) for each slot as soon as it
+    completes, so a streaming view can send items while the rest are still
+    being generated. The first calls are submitted before this returns; a
+    slot that raised yields None, and slots unfinished at the timeout yield
+    None at the end.
+    """
+    timeout = clamp_timeout(timeout)
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    pending = {}
+    next_index = 0
+
+    def submit_available():
+        nonlocal next_index
+        while next_index < count and len(pending) < max_concurrency:
+            context = contextvars.copy_context()
+            pending[_executor.submit(context.run, generate, next_index)] = next_index
+            next_index += 1
+
+    def collect():
+        nonlocal next_index
+        while pending:
+            remaining = deadline - time.monotonic() if deadline is not None else None
+            if remaining is not None and remaining <= 0:
+                break
+
+            done, _ = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            if not done:
+                break
+
+            for future in done:
+                index = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logger.debug("Level slot %s failed: %s", index, e)
+                    result = None
+                yield index, result
+            submit_available()
+
+        if pending or next_index < count:
+            logger.warning("Level assembly timed out with %s of %s slots unfinished", len(pending) + count - next_index, count)
+            for future, index in sorted(pending.items(), key=lambda item: item[1]):
+                future.cancel()
+                yield index, None
+            pending.clear()
+            for index in range(next_index, count):
+                yield index, None
+            next_index = count
+
+    submit_available()
+    return collect()
+
+
+def fan_out_batches(generate_batch, count, batch_size=LLM_BATCH_SIZE, timeout=LEVEL_ASSEMBLY_TIMEOUT):
+    """
+    Split count slots into chunks of batch_size and run generate_batch(n) for
+    every chunk concurrently. generate_batch returns a list of n items (None
+    for empty slots). Returns one entry per slot, None where a chunk failed.
+    """
+    sizes = [min(batch_size, count - start) for start in range(0, count, batch_size)]
+    chunks = fan_out(lambda index: generate_batch(sizes[index]), len(sizes), timeout=timeout)
+
+    results = []
+    for size, chunk in zip(sizes, chunks):
+        chunk = list(chunk or [])[:size]
+        results.extend(chunk + [None] * (size - len(chunk)))
+    return results
+
+
+def iter_fan_out_batches(generate_batch, count, batch_size=LLM_BATCH_SIZE, timeout=LEVEL_ASSEMBLY_TIMEOUT, first_batch_size=None):
+    """
+    Like fan_out_batches, but yields (slot, item) for the slots of each chunk
+    as soon as that chunk completes. Slots of a failed chunk yield None.
+    first_batch_size splits a smaller first chunk off to answer sooner.
+    """
+    first = min(first_batch_size or batch_size, count)
+    sizes = ([first] if first else []) + [min(batch_size, count - start) for start in range(first, count, batch_size)]
+    starts = [sum(sizes[:index]) for index in range(len(sizes))]
+    chunks = iter_fan_out(lambda index: generate_batch(sizes[index]), len(sizes), timeout=timeout)
+
+    def slots():
+        for index, chunk in chunks:
+            chunk = list(chunk or [])[:sizes[index]]
+            chunk += [None] * (sizes[index] - len(chunk))
+            for offset, item in enumerate(chunk):
+                yield starts[index] + offset, item
+
+    return slots()
+
+
+async def afan_out_batches(agenerate_batch, count, batch_size=LLM_BATCH_SIZE, timeout=LEVEL_ASSEMBLY_TIMEOUT, max_concurrency=LEVEL_ASSEMBLY_CONCURRENCY):
+    """
+    fan_out_batches for the async level views: agenerate_batch(n) is a
+    coroutine function and the chunks run as tasks on the caller's event
+    loop instead of executor threads. Returns one entry per slot, None where
+    a chunk failed or was still running after timeout seconds.
+    """
+    sizes = [min(batch_size, count - start) for start in range(0, count, batch_size)]
+    if not sizes:
+        return []
+    timeout = clamp_timeout(timeout)
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def run(size):
+        async with semaphore:
+            return await agenerate_batch(size)
+
+    tasks = [asyncio.ensure_future(run(size)) for size in sizes]
+    done, pending = await asyncio.wait(tasks, timeout=timeout)
+    if pending:
+        logger.warning("Level assembly timed out with %s of %s batches unfinished", len(pending), len(tasks))
+        for task in pending:
+            task.cancel()
+
+    results = []
+    for size, task in zip(sizes, tasks):
+        chunk = None
+        if task in done:
+            try:
+                chunk = task.result()
+            except Exception as e:
+                logger.debug("Level batch failed: %s", e)
+        chunk = list(chunk or [])[:size]
+        results.extend(chunk + [None] * (size - len(chunk)))
+    return results
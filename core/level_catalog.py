@@ -0,0 +1,267 @@
+"""
+In-process catalog of the level configurations of every game.
+
+Level rows (QuizLevel, RiddleLevel, MathGameLevel, SentenceBuilderLevel,
+WordSearchLevel, GameLevel for memory match and ColorSplashLevel) change only
+when an admin edits them, yet every level and next-level request read its row
+with one or two queries. The catalog reads each game's levels once, with
+their categories, into small immutable records with __slots__, keyed by level
+number; level views look them up without a query.
+
+Records carry the same attribute names as the model fields (plus pk, and a
+category record for quiz and riddle levels), so views read them like model
+instances. get_level() raises the model's DoesNotExist for unknown levels.
+
+The catalog is versioned like core.distractor_index: saving or deleting a
+level row or a quiz or riddle category (signals, connected in
+CoreConfig.ready()) and bulk writes, which call invalidate_level_catalog()
+themselves, bump the game's version in the Django cache and its levels are
+reread on next use. With a per-process cache other workers pick up the
+change when their copy is LEVEL_CATALOG_MAX_AGE_SECONDS old.
+"""
+import logging
+import threading
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .models import (
+    ColorSplashLevel, GameLevel, MathGameLevel, QuizCategory, QuizLevel, RiddleCategory, RiddleLevel,
+    SentenceBuilderLevel, WordSearchLevel,
+)
+
+logger = logging.getLogger(__name__)
+
+LEVEL_CATALOG_MAX_AGE_SECONDS = getattr(settings, 'LEVEL_CATALOG_MAX_AGE_SECONDS', 300)
+
+
+class _Record:
+    """Immutable record; subclasses name their fields in __slots__"""
+    __slots__ = ()
+
+    def __init__(self, **values):
+        for field in self.__slots__:
+            object.__setattr__(self, field, values[field])
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is read-only")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} is read-only")
+
+    def __repr__(self):
+        fields = ', '.join(f"{field}={getattr(self, field)!r}" for field in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+
+class CategoryRecord(_Record):
+    __slots__ = ('pk', 'id', 'name', 'difficulty', 'color', 'icon')
+    pk: int
+    id: int
+    name: str
+    difficulty: str
+    color: str
+    icon: str
+
+
+class CategoryLevelRecord(_Record):
+    """QuizLevel or RiddleLevel"""
+    __slots__ = ('pk', 'level_number', 'category_id', 'category', 'questions_required', 'time_limit', 'unlock_score')
+    pk: int
+    level_number: int
+    category_id: int
+    category: CategoryRecord
+    questions_required: int
+    time_limit: int
+    unlock_score: int
+
+
+class MathLevelRecord(_Record):
+    __slots__ = (
+        'pk', 'level_number', 'difficulty', 'operations', 'number_range_min', 'number_range_max',
+        'problems_required', 'time_limit', 'points_per_problem', 'unlock_score',
+    )
+    pk: int
+    level_number: int
+    difficulty: str
+    operations: tuple
+    number_range_min: int
+    number_range_max: int
+    problems_required: int
+    time_limit: int
+    points_per_problem: int
+    unlock_score: int
+
+
+class SentenceBuilderLevelRecord(_Record):
+    __slots__ = ('pk', 'level_number', 'difficulty', 'sentences_required', 'time_limit', 'points_per_sentence', 'unlock_score')
+    pk: int
+    level_number: int
+    difficulty: str
+    sentences_required: int
+    time_limit: int
+    points_per_sentence: int
+    unlock_score: int
+
+
+class WordSearchLevelRecord(_Record):
+    __slots__ = ('pk', 'level_number', 'difficulty', 'grid_size', 'word_count', 'time_limit', 'points_per_word', 'unlock_score')
+    pk: int
+    level_number: int
+    difficulty: str
+    grid_size: int
+    word_count: int
+    time_limit: int
+    points_per_word: int
+    unlock_score: int
+
+
+class MemoryLevelRecord(_Record):
+    """GameLevel (memory match)"""
+    __slots__ = ('pk', 'level_number', 'rows', 'columns', 'preview_time', 'required_pairs')
+    pk: int
+    level_number: int
+    rows: int
+    columns: int
+    preview_time: int
+    required_pairs: int
+
+
+class ColorSplashLevelRecord(_Record):
+    __slots__ = ('pk', 'level_number', 'grid_size', 'required_matches', 'time_limit')
+    pk: int
+    level_number: int
+    grid_size: int
+    required_matches: int
+    time_limit: int
+
+
+def _plain_record(record_class):
+    def build(level):
+        return record_class(**{
+            field: level.pk if field == 'pk' else getattr(level, field) for field in record_class.__slots__
+        })
+    return build
+
+
+def _category_level_record(level):
+    category = level.category
+    return CategoryLevelRecord(
+        pk=level.pk,
+        level_number=level.level_number,
+        category_id=level.category_id,
+        category=CategoryRecord(
+            pk=category.pk, id=category.pk, name=category.name, difficulty=category.difficulty,
+            color=category.color, icon=category.icon
+        ),
+        questions_required=level.questions_required,
+        time_limit=level.time_limit,
+        unlock_score=level.unlock_score,
+    )
+
+
+def _math_level_record(level):
+    return MathLevelRecord(**{
+        field: level.pk if field == 'pk' else getattr(level, field) for field in MathLevelRecord.__slots__ if field != 'operations'
+    }, operations=tuple(level.operations or ()))
+
+
+# Game name -> level model and record builder
+GAMES = {
+    'quiz': (QuizLevel, _category_level_record),
+    'riddle': (RiddleLevel, _category_level_record),
+    'math': (MathGameLevel, _math_level_record),
+    'sentence_builder': (SentenceBuilderLevel, _plain_record(SentenceBuilderLevelRecord)),
+    'word_search': (WordSearchLevel, _plain_record(WordSearchLevelRecord)),
+    'memory': (GameLevel, _plain_record(MemoryLevelRecord)),
+    'color_splash': (ColorSplashLevel, _plain_record(ColorSplashLevelRecord)),
+}
+# Model whose changes affect the records -> game
+_SOURCES = {
+    QuizLevel: 'quiz',
+    QuizCategory: 'quiz',
+    RiddleLevel: 'riddle',
+    RiddleCategory: 'riddle',
+    MathGameLevel: 'math',
+    SentenceBuilderLevel: 'sentence_builder',
+    WordSearchLevel: 'word_search',
+    GameLevel: 'memory',
+    ColorSplashLevel: 'color_splash',
+}
+
+_lock = threading.Lock()
+_catalogs = {}  # game -> {'version', 'built_at', 'levels': {level_number: record}, 'ordered': (records,)}
+
+
+def _version_key(game):
+    return f'level_catalog_version_{game}'
+
+
+def invalidate_level_catalog(game):
+    """Mark every process's levels of `game` stale, after level rows were written without signals"""
+    try:
+        cache.incr(_version_key(game))
+    except ValueError:
+        cache.set(_version_key(game), 1, None)
+
+
+@receiver(post_save, sender=QuizLevel)
+@receiver(post_delete, sender=QuizLevel)
+@receiver(post_save, sender=QuizCategory)
+@receiver(post_delete, sender=QuizCategory)
+@receiver(post_save, sender=RiddleLevel)
+@receiver(post_delete, sender=RiddleLevel)
+@receiver(post_save, sender=RiddleCategory)
+@receiver(post_delete, sender=RiddleCategory)
+@receiver(post_save, sender=MathGameLevel)
+@receiver(post_delete, sender=MathGameLevel)
+@receiver(post_save, sender=SentenceBuilderLevel)
+@receiver(post_delete, sender=SentenceBuilderLevel)
+@receiver(post_save, sender=WordSearchLevel)
+@receiver(post_delete, sender=WordSearchLevel)
+@receiver(post_save, sender=GameLevel)
+@receiver(post_delete, sender=GameLevel)
+@receiver(post_save, sender=ColorSplashLevel)
+@receiver(post_delete, sender=ColorSplashLevel)
+def _level_changed(sender, **kwargs):
+    invalidate_level_catalog(_SOURCES[sender])
+
+
+def _build(game, version):
+    model, build_record = GAMES[game]
+    rows = model.objects.all()
+    if build_record is _category_level_record:
+        rows = rows.select_related('category')
+    ordered = tuple(build_record(row) for row in rows.order_by('level_number'))
+    logger.debug(f"Built {game} level catalog v{version}: {len(ordered)} levels")
+    return {
+        'version': version,
+        'built_at': time.monotonic(),
+        'levels': {record.level_number: record for record in ordered},
+        'ordered': ordered,
+    }
+
+
+def _current(game):
+    version = cache.get(_version_key(game), 0)
+    catalog = _catalogs.get(game)
+    if catalog is not None and catalog['version'] == version and time.monotonic() - catalog['built_at'] < LEVEL_CATALOG_MAX_AGE_SECONDS:
+        return catalog
+    with _lock:
+        if _catalogs.get(game) is catalog:
+            _catalogs[game] = _build(game, version)
+        return _catalogs[game]
+
+
+def get_level(game, level_number):
+    """The record of a game's level; raises the level model's DoesNotExist when there is none"""
+    record = _current(game)['levels'].get(level_number)
+    if record is None:
+        raise GAMES[game][0].DoesNotExist(f"No {game} level {level_number}")
+    return record
+
+
+def get_levels(game):
+    """All of a game's level records, by level number"""
+    return _current(game)['ordered']
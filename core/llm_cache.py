@@ -0,0 +1,192 @@
+"""
+Persistent cache of LLM responses shared by all AI generators.
+
+Responses are keyed by a fingerprint of the normalized request (model,
+system prompt and generation parameters) and several variants are kept per
+key so children don't keep seeing the same item. A full key still misses now
+and then (LLM_CACHE_REFRESH_PROBABILITY) and the new response replaces its
+most-served variant, so variants keep turning over within the TTL. Callers
+after new content (pool refills, level growth batches) skip lookups and
+only store. Entries expire after a TTL
+and the table is trimmed least-recently-used first once it grows past its
+size limit. The cache lives in its own SQLite file so it survives restarts
+and is shared by every worker process on the box.
+"""
+import hashlib
+import json
+import logging
+import random
+import sqlite3
+import threading
+import time
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+LLM_CACHE_ENABLED = getattr(settings, 'LLM_CACHE_ENABLED', True)
+LLM_CACHE_PATH = str(getattr(settings, 'LLM_CACHE_PATH', settings.BASE_DIR / 'llm_cache.sqlite3'))
+LLM_CACHE_TTL = getattr(settings, 'LLM_CACHE_TTL', 7 * 24 * 3600)
+LLM_CACHE_MAX_ENTRIES = getattr(settings, 'LLM_CACHE_MAX_ENTRIES', 5000)
+LLM_CACHE_VARIANTS = getattr(settings, 'LLM_CACHE_VARIANTS', 5)
+LLM_CACHE_REFRESH_PROBABILITY = getattr(settings, 'LLM_CACHE_REFRESH_PROBABILITY', 0.2)
+
+_local = threading.local()
+_counters = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+_counters_lock = threading.Lock()
+
+
+def _connection():
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        conn = sqlite3.connect(LLM_CACHE_PATH, timeout=5, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                cache_key TEXT NOT NULL,
+                content TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_key ON llm_cache (cache_key, created_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_access ON llm_cache (last_access)")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS llm_cache_counters (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        _local.conn = conn
+    return conn
+
+
+def _count(name, amount=1):
+    with _counters_lock:
+        _counters[name] += amount
+    try:
+        _connection().execute(
+            "INSERT INTO llm_cache_counters (name, value) VALUES (?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+            (name, amount)
+        )
+    except sqlite3.Error as e:
+        logger.warning(f"LLM cache counter update failed: {e}")
+
+
+def make_cache_key(model, messages, params=None):
+    """
+    Fingerprint a request. When params (the generation parameters, e.g.
+    difficulty/age/topic/question_type) are given they replace the user
+    prompt, so the randomly chosen prompt templates share one key.
+    """
+    system = " ".join(m['content'] for m in messages if m['role'] == 'system')
+    if params is not None:
+        body = json.dumps(params, sort_keys=True, default=str)
+    else:
+        body = " ".join(m['content'] for m in messages if m['role'] != 'system')
+    normalized = "\n".join(" ".join(part.lower().split()) for part in (model, system, body))
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+def get(cache_key):
+    """
+    Return a cached response for the key, or None on a miss.
+    A key only hits once it holds LLM_CACHE_VARIANTS fresh variants; the
+    least-served variant is returned so repeats are spread out. A share of
+    lookups on a full key miss anyway so a new variant gets generated.
+    """
+    if not LLM_CACHE_ENABLED:
+        return None
+
+    now = time.time()
+    try:
+        rows = _connection().execute(
+            "SELECT id, content, hits FROM llm_cache WHERE cache_key = ? AND created_at >= ?",
+            (cache_key, now - LLM_CACHE_TTL)
+        ).fetchall()
+        if len(rows) < LLM_CACHE_VARIANTS or random.random() < LLM_CACHE_REFRESH_PROBABILITY:
+            _count('misses')
+            return None
+
+        fewest_hits = min(row[2] for row in rows)
+        row_id, content, _ = random.choice([row for row in rows if row[2] == fewest_hits])
+        _connection().execute(
+            "UPDATE llm_cache SET hits = hits + 1, last_access = ? WHERE id = ?",
+            (now, row_id)
+        )
+    except sqlite3.Error as e:
+        logger.warning(f"LLM cache read failed: {e}")
+        return None
+
+    _count('hits')
+    return content
+
+
+def put(cache_key, content):
+    """
+    Store a response as a new variant for the key, replacing its most-served
+    variant when the key is full, and evict expired/least-recently-used entries
+    """
+    if not LLM_CACHE_ENABLED:
+        return
+
+    now = time.time()
+    try:
+        conn = _connection()
+        conn.execute(
+            "INSERT INTO llm_cache (cache_key, content, created_at, last_access) VALUES (?, ?, ?, ?)",
+            (cache_key, content, now, now)
+        )
+        _count('stores')
+
+        # A full key keeps its LLM_CACHE_VARIANTS least-served variants (the
+        # newest among equals, so the one just stored), dropping the most-served
+        evicted = conn.execute(
+            "DELETE FROM llm_cache WHERE id IN ("
+            "SELECT id FROM llm_cache WHERE cache_key = ? AND created_at >= ? "
+            "ORDER BY hits, created_at DESC LIMIT -1 OFFSET ?)",
+            (cache_key, now - LLM_CACHE_TTL, LLM_CACHE_VARIANTS)
+        ).rowcount
+        evicted += conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - LLM_CACHE_TTL,)).rowcount
+        overflow = conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0] - LLM_CACHE_MAX_ENTRIES
+        if overflow > 0:
+            evicted += conn.execute(
+                "DELETE FROM llm_cache WHERE id IN (SELECT id FROM llm_cache ORDER BY last_access LIMIT ?)",
+                (overflow,)
+            ).rowcount
+        if evicted:
+            _count('evictions', evicted)
+    except sqlite3.Error as e:
+        logger.warning(f"LLM cache write failed: {e}")
+
+
+def get_stats():
+    """Counters for sizing the cache: this process and all processes since the cache was created"""
+    conn = _connection()
+    entries, keys = conn.execute("SELECT COUNT(*), COUNT(DISTINCT cache_key) FROM llm_cache").fetchone()
+    persisted = dict(conn.execute("SELECT name, value FROM llm_cache_counters").fetchall())
+    total = {name: persisted.get(name, 0) for name in _counters}
+    lookups = total['hits'] + total['misses']
+    with _counters_lock:
+        process = dict(_counters)
+    return {
+        'entries': entries,
+        'keys': keys,
+        'max_entries': LLM_CACHE_MAX_ENTRIES,
+        'variants_per_key': LLM_CACHE_VARIANTS,
+        'ttl': LLM_CACHE_TTL,
+        'total': total,
+        'hit_rate': round(total['hits'] / lookups, 3) if lookups else 0.0,
+        'process': process,
+    }
+
+
+def clear():
+    conn = _connection()
+    conn.execute("DELETE FROM llm_cache")
+    conn.execute("DELETE FROM llm_cache_counters")
+    with _counters_lock:
+        for name in _counters:
+            _counters[name] = 0
@@ -0,0 +1,438 @@
+"""
+Shared entry point for every chat completion the AI generators make.
+
+The ai_*_generator modules build their prompts and call chat_completion()
+instead of holding their own Groq client. Responses go through the
+persistent cache in core.llm_cache.
+
+Every model has a circuit breaker. After LLM_BREAKER_FAILURE_THRESHOLD
+consecutive failures (errors, rate limits or calls slower than
+LLM_BREAKER_SLOW_CALL_SECONDS) the breaker opens and chat_completion raises
+CircuitOpenError without touching the network, so the generators go
+straight to their database/fallback paths. After LLM_BREAKER_RESET_TIMEOUT
+seconds one probe call is let through (half-open); its outcome closes or
+reopens the breaker. Cached responses are still served while it is open.
+
+Calls are paced under the model's requests- and tokens-per-minute quota by
+core.llm_quota: a call waits for its share (QuotaExceeded when it can't get
+it in time) before it is sent. Inside a level's deadline budget
+(core.deadlines) a call's timeout is cut to the time left and no call is
+sent once it is spent (DeadlineExceeded).
+
+The latency and outcome of every call sent are reported to core.llm_router,
+which picks the model for each call from a quality tier. Generators whose
+latency a learner waits on send their requests through core.llm_hedging.
+
+achat_completion() is the async twin used by the async level views. It
+sends requests through one AsyncGroq client per event loop whose httpx pool
+keeps up to LLM_HTTP_MAX_CONNECTIONS connections (LLM_HTTP_MAX_KEEPALIVE of
+them kept alive), so a process can wait on hundreds of completions at once.
+
+LLM_BACKEND picks what answers: Groq, the stub in core.llm_stub, or a trace
+recorded with LLM_TRACE_RECORD and replayed by core.llm_trace.
+"""
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+import weakref
+
+import httpx
+from dotenv import load_dotenv
+from groq import APITimeoutError, AsyncGroq, Groq, RateLimitError
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from . import deadlines, llm_cache, llm_metrics, llm_quota, llm_router, llm_trace
+from .deadlines import DeadlineExceeded
+from .llm_quota import QuotaExceeded
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+LLM_BACKEND = getattr(settings, 'LLM_BACKEND', 'groq')
+
+api_key = os.getenv('GROQ_API_KEY') or getattr(settings, 'GROQ_API_KEY', None)
+
+
+def get_client():
+    """
+    Build the completion client for LLM_BACKEND: 'groq' for the real service,
+    'stub' for the local stand-in in core.llm_stub, 'replay' to answer from a
+    recorded trace (core.llm_trace). Returns None when Groq has no API key.
+    With LLM_TRACE_RECORD set, the client records every request it sends.
+    """
+    if LLM_BACKEND == 'replay':
+        logger.warning(f"LLM_BACKEND is 'replay' - AI content comes from {llm_trace.LLM_REPLAY_TRACE}, not Groq")
+        return llm_trace.ReplayGroq()
+    if LLM_BACKEND == 'stub':
+        from .llm_stub import StubGroq
+        logger.warning("LLM_BACKEND is 'stub' - AI content comes from core.llm_stub, not Groq")
+        completion_client = StubGroq()
+    elif LLM_BACKEND != 'groq':
+        raise ImproperlyConfigured(f"Unknown LLM_BACKEND '{LLM_BACKEND}', expected 'groq', 'stub' or 'replay'")
+    elif not api_key:
+        logger.warning("GROQ_API_KEY not configured. AI generation will fall back to defaults.")
+        return None
+    else:
+        completion_client = Groq(api_key=api_key)
+
+    if llm_trace.LLM_TRACE_RECORD:
+        logger.warning(f"Recording every LLM request to {llm_trace.LLM_TRACE_RECORD}")
+        return llm_trace.TraceRecorder(completion_client)
+    return completion_client
+
+
+client = get_client()
+
+LLM_HTTP_MAX_CONNECTIONS = getattr(settings, 'LLM_HTTP_MAX_CONNECTIONS', 200)
+LLM_HTTP_MAX_KEEPALIVE = getattr(settings, 'LLM_HTTP_MAX_KEEPALIVE', 50)
+LLM_HTTP_KEEPALIVE_EXPIRY = getattr(settings, 'LLM_HTTP_KEEPALIVE_EXPIRY', 30)
+LLM_HTTP_TIMEOUT = getattr(settings, 'LLM_HTTP_TIMEOUT', 30)
+
+# One async client (and so one keep-alive connection pool) per event loop:
+# under ASGI that is one per process; async views run under WSGI get a loop
+# per request, and pooled connections can't outlive their loop
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_client():
+    """
+    The running event loop's shared async completion client for LLM_BACKEND,
+    created on first use. Returns None when Groq has no API key.
+    """
+    loop = asyncio.get_running_loop()
+    if loop not in _async_clients:
+        if LLM_BACKEND == 'replay':
+            _async_clients[loop] = llm_trace.AsyncReplayGroq()
+        elif LLM_BACKEND == 'stub':
+            from .llm_stub import AsyncStubGroq
+            _async_clients[loop] = AsyncStubGroq()
+        elif not api_key:
+            _async_clients[loop] = None
+        else:
+            _async_clients[loop] = AsyncGroq(
+                api_key=api_key,
+                http_client=httpx.AsyncClient(
+                    limits=httpx.Limits(
+                        max_connections=LLM_HTTP_MAX_CONNECTIONS,
+                        max_keepalive_connections=LLM_HTTP_MAX_KEEPALIVE,
+                        keepalive_expiry=LLM_HTTP_KEEPALIVE_EXPIRY
+                    ),
+                    timeout=LLM_HTTP_TIMEOUT
+                )
+            )
+        if llm_trace.LLM_TRACE_RECORD and LLM_BACKEND != 'replay' and _async_clients[loop] is not None:
+            _async_clients[loop] = llm_trace.TraceRecorder(_async_clients[loop], asynchronous=True)
+    return _async_clients[loop]
+
+LLM_BREAKER_FAILURE_THRESHOLD = getattr(settings, 'LLM_BREAKER_FAILURE_THRESHOLD', 3)
+LLM_BREAKER_RESET_TIMEOUT = getattr(settings, 'LLM_BREAKER_RESET_TIMEOUT', 30)
+LLM_BREAKER_SLOW_CALL_SECONDS = getattr(settings, 'LLM_BREAKER_SLOW_CALL_SECONDS', 10)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a model whose circuit breaker is open"""
+
+
+def is_configured():
+    """True when a client is available to send completions to"""
+    return client is not None
+
+
+def _breaker(model):
+    # Callers hold _breakers_lock
+    breaker = _breakers.get(model)
+    if breaker is None:
+        breaker = _breakers[model] = {
+            'state': CLOSED,
+            'consecutive_failures': 0,
+            'opened_at': None,
+            'probe_in_flight': False,
+            'calls': 0,
+            'failures': 0,
+            'short_circuited': 0,
+            'trips': 0,
+        }
+    return breaker
+
+
+def _set_state(model, breaker, state):
+    if breaker['state'] != state:
+        log = logger.info if state == CLOSED else logger.warning
+        log(f"LLM circuit breaker for {model}: {breaker['state']} -> {state} ({breaker['consecutive_failures']} consecutive failures)")
+        breaker['state'] = state
+
+
+def _ready_for_probe(breaker):
+    return (
+        breaker['state'] == OPEN
+        and time.monotonic() - breaker['opened_at'] >= LLM_BREAKER_RESET_TIMEOUT
+    ) or (breaker['state'] == HALF_OPEN and not breaker['probe_in_flight'])
+
+
+def is_available(model):
+    """True when a call to the model would be sent (breaker closed, or a half-open probe is due)"""
+    if not is_configured():
+        return False
+    with _breakers_lock:
+        breaker = _breaker(model)
+        return breaker['state'] == CLOSED or _ready_for_probe(breaker)
+
+
+def _acquire_call(model):
+    """Let a call through the model's breaker or raise CircuitOpenError"""
+    with _breakers_lock:
+        breaker = _breaker(model)
+        if breaker['state'] != CLOSED:
+            if not _ready_for_probe(breaker):
+                breaker['short_circuited'] += 1
+                raise CircuitOpenError(f"Circuit breaker open for {model}")
+            _set_state(model, breaker, HALF_OPEN)
+            breaker['probe_in_flight'] = True
+        breaker['calls'] += 1
+
+
+def _record_result(model, succeeded):
+    with _breakers_lock:
+        breaker = _breaker(model)
+        breaker['probe_in_flight'] = False
+        if succeeded:
+            breaker['consecutive_failures'] = 0
+            _set_state(model, breaker, CLOSED)
+            return
+
+        breaker['failures'] += 1
+        breaker['consecutive_failures'] += 1
+        if breaker['state'] == HALF_OPEN or breaker['consecutive_failures'] >= LLM_BREAKER_FAILURE_THRESHOLD:
+            if breaker['state'] != OPEN:
+                breaker['trips'] += 1
+            breaker['opened_at'] = time.monotonic()
+            _set_state(model, breaker, OPEN)
+
+
+def get_breaker_snapshot():
+    """State and counters of every model's breaker in this process"""
+    snapshot = {}
+    with _breakers_lock:
+        for model, breaker in _breakers.items():
+            snapshot[model] = {
+                'state': breaker['state'],
+                'consecutive_failures': breaker['consecutive_failures'],
+                'open_for': round(time.monotonic() - breaker['opened_at'], 1) if breaker['state'] != CLOSED else None,
+                'calls': breaker['calls'],
+                'failures': breaker['failures'],
+                'short_circuited': breaker['short_circuited'],
+                'trips': breaker['trips'],
+            }
+    return snapshot
+
+
+def chat_completion(model, messages, temperature=0.8, max_tokens=500, response_format=None, cache_params=None, fresh=False):
+    """
+    Run one chat completion and return the message content.
+    cache_params are the generation parameters that identify the request for
+    the response cache (see llm_cache.make_cache_key). fresh=True skips the
+    cache lookup (the response is still stored), for callers that want new
+    content rather than a replay.
+    """
+    cache_key, cached = _cached_response(model, messages, cache_params, fresh)
+    if cached is not None:
+        return cached
+
+    if not client:
+        raise ValueError("Groq client not available.")
+    _begin_call(model)
+    tokens = llm_quota.estimate_tokens(messages, max_tokens)
+    try:
+        # Don't take quota for a call the level no longer has time for
+        _call_timeout(model)
+        llm_quota.acquire(model, tokens)
+    except (QuotaExceeded, DeadlineExceeded) as e:
+        _refuse_call(model, e)
+    timeout = _admitted_call_timeout(model, tokens)
+
+    started = time.monotonic()
+    try:
+        response = _completions(client).create(**_build_request(model, messages, temperature, max_tokens, response_format), timeout=timeout)
+    except APITimeoutError as e:
+        _time_out_call(model, e, time.monotonic() - started, timeout)
+    except Exception as e:
+        _fail_call(model, e, time.monotonic() - started)
+        raise
+    return _finish_call(model, cache_key, response, time.monotonic() - started, response_format, tokens)
+
+
+async def achat_completion(model, messages, temperature=0.8, max_tokens=500, response_format=None, cache_params=None, fresh=False):
+    """
+    Async chat_completion for the async level views: the same cache, circuit
+    breaker, routing stats and metrics, but the request goes through this
+    event loop's shared AsyncGroq client so waiting on it holds no thread.
+    (Cache lookups are local SQLite reads and run inline.)
+    """
+    cache_key, cached = _cached_response(model, messages, cache_params, fresh)
+    if cached is not None:
+        return cached
+
+    async_client = get_async_client()
+    if not async_client:
+        raise ValueError("Groq client not available.")
+    _begin_call(model)
+    tokens = llm_quota.estimate_tokens(messages, max_tokens)
+    try:
+        _call_timeout(model)
+        await llm_quota.aacquire(model, tokens)
+    except (QuotaExceeded, DeadlineExceeded) as e:
+        _refuse_call(model, e)
+    except asyncio.CancelledError:
+        _cancel_call(model, 0)
+        raise
+    timeout = _admitted_call_timeout(model, tokens)
+
+    started = time.monotonic()
+    try:
+        response = await _completions(async_client).create(**_build_request(model, messages, temperature, max_tokens, response_format), timeout=timeout)
+    except APITimeoutError as e:
+        _time_out_call(model, e, time.monotonic() - started, timeout)
+    except asyncio.CancelledError:
+        # The caller stopped waiting (e.g. a hedge answered first): neither a success nor a failure
+        _cancel_call(model, time.monotonic() - started)
+        raise
+    except Exception as e:
+        _fail_call(model, e, time.monotonic() - started)
+        raise
+    return _finish_call(model, cache_key, response, time.monotonic() - started, response_format, tokens)
+
+
+def _cached_response(model, messages, cache_params, fresh=False):
+    started = time.monotonic()
+    cache_key = llm_cache.make_cache_key(model, messages, cache_params)
+    if fresh:
+        return cache_key, None
+    cached = llm_cache.get(cache_key)
+    if cached is not None:
+        logger.debug(f"LLM cache hit for {model}")
+        llm_metrics.record_call(model, 'cache_hit', (time.monotonic() - started) * 1000)
+    return cache_key, cached
+
+
+def _call_timeout(model):
+    """Timeout for a call sent now: LLM_HTTP_TIMEOUT, cut to what is left of the level's deadline"""
+    timeout = deadlines.clamp_timeout(LLM_HTTP_TIMEOUT)
+    if timeout <= 0:
+        raise DeadlineExceeded(f"Level deadline passed before calling {model}")
+    return timeout
+
+
+def _admitted_call_timeout(model, tokens):
+    """_call_timeout() once the quota admitted the call; waiting may have used up the deadline"""
+    try:
+        return _call_timeout(model)
+    except DeadlineExceeded as e:
+        llm_quota.release(model, tokens, sent=False)
+        _refuse_call(model, e)
+
+
+def _refuse_call(model, error):
+    """A call let through the breaker was not sent: over quota or out of time"""
+    _cancel_call(model, 0, 'quota_exceeded' if isinstance(error, QuotaExceeded) else 'deadline_exceeded')
+    raise error
+
+
+def _completions(completion_client):
+    # Inside a level budget the SDK must not retry on its own: a retry would start after the deadline
+    if deadlines.remaining() is not None:
+        completion_client = completion_client.with_options(max_retries=0)
+    return completion_client.chat.completions
+
+
+def _begin_call(model):
+    try:
+        _acquire_call(model)
+    except CircuitOpenError:
+        llm_metrics.record_call(model, 'circuit_open', 0)
+        raise
+
+
+def _build_request(model, messages, temperature, max_tokens, response_format):
+    request = {
+        'model': model,
+        'messages': messages,
+        'temperature': temperature,
+        'max_tokens': max_tokens,
+    }
+    if response_format:
+        request['response_format'] = response_format
+    return request
+
+
+def _fail_call(model, error, elapsed):
+    if isinstance(error, RateLimitError):
+        llm_quota.rate_limited(model)
+    _record_result(model, succeeded=False)
+    llm_router.observe(model, elapsed * 1000, failed=True)
+    llm_metrics.record_call(model, _error_outcome(error), elapsed * 1000)
+
+
+def _cancel_call(model, elapsed, outcome='cancelled'):
+    with _breakers_lock:
+        _breaker(model)['probe_in_flight'] = False
+    llm_metrics.record_call(model, outcome, elapsed * 1000)
+
+
+def _time_out_call(model, error, elapsed, timeout):
+    if timeout < LLM_HTTP_TIMEOUT:
+        # Cut short by the level's deadline, not the model's fault
+        _cancel_call(model, elapsed, 'deadline_exceeded')
+        raise DeadlineExceeded(f"Level deadline passed while waiting on {model}") from error
+    _fail_call(model, error, elapsed)
+    raise error
+
+
+def _finish_call(model, cache_key, response, elapsed, response_format, tokens_reserved):
+    if elapsed > LLM_BREAKER_SLOW_CALL_SECONDS:
+        logger.warning(f"Slow LLM call to {model}: {elapsed:.1f}s")
+    _record_result(model, succeeded=elapsed <= LLM_BREAKER_SLOW_CALL_SECONDS)
+    content = response.choices[0].message.content
+
+    usage = getattr(response, 'usage', None)
+    prompt_tokens = getattr(usage, 'prompt_tokens', 0) or 0
+    completion_tokens = getattr(usage, 'completion_tokens', 0) or 0
+    if usage is not None:
+        llm_quota.release(model, tokens_reserved, prompt_tokens + completion_tokens)
+    outcome = 'ok'
+    try:
+        # Only cache responses the generators can parse
+        if response_format and response_format.get('type') == 'json_object':
+            json.loads(content)
+    except ValueError:
+        outcome = 'invalid_json'
+        raise
+    finally:
+        llm_router.observe(model, elapsed * 1000, failed=outcome != 'ok')
+        llm_metrics.record_call(
+            model,
+            outcome,
+            elapsed * 1000,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens
+        )
+    llm_cache.put(cache_key, content)
+    return content
+
+
+def _error_outcome(error):
+    if isinstance(error, RateLimitError):
+        return 'rate_limited'
+    if isinstance(error, APITimeoutError):
+        return 'timeout'
+    return 'error'
@@ -0,0 +1,170 @@
+"""
+Hedged requests for slow completions.
+
+A level waits on its slowest AI batch, so the tail of Groq latency is what a
+learner feels. hedged_completion() sends a generator's request as usual; when
+no answer has come back after the model's LLM_HEDGE_PERCENTILE latency (from
+core.llm_router's rolling window, LLM_HEDGE_DEFAULT_DELAY_SECONDS until the
+model has LLM_ROUTER_MIN_SAMPLES calls), the same request goes out a second
+time to the fastest other healthy model of the tier, or to the same model
+when it is the only one. Whichever call succeeds first is used.
+
+Hedges are paid for from a budget: every request earns
+LLM_HEDGE_MAX_EXTRA_RATIO of a hedge (up to HEDGE_BUDGET_BURST banked), so
+hedging adds at most that share of extra calls. Every hedge is recorded in
+core.llm_metrics with who won: 'hedge_won', 'primary_won', 'both_failed', or
+'over_budget' when it was not sent.
+
+The losing call of ahedged_completion() is cancelled and its connection
+closed. A sync call can't be interrupted: the losing thread finishes in the
+background and its answer only goes to the response cache.
+"""
+import asyncio
+import contextvars
+import logging
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, TimeoutError as FutureTimeoutError, wait
+from django.conf import settings
+from .deadlines import remaining
+from .llm_client import achat_completion, chat_completion
+from .llm_metrics import record_hedge
+from .llm_router import choose_hedge_model, latency_percentile
+
+logger = logging.getLogger(__name__)
+
+LLM_HEDGE_ENABLED = getattr(settings, 'LLM_HEDGE_ENABLED', True)
+LLM_HEDGE_PERCENTILE = getattr(settings, 'LLM_HEDGE_PERCENTILE', 90)
+LLM_HEDGE_DEFAULT_DELAY_SECONDS = getattr(settings, 'LLM_HEDGE_DEFAULT_DELAY_SECONDS', 2.0)
+LLM_HEDGE_MIN_DELAY_SECONDS = getattr(settings, 'LLM_HEDGE_MIN_DELAY_SECONDS', 0.3)
+LLM_HEDGE_MAX_EXTRA_RATIO = getattr(settings, 'LLM_HEDGE_MAX_EXTRA_RATIO', 0.1)
+LLM_HEDGE_MAX_WORKERS = getattr(settings, 'LLM_HEDGE_MAX_WORKERS', 32)
+
+# Hedges that can be banked while traffic is calm and spent in one slow spell
+HEDGE_BUDGET_BURST = 3
+
+# Sync primaries and hedges run here so the caller can stop waiting on the slower one
+_executor = ThreadPoolExecutor(
+    max_workers=LLM_HEDGE_MAX_WORKERS,
+    thread_name_prefix='llm-hedge'
+)
+
+_budget_lock = threading.Lock()
+_budget = HEDGE_BUDGET_BURST
+
+
+def hedge_delay(model):
+    """Seconds to wait on a call to the model before hedging it"""
+    latency_ms = latency_percentile(model, LLM_HEDGE_PERCENTILE)
+    if latency_ms is None:
+        return LLM_HEDGE_DEFAULT_DELAY_SECONDS
+    return max(LLM_HEDGE_MIN_DELAY_SECONDS, latency_ms / 1000)
+
+
+def _earn_budget():
+    global _budget
+    with _budget_lock:
+        _budget = min(HEDGE_BUDGET_BURST, _budget + LLM_HEDGE_MAX_EXTRA_RATIO)
+
+
+def _spend_budget():
+    global _budget
+    with _budget_lock:
+        if _budget < 1:
+            return False
+        _budget -= 1
+        return True
+
+
+def _hedge_request(request, tier):
+    """The hedge to send for a slow request, or None when the budget is spent or the level's deadline is too close"""
+    left = remaining()
+    if left is not None and left < LLM_HEDGE_MIN_DELAY_SECONDS:
+        # Too close to the level's deadline for a second call to come back in time
+        return None
+    if not _spend_budget():
+        record_hedge(request['model'], 'over_budget')
+        return None
+    hedge = dict(request, model=choose_hedge_model(tier, request['model']))
+    logger.info(f"Hedging a slow {request['model']} call with {hedge['model']}")
+    return hedge
+
+
+def hedged_completion(request, tier):
+    """
+    chat_completion(**request), hedged within `tier` when it runs long.
+    request holds chat_completion's arguments, including the model the
+    router picked. Returns (content, model that answered).
+    """
+    if not LLM_HEDGE_ENABLED:
+        return chat_completion(**request), request['model']
+    _earn_budget()
+
+    primary = _executor.submit(contextvars.copy_context().run, chat_completion, **request)
+    try:
+        return primary.result(timeout=hedge_delay(request['model'])), request['model']
+    except FutureTimeoutError:
+        pass
+
+    hedge_request = _hedge_request(request, tier)
+    if hedge_request is None:
+        return primary.result(), request['model']
+
+    hedge = _executor.submit(contextvars.copy_context().run, chat_completion, **hedge_request)
+    racing = {primary: request, hedge: hedge_request}
+    error = None
+    while racing:
+        done, _ = wait(racing, return_when=FIRST_COMPLETED)
+        for future in done:
+            answered = racing.pop(future)
+            try:
+                content = future.result()
+            except Exception as e:
+                error = e
+                continue
+            for loser in racing:
+                loser.cancel()
+            record_hedge(hedge_request['model'], 'hedge_won' if future is hedge else 'primary_won')
+            return content, answered['model']
+
+    record_hedge(hedge_request['model'], 'both_failed')
+    raise error
+
+
+async def ahedged_completion(request, tier):
+    """hedged_completion for the async generators; the losing call is cancelled"""
+    if not LLM_HEDGE_ENABLED:
+        return await achat_completion(**request), request['model']
+    _earn_budget()
+
+    primary = asyncio.ensure_future(achat_completion(**request))
+    racing = {primary: request}
+    try:
+        done, _ = await asyncio.wait(racing, timeout=hedge_delay(request['model']))
+        if done:
+            return primary.result(), request['model']
+
+        hedge_request = _hedge_request(request, tier)
+        if hedge_request is None:
+            return await primary, request['model']
+
+        hedge = asyncio.ensure_future(achat_completion(**hedge_request))
+        racing[hedge] = hedge_request
+        error = None
+        while racing:
+            done, _ = await asyncio.wait(racing, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                answered = racing.pop(task)
+                try:
+                    content = task.result()
+                except Exception as e:
+                    error = e
+                    continue
+                record_hedge(hedge_request['model'], 'hedge_won' if task is hedge else 'primary_won')
+                return content, answered['model']
+
+        record_hedge(hedge_request['model'], 'both_failed')
+        raise error
+    finally:
+        # The loser, or both calls when the level gave up on this batch
+        for task in racing:
+            task.cancel()
@@ -0,0 +1,259 @@
+"""
+Structured instrumentation for LLM completions.
+
+llm_client.chat_completion records every call: wall-clock latency, prompt and
+completion tokens, model, outcome (ok, cache_hit, error, rate_limited,
+timeout, circuit_open, invalid_json, cancelled, deadline_exceeded,
+quota_exceeded) and the endpoint that caused it. The generators and level
+views add validation failures (AI items rejected by a validate_* function)
+and fallbacks (slots served from the database or a static item instead of
+the AI, with the reason), and core.llm_hedging how each hedged request
+ended. Streaming level views record their time to first question, the
+latency a learner actually waits.
+
+The endpoint comes from a context variable set per request by
+LLMEndpointMiddleware; level_assembly copies the context into its worker
+threads. Events are aggregated in memory for this process (get_summary) and
+written to LLMMetricEvent in batches, from a background thread that closes
+its connection, so the llm_metrics management command can aggregate across
+workers; that command also deletes events older than
+LLM_METRICS_RETENTION_DAYS (prune_metrics).
+"""
+import bisect
+import contextvars
+import logging
+import threading
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+from .models import LLMMetricEvent
+
+logger = logging.getLogger(__name__)
+
+LLM_METRICS_ENABLED = getattr(settings, 'LLM_METRICS_ENABLED', True)
+LLM_METRICS_PERSIST = getattr(settings, 'LLM_METRICS_PERSIST', True)
+LLM_METRICS_FLUSH_SIZE = getattr(settings, 'LLM_METRICS_FLUSH_SIZE', 50)
+LLM_METRICS_FLUSH_SECONDS = getattr(settings, 'LLM_METRICS_FLUSH_SECONDS', 30)
+LLM_METRICS_RETENTION_DAYS = getattr(settings, 'LLM_METRICS_RETENTION_DAYS', 14)
+
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is open-ended
+LATENCY_BUCKETS_MS = [50, 100, 250, 500, 1000, 2500, 5000, 10000, 20000]
+
+current_endpoint = contextvars.ContextVar('llm_endpoint', default='background')
+
+_EVENT_BUCKETS = {'validation_failure': 'validation_failures', 'fallback': 'fallbacks', 'hedge': 'hedges'}
+
+_lock = threading.Lock()
+_calls = {}
+_events = {}
+_first_items = {}
+_pending = []
+_last_flush = time.monotonic()
+_flushing = False
+
+
+def new_histogram():
+    return [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+
+def observe(histogram, latency_ms):
+    histogram[bisect.bisect_left(LATENCY_BUCKETS_MS, latency_ms)] += 1
+
+
+def histogram_percentile(histogram, percentile):
+    """
+    Upper bound (ms) of the bucket holding the given percentile, None when
+    empty. Values past the last bucket report its bound.
+    """
+    total = sum(histogram)
+    if not total:
+        return None
+    threshold = total * percentile / 100
+    running = 0
+    for index, count in enumerate(histogram[:-1]):
+        running += count
+        if running >= threshold:
+            return LATENCY_BUCKETS_MS[index]
+    return LATENCY_BUCKETS_MS[-1]
+
+
+def record_call(model, outcome, latency_ms, prompt_tokens=0, completion_tokens=0):
+    """Record one chat completion (or cache hit / short-circuit) for the current endpoint"""
+    if not LLM_METRICS_ENABLED:
+        return
+
+    endpoint = current_endpoint.get()
+    with _lock:
+        stats = _calls.get((endpoint, model, outcome))
+        if stats is None:
+            stats = _calls[(endpoint, model, outcome)] = {
+                'count': 0,
+                'latency_ms_total': 0.0,
+                'prompt_tokens': 0,
+                'completion_tokens': 0,
+                'histogram': new_histogram(),
+            }
+        stats['count'] += 1
+        stats['latency_ms_total'] += latency_ms
+        stats['prompt_tokens'] += prompt_tokens
+        stats['completion_tokens'] += completion_tokens
+        observe(stats['histogram'], latency_ms)
+
+    _queue({
+        'event': 'call',
+        'endpoint': endpoint,
+        'model': model,
+        'outcome': outcome,
+        'latency_ms': int(latency_ms),
+        'prompt_tokens': prompt_tokens,
+        'completion_tokens': completion_tokens,
+    })
+
+
+def record_validation_failure(kind, reason):
+    """An AI item of `kind` (quiz question, riddle, math problem) was rejected"""
+    _record_event('validation_failure', kind, reason)
+
+
+def record_fallback(kind, source, reason):
+    """A slot of `kind` was served from `source` ('db' or 'static') instead of the AI"""
+    _record_event('fallback', kind, f"{source}:{reason}")
+
+
+def record_hedge(model, outcome):
+    """A hedge was sent to (or, when over budget, withheld from) `model`; outcome says which call answered"""
+    _record_event('hedge', model, outcome)
+
+
+def record_time_to_first_item(kind, latency_ms):
+    """A streamed level sent its first `kind` item latency_ms after the request started"""
+    if not LLM_METRICS_ENABLED:
+        return
+
+    endpoint = current_endpoint.get()
+    with _lock:
+        histogram = _first_items.get((endpoint, kind))
+        if histogram is None:
+            histogram = _first_items[(endpoint, kind)] = new_histogram()
+        observe(histogram, latency_ms)
+
+    _queue({
+        'event': 'first_item',
+        'endpoint': endpoint,
+        'model': kind,
+        'outcome': 'streamed',
+        'latency_ms': int(latency_ms),
+    })
+
+
+def _record_event(event, kind, reason):
+    if not LLM_METRICS_ENABLED:
+        return
+
+    endpoint = current_endpoint.get()
+    reason = str(reason)[:100]
+    with _lock:
+        key = (event, endpoint, kind, reason)
+        _events[key] = _events.get(key, 0) + 1
+
+    _queue({
+        'event': event,
+        'endpoint': endpoint,
+        'model': kind,
+        'outcome': reason,
+    })
+
+
+def _queue(row):
+    global _flushing
+    if not LLM_METRICS_PERSIST:
+        return
+
+    with _lock:
+        _pending.append(row)
+        due = len(_pending) >= LLM_METRICS_FLUSH_SIZE or time.monotonic() - _last_flush >= LLM_METRICS_FLUSH_SECONDS
+        # Events recorded while a flush runs go out with the next one
+        due = due and not _flushing
+        if due:
+            _flushing = True
+
+    if due:
+        # Events are recorded on request threads, the event loop and the level
+        # assembly and hedging pools: write them from a thread of their own
+        threading.Thread(target=_flush_in_background, daemon=True).start()
+
+
+def _flush_in_background():
+    global _flushing
+    try:
+        flush_metrics()
+    finally:
+        connection.close()
+        with _lock:
+            _flushing = False
+
+
+def flush_metrics():
+    """Write queued events to LLMMetricEvent. Returns how many were written."""
+    global _pending, _last_flush
+    with _lock:
+        rows, _pending = _pending, []
+        _last_flush = time.monotonic()
+    if not rows:
+        return 0
+
+    try:
+        LLMMetricEvent.objects.bulk_create([LLMMetricEvent(**row) for row in rows])
+    except Exception as e:
+        logger.warning(f"Could not persist {len(rows)} LLM metric events: {e}")
+        return 0
+    return len(rows)
+
+
+def prune_metrics():
+    """Delete the LLMMetricEvent rows older than LLM_METRICS_RETENTION_DAYS; returns how many"""
+    cutoff = timezone.now() - timedelta(days=LLM_METRICS_RETENTION_DAYS)
+    deleted, _ = LLMMetricEvent.objects.filter(created_at__lt=cutoff).delete()
+    return deleted
+
+
+def get_summary():
+    """Per-endpoint call histograms and event counters for this process"""
+    endpoints = {}
+
+    def entry_for(endpoint):
+        return endpoints.setdefault(endpoint, {'calls': [], 'validation_failures': {}, 'fallbacks': {}, 'hedges': {}, 'time_to_first_item': {}})
+
+    with _lock:
+        for (endpoint, model, outcome), stats in _calls.items():
+            entry = entry_for(endpoint)
+            entry['calls'].append({
+                'model': model,
+                'outcome': outcome,
+                'count': stats['count'],
+                'avg_ms': round(stats['latency_ms_total'] / stats['count'], 1),
+                'p50_ms': histogram_percentile(stats['histogram'], 50),
+                'p95_ms': histogram_percentile(stats['histogram'], 95),
+                'prompt_tokens': stats['prompt_tokens'],
+                'completion_tokens': stats['completion_tokens'],
+                'histogram': _histogram_dict(stats['histogram']),
+            })
+        for (event, endpoint, kind, reason), count in _events.items():
+            entry = entry_for(endpoint)
+            bucket = entry[_EVENT_BUCKETS[event]]
+            bucket[f"{kind} {reason}"] = count
+        for (endpoint, kind), histogram in _first_items.items():
+            entry_for(endpoint)['time_to_first_item'][kind] = {
+                'count': sum(histogram),
+                'p50_ms': histogram_percentile(histogram, 50),
+                'p95_ms': histogram_percentile(histogram, 95),
+                'histogram': _histogram_dict(histogram),
+            }
+    return endpoints
+
+
+def _histogram_dict(histogram):
+    labels = [f"<={bound}" for bound in LATENCY_BUCKETS_MS] + [f">{LATENCY_BUCKETS_MS[-1]}"]
+    return dict(zip(labels, histogram))
@@ -0,0 +1,254 @@
+"""
+Client-side pacing of Groq calls under the requests-per-minute and
+tokens-per-minute limits.
+
+Every model has two token buckets, requests and tokens, sized from
+LLM_QUOTA_LIMITS (per model, else LLM_QUOTA_DEFAULT_LIMITS) and refilled at
+the per-minute rate. The bucket levels live in a table of the response cache's
+SQLite file (core.llm_cache), so every worker process on the box draws from
+the same quota. llm_client.chat_completion calls acquire() before sending:
+
+- A call takes one request and its token estimate (prompt characters / 4
+  plus max_tokens). When a call succeeds, the tokens it did not use go back.
+- Calls have a priority class: 'interactive' (a learner is waiting, set for
+  every request by LLMEndpointMiddleware), 'prefetch' (pool refills a request
+  triggered) and 'background' (commands and anything else). A class may only
+  take from a bucket while the bucket stays above its LLM_QUOTA_RESERVE share
+  of capacity, so refill work leaves headroom that only interactive calls use.
+- A call that can't be admitted yet waits until the buckets refill enough:
+  up to the level's deadline for interactive calls, or LLM_QUOTA_MAX_WAIT_SECONDS.
+  After that it raises QuotaExceeded, and the generators fall back as they
+  do for an open circuit breaker.
+- A 429 from Groq drains the model's buckets, so every worker backs off
+  together instead of each one finding the limit on its own.
+"""
+import asyncio
+import contextvars
+import logging
+import sqlite3
+import threading
+import time
+from django.conf import settings
+from . import deadlines
+from .llm_cache import LLM_CACHE_PATH
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = 'interactive'
+PREFETCH = 'prefetch'
+BACKGROUND = 'background'
+
+LLM_QUOTA_ENABLED = getattr(settings, 'LLM_QUOTA_ENABLED', True)
+LLM_QUOTA_DEFAULT_LIMITS = getattr(settings, 'LLM_QUOTA_DEFAULT_LIMITS', {'rpm': 30, 'tpm': 6000})
+LLM_QUOTA_LIMITS = getattr(settings, 'LLM_QUOTA_LIMITS', {})
+LLM_QUOTA_RESERVE = getattr(settings, 'LLM_QUOTA_RESERVE', {INTERACTIVE: 0.0, PREFETCH: 0.25, BACKGROUND: 0.5})
+LLM_QUOTA_MAX_WAIT_SECONDS = getattr(settings, 'LLM_QUOTA_MAX_WAIT_SECONDS', 30)
+
+call_priority = contextvars.ContextVar('llm_call_priority', default=BACKGROUND)
+
+_local = threading.local()
+_stats_lock = threading.Lock()
+_stats = {}  # priority -> counters
+
+
+class QuotaExceeded(Exception):
+    """Raised when a call could not be admitted under the model's quota in time"""
+
+
+def _connection():
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        conn = sqlite3.connect(LLM_CACHE_PATH, timeout=5, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS llm_quota_buckets (
+                model TEXT PRIMARY KEY,
+                requests REAL NOT NULL,
+                tokens REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        _local.conn = conn
+    return conn
+
+
+def limits_for(model):
+    """Requests and tokens per minute allowed for the model"""
+    return dict(LLM_QUOTA_DEFAULT_LIMITS, **LLM_QUOTA_LIMITS.get(model, {}))
+
+
+def estimate_tokens(messages, max_tokens):
+    """Tokens a call may use at most: its prompt (about 4 characters per token) plus max_tokens"""
+    return sum(len(message['content']) for message in messages) // 4 + max_tokens
+
+
+def _update_bucket(model, change):
+    """
+    Refill the model's buckets to now, then apply change(requests, tokens,
+    limits) -> (requests, tokens, result) in one write transaction across
+    processes. Returns result.
+    """
+    limits = limits_for(model)
+    conn = _connection()
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute("SELECT requests, tokens, updated_at FROM llm_quota_buckets WHERE model = ?", (model,)).fetchone()
+        if row is None:
+            requests, tokens = limits['rpm'], limits['tpm']
+        else:
+            elapsed = max(0.0, now - row[2])
+            requests = min(limits['rpm'], row[0] + elapsed * limits['rpm'] / 60)
+            tokens = min(limits['tpm'], row[1] + elapsed * limits['tpm'] / 60)
+
+        requests, tokens, result = change(requests, tokens, limits)
+        conn.execute(
+            "INSERT INTO llm_quota_buckets (model, requests, tokens, updated_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(model) DO UPDATE SET requests = excluded.requests, tokens = excluded.tokens, updated_at = excluded.updated_at",
+            (model, requests, tokens, now)
+        )
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return result
+
+
+def _try_take(model, tokens_needed, priority):
+    """Take one request and tokens_needed tokens if the priority class may; else seconds until it may"""
+    reserve = LLM_QUOTA_RESERVE.get(priority, 0.0)
+
+    def take(requests, tokens, limits):
+        # A call bigger than the token bucket itself is admitted once the bucket is full
+        needed = min(tokens_needed, limits['tpm'] * (1 - reserve))
+        request_floor = 1 + reserve * limits['rpm']
+        token_floor = needed + reserve * limits['tpm']
+        if requests >= request_floor and tokens >= token_floor:
+            return requests - 1, tokens - tokens_needed, 0.0
+        wait = max(
+            (request_floor - requests) * 60 / limits['rpm'],
+            (token_floor - tokens) * 60 / limits['tpm'],
+        )
+        return requests, tokens, max(wait, 0.01)
+
+    return _update_bucket(model, take)
+
+
+def _max_wait(priority):
+    left = deadlines.remaining() if priority == INTERACTIVE else None
+    return LLM_QUOTA_MAX_WAIT_SECONDS if left is None else min(left, LLM_QUOTA_MAX_WAIT_SECONDS)
+
+
+def _count(priority, admitted, waited):
+    with _stats_lock:
+        stats = _stats.setdefault(priority, {'admitted': 0, 'waited': 0, 'wait_ms_total': 0.0, 'rejected': 0})
+        stats['admitted' if admitted else 'rejected'] += 1
+        if waited:
+            stats['waited'] += 1
+            stats['wait_ms_total'] += waited * 1000
+
+
+def _step(model, tokens_needed, priority, waited):
+    """One admission attempt: None when admitted, else the seconds to sleep (or QuotaExceeded)"""
+    try:
+        wait = _try_take(model, tokens_needed, priority)
+    except sqlite3.Error as e:
+        logger.warning(f"LLM quota check failed, sending the call unpaced: {e}")
+        wait = 0.0
+    if not wait:
+        _count(priority, True, waited)
+        if waited:
+            logger.debug(f"{priority} call to {model} admitted after {waited:.2f}s")
+        return None
+
+    if waited + wait > _max_wait(priority):
+        _count(priority, False, waited)
+        raise QuotaExceeded(f"{model} quota exhausted for {priority} calls")
+    return wait
+
+
+def acquire(model, tokens_needed, priority=None):
+    """Wait until a call of tokens_needed tokens may be sent to the model. Returns the seconds waited."""
+    if not LLM_QUOTA_ENABLED:
+        return 0.0
+    priority = priority or call_priority.get()
+    waited = 0.0
+    while True:
+        wait = _step(model, tokens_needed, priority, waited)
+        if wait is None:
+            return waited
+        time.sleep(wait)
+        waited += wait
+
+
+async def aacquire(model, tokens_needed, priority=None):
+    """acquire() for async callers; waiting does not block the event loop"""
+    if not LLM_QUOTA_ENABLED:
+        return 0.0
+    priority = priority or call_priority.get()
+    waited = 0.0
+    while True:
+        wait = _step(model, tokens_needed, priority, waited)
+        if wait is None:
+            return waited
+        await asyncio.sleep(wait)
+        waited += wait
+
+
+def release(model, tokens_reserved, tokens_used=0, sent=True):
+    """
+    Return the tokens a finished call reserved but did not use; a call that
+    was admitted but never sent (sent=False) also returns its request
+    """
+    unused = tokens_reserved - tokens_used
+    if not LLM_QUOTA_ENABLED or (unused <= 0 and sent):
+        return
+    refund = 0 if sent else 1
+
+    def give_back(requests, tokens, limits):
+        return min(limits['rpm'], requests + refund), min(limits['tpm'], tokens + max(unused, 0)), None
+
+    try:
+        _update_bucket(model, give_back)
+    except sqlite3.Error as e:
+        logger.warning(f"LLM quota release failed: {e}")
+
+
+def rate_limited(model):
+    """Groq answered 429: empty the model's buckets so every worker backs off"""
+    if not LLM_QUOTA_ENABLED:
+        return
+    try:
+        _update_bucket(model, lambda requests, tokens, limits: (0.0, 0.0, None))
+    except sqlite3.Error as e:
+        logger.warning(f"LLM quota update failed: {e}")
+
+
+def get_quota_snapshot():
+    """Current bucket levels per model and admission counters per priority class (this process)"""
+    models = {}
+    try:
+        rows = _connection().execute("SELECT model, requests, tokens, updated_at FROM llm_quota_buckets").fetchall()
+    except sqlite3.Error:
+        rows = []
+    now = time.time()
+    for model, requests, tokens, updated_at in rows:
+        limits = limits_for(model)
+        elapsed = max(0.0, now - updated_at)
+        models[model] = {
+            'rpm': limits['rpm'],
+            'tpm': limits['tpm'],
+            'requests_available': round(min(limits['rpm'], requests + elapsed * limits['rpm'] / 60), 1),
+            'tokens_available': round(min(limits['tpm'], tokens + elapsed * limits['tpm'] / 60)),
+        }
+
+    with _stats_lock:
+        priorities = {
+            priority: dict(
+                stats,
+                wait_ms_total=round(stats['wait_ms_total']),
+                avg_wait_ms=round(stats['wait_ms_total'] / stats['waited']) if stats['waited'] else 0,
+            )
+            for priority, stats in _stats.items()
+        }
+    return {'models': models, 'priorities': priorities}
@@ -0,0 +1,181 @@
+"""
+Latency-aware model routing for the AI generators.
+
+Models are grouped into quality tiers (LLM_MODEL_TIERS, listed in order of
+preference). Instead of hard-coding a model, a generator asks choose_model()
+for a tier and gets the fastest healthy model in it right now:
+
+- llm_client.chat_completion reports every call it sends with observe();
+  the router keeps the last LLM_ROUTER_WINDOW samples per model (latency
+  and whether the call failed), dropping samples older than
+  LLM_ROUTER_WINDOW_SECONDS.
+- A model is healthy when its circuit breaker lets calls through and, once
+  it has LLM_ROUTER_MIN_SAMPLES samples, its error rate over the window is
+  at most LLM_ROUTER_MAX_ERROR_RATE.
+- Healthy models are ranked by p95 latency (a level waits on its slowest
+  call); a model without any latency sample yet is only used when nothing
+  is measured. A LLM_ROUTER_EXPLORE_RATE share of calls goes to another
+  available model so a slow or recovered model keeps getting measured and
+  can win its traffic back.
+
+Every decision is counted per tier and model, and a change of a tier's
+preferred model is logged with the numbers behind it.
+"""
+import logging
+import random
+import threading
+import time
+from collections import deque
+from django.conf import settings
+from . import llm_client
+
+logger = logging.getLogger(__name__)
+
+LLM_MODEL_TIERS = getattr(settings, 'LLM_MODEL_TIERS', {
+    'fast': ["llama-3.1-8b-instant", "gemma2-9b-it"],
+    'quality': ["llama-3.3-70b-versatile", "mixtral-8x7b-32768"],
+})
+LLM_ROUTER_WINDOW = getattr(settings, 'LLM_ROUTER_WINDOW', 50)
+LLM_ROUTER_WINDOW_SECONDS = getattr(settings, 'LLM_ROUTER_WINDOW_SECONDS', 300)
+LLM_ROUTER_MIN_SAMPLES = getattr(settings, 'LLM_ROUTER_MIN_SAMPLES', 5)
+LLM_ROUTER_MAX_ERROR_RATE = getattr(settings, 'LLM_ROUTER_MAX_ERROR_RATE', 0.25)
+LLM_ROUTER_EXPLORE_RATE = getattr(settings, 'LLM_ROUTER_EXPLORE_RATE', 0.05)
+
+_lock = threading.Lock()
+_samples = {}  # model -> deque of (monotonic time, latency_ms, failed)
+_decisions = {}  # (tier, model) -> count
+_preferred = {}  # tier -> model the last ranked decision picked
+
+
+def observe(model, latency_ms, failed):
+    """Record the latency and outcome of a call sent to a model"""
+    with _lock:
+        samples = _samples.get(model)
+        if samples is None:
+            samples = _samples[model] = deque(maxlen=LLM_ROUTER_WINDOW)
+        samples.append((time.monotonic(), latency_ms, failed))
+
+
+def _percentile(sorted_values, percentile):
+    index = min(len(sorted_values) - 1, int(round(percentile / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def model_stats(model):
+    """Rolling p50/p95 latency (ms) and error rate of a model, from the samples in the window"""
+    cutoff = time.monotonic() - LLM_ROUTER_WINDOW_SECONDS
+    with _lock:
+        samples = _samples.get(model, ())
+        # Calls that failed fast say nothing about latency, only about errors
+        window = [(latency_ms, failed) for at, latency_ms, failed in samples if at >= cutoff]
+
+    latencies = sorted(latency_ms for latency_ms, failed in window if not failed)
+    return {
+        'samples': len(window),
+        'p50_ms': round(_percentile(latencies, 50)) if latencies else None,
+        'p95_ms': round(_percentile(latencies, 95)) if latencies else None,
+        'error_rate': round(sum(failed for _, failed in window) / len(window), 3) if window else None,
+    }
+
+
+def _rank(tier):
+    """Stats of a tier's models, the available ones, and the healthy ones as (ranked by p95, unmeasured)"""
+    models = LLM_MODEL_TIERS[tier]
+    stats = {model: model_stats(model) for model in models}
+    available = [model for model in models if llm_client.is_available(model)]
+
+    ranked = []
+    unmeasured = []
+    for model in available:
+        model_stat = stats[model]
+        if model_stat['samples'] >= LLM_ROUTER_MIN_SAMPLES and model_stat['error_rate'] > LLM_ROUTER_MAX_ERROR_RATE:
+            continue
+        if model_stat['p95_ms'] is None:
+            unmeasured.append(model)
+        else:
+            ranked.append(model)
+    ranked.sort(key=lambda model: stats[model]['p95_ms'])
+    return stats, available, ranked, unmeasured
+
+
+def choose_model(tier):
+    """The model to send the next call of this tier to"""
+    models = LLM_MODEL_TIERS[tier]
+    stats, available, ranked, unmeasured = _rank(tier)
+
+    best = ranked[0] if ranked else unmeasured[0] if unmeasured else None
+    others = [model for model in available if model != best]
+    if best and others and random.random() < LLM_ROUTER_EXPLORE_RATE:
+        model, reason = random.choice(others), 'explore'
+    elif ranked:
+        model, reason = best, 'fastest'
+    elif unmeasured:
+        model, reason = best, 'unmeasured'
+    elif available:
+        # Everything available is erroring: take the least bad
+        model, reason = min(available, key=lambda model: stats[model]['error_rate']), 'least_errors'
+    else:
+        # Every breaker is open; the call short-circuits and the caller falls back
+        model, reason = models[0], 'all_unavailable'
+
+    with _lock:
+        _decisions[(tier, model)] = _decisions.get((tier, model), 0) + 1
+        previous = _preferred.get(tier)
+        if reason != 'explore':
+            _preferred[tier] = model
+
+    if reason != 'explore' and previous not in (None, model):
+        logger.info(
+            f"LLM router: tier '{tier}' moved from {previous} {_describe(stats.get(previous))} "
+            f"to {model} {_describe(stats[model])} ({reason})"
+        )
+    else:
+        logger.debug(f"LLM router: tier '{tier}' -> {model} ({reason})")
+    return model
+
+
+def choose_hedge_model(tier, primary):
+    """
+    The model a hedge for a slow call to `primary` goes to: the fastest other
+    healthy model of the tier, else primary itself.
+    """
+    _, _, ranked, unmeasured = _rank(tier)
+    others = [model for model in ranked + unmeasured if model != primary]
+    return others[0] if others else primary
+
+
+def latency_percentile(model, percentile):
+    """
+    The model's latency (ms) at `percentile` over the window, or None until
+    it has LLM_ROUTER_MIN_SAMPLES successful calls.
+    """
+    cutoff = time.monotonic() - LLM_ROUTER_WINDOW_SECONDS
+    with _lock:
+        latencies = sorted(latency_ms for at, latency_ms, failed in _samples.get(model, ()) if at >= cutoff and not failed)
+    if len(latencies) < LLM_ROUTER_MIN_SAMPLES:
+        return None
+    return _percentile(latencies, percentile)
+
+
+def _describe(model_stat):
+    if not model_stat:
+        return ""
+    return f"[p50 {model_stat['p50_ms']}ms, p95 {model_stat['p95_ms']}ms, errors {model_stat['error_rate']}, {model_stat['samples']} calls]"
+
+
+def get_router_snapshot():
+    """Per tier: the preferred model, each model's rolling stats and how often it was picked"""
+    with _lock:
+        decisions = dict(_decisions)
+        preferred = dict(_preferred)
+
+    return {
+        tier: {
+            'preferred': preferred.get(tier),
+            'models': {
+                model: dict(model_stats(model), chosen=decisions.get((tier, model), 0))
+                for model in models
+            },
+        }
+        for tier, models in LLM_MODEL_TIERS.items()
+    }
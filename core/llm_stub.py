@@ -0,0 +1,240 @@
+"""
+Local stand-in for the Groq client, selected with LLM_BACKEND = 'stub'.
+
+StubGroq exposes the same chat.completions.create() surface as groq.Groq
+(AsyncStubGroq as groq.AsyncGroq) and answers the quiz, riddle and math
+prompts from core/ai_*_generator.py with schema-valid JSON, so the level
+endpoints can be load- and latency-tested on a box without the real
+service. Latency, server errors and 429 rate-limit responses are drawn from
+the LLM_STUB_* settings; a call slower than its timeout raises APITimeoutError.
+"""
+import asyncio
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from types import SimpleNamespace
+
+import httpx
+from django.conf import settings
+from groq import APITimeoutError, InternalServerError, RateLimitError
+
+LLM_STUB_LATENCY_DISTRIBUTION = getattr(settings, 'LLM_STUB_LATENCY_DISTRIBUTION', 'lognormal')
+LLM_STUB_LATENCY_MEDIAN = getattr(settings, 'LLM_STUB_LATENCY_MEDIAN', 0.8)
+LLM_STUB_LATENCY_SPREAD = getattr(settings, 'LLM_STUB_LATENCY_SPREAD', 0.4)
+LLM_STUB_LATENCY_PER_ITEM = getattr(settings, 'LLM_STUB_LATENCY_PER_ITEM', 0.15)
+LLM_STUB_MODEL_LATENCY_MEDIANS = getattr(settings, 'LLM_STUB_MODEL_LATENCY_MEDIANS', {})
+LLM_STUB_LATENCY_MAX = getattr(settings, 'LLM_STUB_LATENCY_MAX', 15)
+LLM_STUB_ERROR_RATE = getattr(settings, 'LLM_STUB_ERROR_RATE', 0.0)
+LLM_STUB_RATE_LIMIT_RATE = getattr(settings, 'LLM_STUB_RATE_LIMIT_RATE', 0.0)
+LLM_STUB_SEED = getattr(settings, 'LLM_STUB_SEED', None)
+
+STUB_ENDPOINT = "https://stub.local/openai/v1/chat/completions"
+
+QUIZ_FACTS = [
+    ("What is the capital city of Malawi?", "Lilongwe", ["Blantyre", "Zomba", "Mzuzu"]),
+    ("Which lake forms much of Malawi's eastern border?", "Lake Malawi", ["Lake Victoria", "Lake Chilwa", "Lake Tanganyika"]),
+    ("How many legs does a spider have?", "8", ["6", "10", "4"]),
+    ("Which planet is known as the Red Planet?", "Mars", ["Venus", "Jupiter", "Saturn"]),
+    ("What do bees make?", "Honey", ["Milk", "Silk", "Wax paper"]),
+    ("Which is the largest continent?", "Asia", ["Africa", "Europe", "Australia"]),
+    ("What gas do plants take in from the air?", "Carbon dioxide", ["Oxygen", "Nitrogen", "Helium"]),
+    ("How many days are in a week?", "7", ["5", "6", "10"]),
+    ("Which animal is known as the king of the jungle?", "Lion", ["Elephant", "Zebra", "Giraffe"]),
+    ("What is water made into when it freezes?", "Ice", ["Steam", "Sand", "Salt"]),
+    ("Which river is the longest in Africa?", "The Nile", ["The Zambezi", "The Congo", "The Shire"]),
+    ("What is the main crop grown for nsima in Malawi?", "Maize", ["Rice", "Wheat", "Barley"]),
+    ("How many sides does a triangle have?", "3", ["4", "5", "6"]),
+    ("Which organ pumps blood around the body?", "The heart", ["The lungs", "The liver", "The brain"]),
+    ("What colour do you get by mixing blue and yellow?", "Green", ["Purple", "Orange", "Brown"]),
+]
+
+RIDDLES = [
+    ("I have keys but open no locks. What am I?", "A piano"),
+    ("What gets wet while drying?", "A towel"),
+    ("What has hands but cannot clap?", "A clock"),
+    ("I am full of holes but still hold water. What am I?", "A sponge"),
+    ("What goes up but never comes down?", "Your age"),
+    ("What has one eye but cannot see?", "A needle"),
+    ("What has legs but cannot walk?", "A table"),
+    ("The more you take, the more you leave behind. What are they?", "Footsteps"),
+    ("What runs all day yet never gets tired?", "A river"),
+    ("What has a neck but no head?", "A bottle"),
+    ("I shine at night without any batteries. What am I?", "The moon"),
+    ("What can you catch but never throw?", "A cold"),
+    ("What has many teeth but never bites?", "A comb"),
+    ("I am tall when young and short when old. What am I?", "A candle"),
+    ("What belongs to you but others use it more?", "Your name"),
+    ("What has a thumb and four fingers but is not alive?", "A glove"),
+    ("What flies without wings and cries without eyes?", "A cloud"),
+    ("Where does today come before yesterday?", "In a dictionary"),
+    ("What must be broken before you can use it?", "An egg"),
+    ("What has words but never speaks?", "A book"),
+]
+
+OPERATION_SYMBOLS = {'+', '-', '*', '/'}
+
+
+class StubGroq:
+    """Drop-in replacement for groq.Groq with the chat.completions.create() surface"""
+
+    def __init__(self, seed=LLM_STUB_SEED):
+        self.chat = SimpleNamespace(completions=_StubCompletions(seed))
+
+    def with_options(self, **options):
+        return self
+
+
+class AsyncStubGroq:
+    """Drop-in replacement for groq.AsyncGroq; create() is awaited and sleeps without blocking"""
+
+    def __init__(self, seed=LLM_STUB_SEED):
+        self.chat = SimpleNamespace(completions=_AsyncStubCompletions(seed))
+
+    def with_options(self, **options):
+        return self
+
+
+class _StubCompletions:
+    def __init__(self, seed):
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def create(self, model, messages, max_tokens=500, timeout=None, **kwargs):
+        latency, call = self._plan(model, messages)
+        time.sleep(min(latency, timeout) if timeout is not None else latency)
+        self._check_timeout(latency, timeout)
+        return self._respond(model, messages, max_tokens, call)
+
+    def _check_timeout(self, latency, timeout):
+        if timeout is not None and latency > timeout:
+            raise APITimeoutError(request=httpx.Request('POST', STUB_ENDPOINT))
+
+    def _plan(self, model, messages):
+        """Latency to wait before answering, plus the draws the answer depends on"""
+        prompt = " ".join(m['content'] for m in messages if m['role'] != 'system')
+        batch = re.search(r'exactly (\d+) items in "(\w+)"', prompt)
+        count = int(batch.group(1)) if batch else 1
+
+        with self._lock:
+            latency = self._sample_latency(count, LLM_STUB_MODEL_LATENCY_MEDIANS.get(model, LLM_STUB_LATENCY_MEDIAN))
+            roll = self._random.random()
+        return latency, (batch, count, roll)
+
+    def _respond(self, model, messages, max_tokens, call):
+        batch, count, roll = call
+        system = " ".join(m['content'] for m in messages if m['role'] == 'system')
+        prompt = " ".join(m['content'] for m in messages if m['role'] != 'system')
+
+        if roll < LLM_STUB_RATE_LIMIT_RATE:
+            raise RateLimitError(
+                f"Rate limit reached for model `{model}` (stub)",
+                response=httpx.Response(429, headers={'retry-after': '1'}, request=httpx.Request('POST', STUB_ENDPOINT)),
+                body=None
+            )
+        if roll < LLM_STUB_RATE_LIMIT_RATE + LLM_STUB_ERROR_RATE:
+            raise InternalServerError(
+                "Internal server error (stub)",
+                response=httpx.Response(500, request=httpx.Request('POST', STUB_ENDPOINT)),
+                body=None
+            )
+
+        with self._lock:
+            if 'math' in system:
+                items = [self._math_problem(prompt) for _ in range(count)]
+            elif 'riddle' in system:
+                items = [self._riddle(prompt) for _ in range(count)]
+            else:
+                items = [self._quiz_question(prompt) for _ in range(count)]
+
+        data = {batch.group(2): items} if batch else items[0]
+        content = json.dumps(data)
+        prompt_tokens = len(system + prompt) // 4
+        completion_tokens = min(len(content) // 4, max_tokens)
+        return SimpleNamespace(
+            id=f"stub-{uuid.uuid4().hex[:12]}",
+            model=model,
+            choices=[SimpleNamespace(
+                index=0,
+                finish_reason='stop',
+                message=SimpleNamespace(role='assistant', content=content)
+            )],
+            usage=SimpleNamespace(
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+                total_tokens=prompt_tokens + completion_tokens
+            )
+        )
+
+    def _sample_latency(self, count, median):
+        if LLM_STUB_LATENCY_DISTRIBUTION == 'fixed':
+            latency = median
+        elif LLM_STUB_LATENCY_DISTRIBUTION == 'uniform':
+            latency = self._random.uniform(median - LLM_STUB_LATENCY_SPREAD, median + LLM_STUB_LATENCY_SPREAD)
+        else:
+            # Long-tailed, like real completion times; SPREAD is sigma of the underlying normal
+            latency = self._random.lognormvariate(0, LLM_STUB_LATENCY_SPREAD) * median
+        latency += LLM_STUB_LATENCY_PER_ITEM * (count - 1)
+        return min(max(latency, 0), LLM_STUB_LATENCY_MAX)
+
+    def _quiz_question(self, prompt):
+        question, answer, wrong = self._random.choice(QUIZ_FACTS)
+        options = [answer] + list(wrong)
+        self._random.shuffle(options)
+        return {
+            'question': question,
+            'options': options,
+            'correct': 'ABCD'[options.index(answer)],
+            'explanation': f"The answer is {answer}."
+        }
+
+    def _riddle(self, prompt):
+        question, answer = self._random.choice(RIDDLES)
+        others = [other for _, other in RIDDLES if other != answer]
+        return {
+            'question': question,
+            'answer': answer,
+            'distractors': self._random.sample(others, 3),
+            'explanation': f"The answer is {answer.lower()}.",
+            'hint': f"It starts with '{answer[0]}'."
+        }
+
+    def _math_problem(self, prompt):
+        ops_match = re.search(r'operations: ([^\n.]+)\.', prompt)
+        ops = [op.strip() for op in ops_match.group(1).split(',')] if ops_match else ['+']
+        ops = [op for op in ops if op in OPERATION_SYMBOLS] or ['+']
+        range_match = re.search(r'between (-?\d+) and (-?\d+)', prompt)
+        low, high = (int(range_match.group(1)), int(range_match.group(2))) if range_match else (1, 10)
+        if high < low:
+            low, high = high, low
+
+        op = self._random.choice(ops)
+        a = self._random.randint(low, high)
+        b = self._random.randint(low, high)
+        if op == '-' and b > a:
+            a, b = b, a
+        if op == '/':
+            b = b or 1
+            a = a * b
+        answer = {'+': a + b, '-': a - b, '*': a * b, '/': a // b if b else 0}[op]
+
+        problem_text = f"{a} {op} {b}"
+        return {
+            'problem_text': problem_text,
+            'display_text': f"{problem_text} = ?",
+            'correct_answer': answer,
+            'operation': op,
+            'tip': "Take your time and check your work.",
+            'hint': f"Work out {problem_text} step by step.",
+            'explanation': f"{problem_text} equals {answer}."
+        }
+
+
+class _AsyncStubCompletions(_StubCompletions):
+    async def create(self, model, messages, max_tokens=500, timeout=None, **kwargs):
+        latency, call = self._plan(model, messages)
+        await asyncio.sleep(min(latency, timeout) if timeout is not None else latency)
+        self._check_timeout(latency, timeout)
+        return self._respond(model, messages, max_tokens, call)
@@ -0,0 +1,281 @@
+"""
+Record and replay LLM traffic, for benchmarks free of upstream variance.
+
+Recording: with LLM_TRACE_RECORD set to a file path, the completion client
+llm_client builds (Groq or the stub) is wrapped so every request it sends is
+appended to that file as one JSON line: the endpoint that caused it, model,
+messages, temperature, max_tokens, response_format, latency, outcome and the
+response content and token usage. Cache hits and calls refused before sending
+(breaker, quota, deadline) never reach the client and are not recorded.
+
+Replay: LLM_BACKEND = 'replay' swaps the client for ReplayGroq, which
+answers from the LLM_REPLAY_TRACE file after sleeping the recorded latency
+(divided by LLM_REPLAY_SPEED), and raises the recorded 429s, 500s and
+timeouts. A request is matched to the recorded calls with the same messages
+and parameters; generators vary their prompts from level to level (topics,
+riddles to avoid), so when none match it takes one recorded for the same
+system prompt and batch size, then any for the same system prompt. Matches
+are handed out in recorded order and start over when used up.
+
+The bench_levels management command drives the level endpoints against
+either mode.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from types import SimpleNamespace
+
+import httpx
+from django.conf import settings
+from groq import APITimeoutError, InternalServerError, RateLimitError
+from .llm_metrics import current_endpoint
+
+logger = logging.getLogger(__name__)
+
+LLM_TRACE_RECORD = getattr(settings, 'LLM_TRACE_RECORD', None)
+LLM_REPLAY_TRACE = str(getattr(settings, 'LLM_REPLAY_TRACE', settings.BASE_DIR / 'llm_trace.jsonl'))
+LLM_REPLAY_SPEED = getattr(settings, 'LLM_REPLAY_SPEED', 1.0)
+
+REPLAY_ENDPOINT = "https://replay.local/openai/v1/chat/completions"
+
+_write_lock = threading.Lock()
+
+
+def _outcome(error):
+    if isinstance(error, RateLimitError):
+        return 'rate_limited'
+    if isinstance(error, APITimeoutError):
+        return 'timeout'
+    return 'error'
+
+
+def _write(request, started, response=None, error=None):
+    elapsed = time.monotonic() - started
+    entry = {
+        'at': round(time.time(), 3),
+        'endpoint': current_endpoint.get(),
+        'model': request['model'],
+        'messages': request['messages'],
+        'temperature': request.get('temperature'),
+        'max_tokens': request.get('max_tokens'),
+        'response_format': request.get('response_format'),
+        'latency_ms': round(elapsed * 1000, 1),
+        'outcome': 'ok' if error is None else _outcome(error),
+    }
+    if response is not None:
+        usage = getattr(response, 'usage', None)
+        entry['content'] = response.choices[0].message.content
+        entry['usage'] = {
+            'prompt_tokens': getattr(usage, 'prompt_tokens', 0) or 0,
+            'completion_tokens': getattr(usage, 'completion_tokens', 0) or 0,
+        }
+    line = json.dumps(entry, ensure_ascii=False)
+    try:
+        with _write_lock, open(LLM_TRACE_RECORD, 'a', encoding='utf-8') as trace:
+            trace.write(line + '\n')
+    except OSError as e:
+        logger.warning(f"Could not write LLM trace entry: {e}")
+
+
+class TraceRecorder:
+    """Wraps a completion client (an async one with asynchronous=True) and records every request it sends"""
+
+    def __init__(self, inner, asynchronous=False):
+        self._inner = inner
+        self._asynchronous = asynchronous
+        completions_class = _AsyncRecordingCompletions if asynchronous else _RecordingCompletions
+        self.chat = SimpleNamespace(completions=completions_class(inner.chat.completions))
+
+    def with_options(self, **options):
+        return TraceRecorder(self._inner.with_options(**options), self._asynchronous)
+
+
+class _RecordingCompletions:
+    def __init__(self, inner):
+        self._inner = inner
+
+    def create(self, **request):
+        started = time.monotonic()
+        try:
+            response = self._inner.create(**request)
+        except Exception as e:
+            _write(request, started, error=e)
+            raise
+        _write(request, started, response=response)
+        return response
+
+
+class _AsyncRecordingCompletions(_RecordingCompletions):
+    async def create(self, **request):
+        # A cancelled call (a hedge answered first) is not recorded
+        started = time.monotonic()
+        try:
+            response = await self._inner.create(**request)
+        except Exception as e:
+            _write(request, started, error=e)
+            raise
+        _write(request, started, response=response)
+        return response
+
+
+def load_trace(path):
+    """The recorded calls in a trace file, oldest first; unreadable lines are skipped"""
+    entries = []
+    with open(path, encoding='utf-8') as trace:
+        for number, line in enumerate(trace, 1):
+            if not line.strip():
+                continue
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                logger.warning(f"Skipping malformed line {number} of LLM trace {path}")
+    return entries
+
+
+def _digest(*parts):
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def _match_keys(messages, temperature, max_tokens, response_format):
+    """Keys from the most to the least exact a request can be matched on"""
+    system = " ".join(m['content'] for m in messages if m['role'] == 'system')
+    prompt = " ".join(m['content'] for m in messages if m['role'] != 'system')
+    batch = re.search(r'exactly (\d+) items in "(\w+)"', prompt)
+    return [
+        ('exact', _digest(messages, temperature, max_tokens, response_format)),
+        ('similar', _digest(system, batch.groups() if batch else None, max_tokens)),
+        ('system', _digest(system)),
+    ]
+
+
+class _ReplayIndex:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = {}  # (match, digest) -> recorded calls
+        self._cursors = {}
+        self.stats = {'exact': 0, 'similar': 0, 'system': 0, 'missed': 0}
+
+        entries = load_trace(path)
+        for entry in entries:
+            for key in _match_keys(entry['messages'], entry.get('temperature'), entry.get('max_tokens'), entry.get('response_format')):
+                self._entries.setdefault(key, []).append(entry)
+        logger.info(f"Replaying {len(entries)} recorded LLM calls from {path}")
+
+    def next_entry(self, messages, temperature, max_tokens, response_format):
+        with self._lock:
+            for key in _match_keys(messages, temperature, max_tokens, response_format):
+                recorded = self._entries.get(key)
+                if recorded:
+                    cursor = self._cursors.get(key, 0)
+                    self._cursors[key] = cursor + 1
+                    self.stats[key[0]] += 1
+                    return recorded[cursor % len(recorded)]
+            self.stats['missed'] += 1
+            return None
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def _index(path):
+    with _indexes_lock:
+        if path not in _indexes:
+            _indexes[path] = _ReplayIndex(path)
+        return _indexes[path]
+
+
+def get_replay_stats(path=LLM_REPLAY_TRACE):
+    """How the requests replayed from the trace were matched: exact, similar, system or missed"""
+    with _indexes_lock:
+        index = _indexes.get(path)
+    return dict(index.stats) if index else None
+
+
+class ReplayGroq:
+    """Drop-in replacement for groq.Groq answering from a recorded trace"""
+
+    def __init__(self, path=LLM_REPLAY_TRACE):
+        self.chat = SimpleNamespace(completions=_ReplayCompletions(_index(path)))
+
+    def with_options(self, **options):
+        return self
+
+
+class AsyncReplayGroq:
+    """Drop-in replacement for groq.AsyncGroq answering from a recorded trace"""
+
+    def __init__(self, path=LLM_REPLAY_TRACE):
+        self.chat = SimpleNamespace(completions=_AsyncReplayCompletions(_index(path)))
+
+    def with_options(self, **options):
+        return self
+
+
+class _ReplayCompletions:
+    def __init__(self, index):
+        self._index = index
+
+    def create(self, model, messages, temperature=None, max_tokens=None, response_format=None, timeout=None, **kwargs):
+        entry, latency = self._plan(messages, temperature, max_tokens, response_format)
+        time.sleep(min(latency, timeout) if timeout is not None else latency)
+        return self._respond(model, entry, latency, timeout)
+
+    def _plan(self, messages, temperature, max_tokens, response_format):
+        entry = self._index.next_entry(messages, temperature, max_tokens, response_format)
+        if entry is None:
+            return None, 0.0
+        return entry, entry['latency_ms'] / 1000 / LLM_REPLAY_SPEED
+
+    def _respond(self, model, entry, latency, timeout):
+        request = httpx.Request('POST', REPLAY_ENDPOINT)
+        if entry is None:
+            raise InternalServerError(
+                f"No recorded call in {self._index.path} matches this request (replay)",
+                response=httpx.Response(500, request=request),
+                body=None
+            )
+        if (timeout is not None and latency > timeout) or entry['outcome'] == 'timeout':
+            raise APITimeoutError(request=request)
+        if entry['outcome'] == 'rate_limited':
+            raise RateLimitError(
+                f"Rate limit reached for model `{model}` (replay)",
+                response=httpx.Response(429, headers={'retry-after': '1'}, request=request),
+                body=None
+            )
+        if entry['outcome'] != 'ok':
+            raise InternalServerError(
+                "Internal server error (replay)",
+                response=httpx.Response(500, request=request),
+                body=None
+            )
+
+        usage = entry.get('usage') or {}
+        prompt_tokens = usage.get('prompt_tokens', 0)
+        completion_tokens = usage.get('completion_tokens', 0)
+        return SimpleNamespace(
+            id=f"replay-{entry['at']}",
+            model=model,
+            choices=[SimpleNamespace(
+                index=0,
+                finish_reason='stop',
+                message=SimpleNamespace(role='assistant', content=entry['content'])
+            )],
+            usage=SimpleNamespace(
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+                total_tokens=prompt_tokens + completion_tokens
+            )
+        )
+
+
+class _AsyncReplayCompletions(_ReplayCompletions):
+    async def create(self, model, messages, temperature=None, max_tokens=None, response_format=None, timeout=None, **kwargs):
+        entry, latency = self._plan(messages, temperature, max_tokens, response_format)
+        await asyncio.sleep(min(latency, timeout) if timeout is not None else latency)
+        return self._respond(model, entry, latency, timeout)
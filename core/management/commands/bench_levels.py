@@ -0,0 +1,86 @@
+import json
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.urls import reverse
+from core import llm_cache, llm_client, llm_trace
+from core.llm_metrics import flush_metrics
+
+ENDPOINTS = {
+    'riddle': ('get_riddle_level', 'get_riddle_level_async'),
+    'quiz': ('get_quiz_level', 'get_quiz_level_async'),
+    'math': ('get_math_level', 'get_math_level_async'),
+}
+
+
+def _percentile(latencies, pct):
+    ordered = sorted(latencies)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the riddle, quiz and math level endpoints. Run with LLM_BACKEND=replay to replay a recorded "
+        "trace with its original timings, or with LLM_TRACE_RECORD=<path> to record one."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--endpoint', choices=sorted(ENDPOINTS) + ['all'], default='all')
+        parser.add_argument('--requests', type=int, default=20, help="Level requests per endpoint.")
+        parser.add_argument('--concurrency', type=int, default=4, help="Level requests in flight at once.")
+        parser.add_argument('--level', type=int, default=1)
+        parser.add_argument('--async', action='store_true', dest='use_async', help="Benchmark the async level views.")
+        parser.add_argument('--seed', type=int, default=0, help="Seed for the generators' random choices.")
+        parser.add_argument('--use-cache', action='store_true', help="Serve repeated prompts from the LLM response cache.")
+
+    def handle(self, *args, **options):
+        if llm_client.LLM_BACKEND == 'replay':
+            self.stdout.write(f"Replaying {llm_trace.LLM_REPLAY_TRACE}")
+        else:
+            self.stdout.write(self.style.WARNING(
+                f"LLM_BACKEND is '{llm_client.LLM_BACKEND}': timings include upstream variance, use LLM_BACKEND=replay to compare runs"
+            ))
+        if llm_trace.LLM_TRACE_RECORD:
+            self.stdout.write(f"Recording LLM requests to {llm_trace.LLM_TRACE_RECORD}")
+        if not options['use_cache']:
+            # Every run must send the same calls, whatever earlier runs left in the cache
+            llm_cache.LLM_CACHE_ENABLED = False
+        random.seed(options['seed'])
+
+        names = sorted(ENDPOINTS) if options['endpoint'] == 'all' else [options['endpoint']]
+        for name in names:
+            self._bench(name, options)
+        flush_metrics()
+
+        replay_stats = llm_trace.get_replay_stats()
+        if replay_stats:
+            self.stdout.write(f"Replayed calls matched: {replay_stats}")
+            if replay_stats['missed']:
+                self.stdout.write(self.style.WARNING(f"{replay_stats['missed']} calls had no recorded response and failed"))
+        self.stdout.write(self.style.SUCCESS("✅ Benchmark complete."))
+
+    def _bench(self, name, options):
+        url = reverse(ENDPOINTS[name][1 if options['use_async'] else 0])
+
+        def one(_):
+            started = time.monotonic()
+            response = Client().get(url, {'level': options['level']})
+            latency = (time.monotonic() - started) * 1000
+            budget = json.loads(response.content).get('budget') if response.status_code == 200 else None
+            return response.status_code, latency, bool(budget and budget['exceeded'])
+
+        started = time.monotonic()
+        with ThreadPoolExecutor(options['concurrency']) as pool:
+            results = list(pool.map(one, range(options['requests'])))
+        elapsed = time.monotonic() - started
+
+        latencies = [latency for _, latency, _ in results]
+        errors = sum(1 for status, _, _ in results if status != 200)
+        over_deadline = sum(1 for _, _, exceeded in results if exceeded)
+        self.stdout.write(
+            f"{url}: {len(results)} requests in {elapsed:.1f}s  "
+            f"p50 {_percentile(latencies, 50):.0f}ms  p95 {_percentile(latencies, 95):.0f}ms  max {max(latencies):.0f}ms  "
+            f"errors {errors}  over deadline {over_deadline}"
+        )
@@ -0,0 +1,81 @@
+import random
+import time
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from core.models import QuizCategory, QuizQuestion
+from core.sampling import IdSampler
+
+AGE_BANDS = ['', '7-9', '10-12']
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark drawing a quiz level's questions with order_by('?') against core.sampling at several table "
+        "sizes. Rows are created in a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000], help="Question counts to benchmark.")
+        parser.add_argument('--categories', type=int, default=10, help="Categories the questions are spread over.")
+        parser.add_argument('--levels', type=int, default=20, help="Level loads timed per method and size.")
+        parser.add_argument('--questions', type=int, default=10, help="Questions drawn per level.")
+        parser.add_argument('--excluded', type=int, default=20, help="Answered question ids excluded per level.")
+
+    def handle(self, *args, **options):
+        for size in options['sizes']:
+            with transaction.atomic():
+                self._bench(size, options)
+                transaction.set_rollback(True)
+        self.stdout.write(self.style.SUCCESS("✅ Benchmark complete (no rows kept)."))
+
+    def _bench(self, size, options):
+        self.stdout.write(f"Creating {size} questions...")
+        categories = QuizCategory.objects.bulk_create([
+            QuizCategory(name=f"Bench {i}", difficulty='easy') for i in range(options['categories'])
+        ])
+        category_ids = [category.pk for category in categories]
+        batch = []
+        for i in range(size):
+            batch.append(QuizQuestion(
+                category_id=category_ids[i % len(category_ids)],
+                question_text=f"Benchmark question {i}",
+                option_a='A', option_b='B', option_c='C', option_d='D',
+                correct_option='A',
+                age_band=AGE_BANDS[i % len(AGE_BANDS)]
+            ))
+            if len(batch) == 5000:
+                QuizQuestion.objects.bulk_create(batch)
+                batch = []
+        QuizQuestion.objects.bulk_create(batch)
+        question_ids = list(QuizQuestion.objects.filter(category_id__in=category_ids).values_list('pk', flat=True)[:1000])
+
+        def level_filters():
+            return random.sample(category_ids, 2), ['', random.choice(AGE_BANDS[1:])], random.sample(question_ids, options['excluded'])
+
+        def order_by_random():
+            level_categories, age_bands, excluded = level_filters()
+            query = QuizQuestion.objects.filter(
+                category__in=level_categories, is_active=True, age_band__in=age_bands
+            ).exclude(id__in=excluded)
+            query.count()
+            return list(query.order_by('?')[:options['questions']])
+
+        # A fresh sampler, so its build is timed and includes this transaction's rows
+        sampler = IdSampler(QuizQuestion, ['category_id', 'age_band'])
+        started = time.perf_counter()
+        sampler.queue()
+        build_ms = (time.perf_counter() - started) * 1000
+
+        def sampled():
+            level_categories, age_bands, excluded = level_filters()
+            queue = sampler.queue(exclude=excluded, category_id=level_categories, age_band=age_bands)
+            len(queue)
+            return queue.take(options['questions'])
+
+        for name, draw in (("order_by('?')", order_by_random), ('sampling', sampled)):
+            started = time.perf_counter()
+            for _ in range(options['levels']):
+                rows = draw()
+            per_level_ms = (time.perf_counter() - started) * 1000 / options['levels']
+            self.stdout.write(f"  {size:>8} questions  {name:<14} {per_level_ms:8.2f} ms per level ({len(rows)} rows)")
+        self.stdout.write(f"  {size:>8} questions  sampler built once in {build_ms:.0f} ms")
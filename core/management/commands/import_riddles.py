@@ -0,0 +1,82 @@
+import csv
+import json
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from core.category_catalog import invalidate_category_catalog
+from core.distractor_index import invalidate_distractor_index
+from core.models import RiddleCategory, RiddleQuestion
+from core.sampling import RIDDLE_QUESTIONS
+from core.near_duplicates import NearDuplicateIndex, ensure_riddle_index, find_stored_riddle_duplicate, index_riddles, sketch
+
+
+class Command(BaseCommand):
+    help = "Import riddles from a JSON or CSV file, skipping near-duplicates of stored riddles and of each other."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="JSON list of {question, answer, explanation} objects, or a CSV file with those columns.")
+        parser.add_argument('--category', required=True, help="Name of the riddle category to import into.")
+        parser.add_argument('--difficulty', default='easy', choices=[choice for choice, _ in RiddleCategory.DIFFICULTY_CHOICES],
+                            help="Difficulty of the category when it has to be created.")
+        parser.add_argument('--dry-run', action='store_true', help="Report what would be imported without saving anything.")
+
+    def handle(self, *args, **options):
+        rows = self.read_rows(options['path'])
+
+        indexed = ensure_riddle_index()
+        if indexed:
+            self.stdout.write(f"Indexed {indexed} stored riddles for near-duplicate checks")
+
+        batch_index = NearDuplicateIndex()
+        new_riddles = []
+        duplicates = 0
+        invalid = 0
+        for row in rows:
+            question = (row.get('question') or '').strip()
+            answer = (row.get('answer') or '').strip()
+            if not question or not answer:
+                invalid += 1
+                continue
+
+            riddle_sketch = sketch(question)
+            if batch_index.contains(riddle_sketch) or find_stored_riddle_duplicate(riddle_sketch):
+                duplicates += 1
+                continue
+            batch_index.add(riddle_sketch)
+            new_riddles.append(RiddleQuestion(
+                question_text=question,
+                answer=answer,
+                explanation=(row.get('explanation') or '').strip()
+            ))
+
+        self.stdout.write(f"{len(rows)} rows: {len(new_riddles)} new, {duplicates} near-duplicates, {invalid} invalid")
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING("Dry run - nothing saved."))
+            return
+
+        with transaction.atomic():
+            category, _ = RiddleCategory.objects.get_or_create(
+                name=options['category'],
+                defaults={'difficulty': options['difficulty']}
+            )
+            for riddle in new_riddles:
+                riddle.category = category
+            RiddleQuestion.objects.bulk_create(new_riddles)
+            index_riddles(new_riddles)
+        invalidate_distractor_index()
+        invalidate_category_catalog('riddle')
+        RIDDLE_QUESTIONS.invalidate()
+
+        self.stdout.write(self.style.SUCCESS(f"✅ Imported {len(new_riddles)} riddles into '{category.name}'"))
+
+    def read_rows(self, path):
+        try:
+            with open(path, encoding='utf-8') as f:
+                if path.lower().endswith('.csv'):
+                    return list(csv.DictReader(f))
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Could not read {path}: {e}")
+
+        if not isinstance(data, list):
+            raise CommandError("JSON file must contain a list of riddles")
+        return [row for row in data if isinstance(row, dict)]
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from core import llm_cache
+
+
+class Command(BaseCommand):
+    help = "Show hit/miss counters and size of the persistent LLM response cache."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clear', action='store_true', help="Delete every cached response and reset the counters.")
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            llm_cache.clear()
+            self.stdout.write(self.style.SUCCESS("✅ LLM cache cleared."))
+            return
+
+        stats = llm_cache.get_stats()
+        total = stats['total']
+        self.stdout.write(f"Entries: {stats['entries']} / {stats['max_entries']} ({stats['keys']} keys, {stats['variants_per_key']} variants per key)")
+        self.stdout.write(f"TTL: {stats['ttl']}s")
+        self.stdout.write(f"Hits: {total['hits']}  Misses: {total['misses']}  Stores: {total['stores']}  Evictions: {total['evictions']}")
+        self.stdout.write(self.style.SUCCESS(f"✅ Hit rate: {stats['hit_rate']:.1%}"))
@@ -0,0 +1,91 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Sum
+from django.utils import timezone
+from core.llm_metrics import (
+    LATENCY_BUCKETS_MS, LLM_METRICS_RETENTION_DAYS, flush_metrics, histogram_percentile, new_histogram, observe,
+    prune_metrics,
+)
+from core.models import LLMMetricEvent
+
+
+class Command(BaseCommand):
+    help = "Summarise streamed time to first question, recorded LLM calls (latency histograms, tokens, outcomes), validation failures, fallbacks and hedged requests per endpoint."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--minutes', type=int, default=60, help="Only include events from the last N minutes.")
+        parser.add_argument('--endpoint', help="Only include events for this endpoint path.")
+        parser.add_argument('--histogram', action='store_true', help="Print the full latency histogram for every row.")
+        parser.add_argument('--keep', action='store_true', help=f"Don't delete events older than {LLM_METRICS_RETENTION_DAYS} days.")
+
+    def handle(self, *args, **options):
+        flush_metrics()
+        pruned = 0 if options['keep'] else prune_metrics()
+
+        events = LLMMetricEvent.objects.filter(created_at__gte=timezone.now() - timedelta(minutes=options['minutes']))
+        if options['endpoint']:
+            events = events.filter(endpoint=options['endpoint'])
+
+        first_items = {}
+        for endpoint, kind, latency_ms in events.filter(event='first_item').values_list('endpoint', 'model', 'latency_ms').iterator():
+            observe(first_items.setdefault((endpoint, kind), new_histogram()), latency_ms or 0)
+
+        self.stdout.write(self.style.MIGRATE_HEADING("Time to first question (streamed levels)"))
+        if not first_items:
+            self.stdout.write("  (none)")
+        for (endpoint, kind), histogram in sorted(first_items.items()):
+            self.stdout.write(
+                f"  {endpoint}  {kind}: {sum(histogram)} levels, "
+                f"p50 <={histogram_percentile(histogram, 50)}ms, p95 <={histogram_percentile(histogram, 95)}ms"
+            )
+
+        calls = {}
+        for endpoint, model, outcome, latency_ms, prompt_tokens, completion_tokens in (
+            events.filter(event='call')
+            .values_list('endpoint', 'model', 'outcome', 'latency_ms', 'prompt_tokens', 'completion_tokens')
+            .iterator()
+        ):
+            stats = calls.setdefault((endpoint, model, outcome), {
+                'count': 0, 'latency_ms_total': 0, 'prompt_tokens': 0, 'completion_tokens': 0, 'histogram': new_histogram()
+            })
+            stats['count'] += 1
+            stats['latency_ms_total'] += latency_ms or 0
+            stats['prompt_tokens'] += prompt_tokens
+            stats['completion_tokens'] += completion_tokens
+            observe(stats['histogram'], latency_ms or 0)
+
+        self.stdout.write(self.style.MIGRATE_HEADING(f"LLM calls in the last {options['minutes']} minutes"))
+        if not calls:
+            self.stdout.write("  (none)")
+        for (endpoint, model, outcome), stats in sorted(calls.items()):
+            self.stdout.write(
+                f"  {endpoint}  {model}  {outcome}: {stats['count']} calls, "
+                f"avg {stats['latency_ms_total'] / stats['count']:.0f}ms, "
+                f"p50 <={histogram_percentile(stats['histogram'], 50)}ms, "
+                f"p95 <={histogram_percentile(stats['histogram'], 95)}ms, "
+                f"tokens {stats['prompt_tokens']} in / {stats['completion_tokens']} out"
+            )
+            if options['histogram']:
+                labels = [f"<={bound}" for bound in LATENCY_BUCKETS_MS] + [f">{LATENCY_BUCKETS_MS[-1]}"]
+                self.stdout.write("    " + "  ".join(f"{label}:{count}" for label, count in zip(labels, stats['histogram'])))
+
+        for event, title in (('validation_failure', "Validation failures"), ('fallback', "Fallbacks"), ('hedge', "Hedged requests")):
+            rows = (
+                events.filter(event=event)
+                .values('endpoint', 'model', 'outcome')
+                .annotate(total=Count('id'))
+                .order_by('endpoint', '-total')
+            )
+            self.stdout.write(self.style.MIGRATE_HEADING(title))
+            if not rows:
+                self.stdout.write("  (none)")
+            for row in rows:
+                self.stdout.write(f"  {row['endpoint']}  {row['model']}  {row['outcome']}: {row['total']}")
+
+        totals = events.filter(event='call').aggregate(prompt=Sum('prompt_tokens'), completion=Sum('completion_tokens'))
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {sum(stats['count'] for stats in calls.values())} calls, "
+            f"{totals['prompt'] or 0} prompt / {totals['completion'] or 0} completion tokens"
+        ))
+        if pruned:
+            self.stdout.write(self.style.SUCCESS(f"✅ Deleted {pruned} events older than {LLM_METRICS_RETENTION_DAYS} days"))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from core.seen_questions import SEEN_QUESTIONS_SESSION_RETENTION_DAYS, prune_seen_sets
+
+
+class Command(BaseCommand):
+    help = "Delete the seen-question sets of learners who are not signed in once they expire."
+
+    def handle(self, *args, **options):
+        deleted = prune_seen_sets()
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Deleted {deleted} session seen-question sets not updated for {SEEN_QUESTIONS_SESSION_RETENTION_DAYS} days."
+        ))
@@ -0,0 +1,33 @@
+import time
+from django.core.management.base import BaseCommand
+from core.ai_question_pool import (
+    POOL_LOW_WATER_MARK,
+    POOL_TARGET_SIZE,
+    refill_question_pool,
+)
+from core.llm_metrics import current_endpoint, flush_metrics
+
+
+class Command(BaseCommand):
+    help = "Top up the pre-generated AI quiz question pool for every key below its low-water mark."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help="Keep running and refill every --interval seconds.")
+        parser.add_argument('--interval', type=int, default=60, help="Seconds between refill passes when looping.")
+        parser.add_argument('--low-water-mark', type=int, default=POOL_LOW_WATER_MARK)
+        parser.add_argument('--target-size', type=int, default=POOL_TARGET_SIZE)
+
+    def handle(self, *args, **options):
+        current_endpoint.set('refill_question_pool')
+        while True:
+            self.stdout.write(self.style.WARNING("Refilling AI question pool..."))
+            added = refill_question_pool(
+                low_water_mark=options['low_water_mark'],
+                target_size=options['target_size']
+            )
+            flush_metrics()
+            self.stdout.write(self.style.SUCCESS(f"✅ Added {added} questions to the pool."))
+
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from core.riddle_level_sync import sync_riddle_levels
+
+
+class Command(BaseCommand):
+    help = "Create or update the riddle levels and categories to match the quiz levels."
+
+    def handle(self, *args, **options):
+        counts = sync_riddle_levels()
+        self.stdout.write(f"Categories: {counts['categories_created']} created, {counts['categories_updated']} updated")
+        self.stdout.write(f"Levels: {counts['levels_created']} created, {counts['levels_updated']} updated")
+        self.stdout.write(self.style.SUCCESS("✅ Riddle levels are in sync with the quiz levels."))
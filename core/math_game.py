@@ -1,13 +1,20 @@
 import json
 import random
 import logging
+from asgiref.sync import sync_to_async
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.shortcuts import render
-from .models import MathGameLevel, MathGameProblem, MathGameSession, UserMathProgress
-from .game_utils import filter_by_age_appropriate, get_age_from_birthdate, get_difficulty_by_age
-from .ai_math_generator import generate_ai_math_problem
+from .models import MathGameLevel, MathGameSession, UserMathProgress
+from .game_utils import get_learner
+from .ai_math_generator import agenerate_ai_math_problems_batch, generate_ai_math_problems_batch
+from .ai_harvest import harvest_math_problem, plan_ai_slots
+from .llm_metrics import record_fallback
+from .level_assembly import afan_out_batches, fan_out_batches
+from .deadlines import budget_report, spending, with_level_budget
+from .level_catalog import get_level
+from .sampling import MATH_PROBLEMS
 
 logger = logging.getLogger(__name__)
 
@@ -34,25 +41,23 @@ def build_math_hint(operation, num1, num2):
         return f"See how many groups of {num2} fit into {num1}."
     return "Look at the numbers carefully and solve step by step."
 
-def generate_math_problem(level, user=None, level_config=None):
+def generate_math_problem(level, user_age=None, level_config=None):
     """Generate a math problem based on level configuration, adjusted for user age"""
-    level_config = level_config or MathGameLevel.objects.get(level_number=level)
+    level_config = level_config or get_level('math', level)
     operations = level_config.operations or ['+']
     min_num = level_config.number_range_min
     max_num = level_config.number_range_max
     
     # Adjust difficulty based on user age
-    if user and hasattr(user, 'profile') and user.profile.date_of_birth:
-        user_age = get_age_from_birthdate(user.profile.date_of_birth)
-        if user_age:
-            # Adjust number ranges based on age
-            if user_age <= 6:
-                # Ages 3-6: easier numbers
-                max_num = min(max_num, 10)
-            elif user_age <= 9:
-                # Ages 7-9: medium numbers
-                max_num = min(max_num, 20)
-            # Ages 10+: keep original ranges
+    if user_age:
+        # Adjust number ranges based on age
+        if user_age <= 6:
+            # Ages 3-6: easier numbers
+            max_num = min(max_num, 10)
+        elif user_age <= 9:
+            # Ages 7-9: medium numbers
+            max_num = min(max_num, 20)
+        # Ages 10+: keep original ranges
     
     operation = random.choice(operations)
     
@@ -122,75 +127,131 @@ def extract_numbers(problem_text):
         pass
     return 0, 0
 
+def _prepare_math_level(request):
+    """
+    Resolve the level, learner age band and candidate database problems for a
+    math level request. Shared by the sync and async level views; raises
+    MathGameLevel.DoesNotExist.
+    """
+    level_number = int(request.GET.get('level', 1))
+    
+    # Level numbers are unique, so age filtering always fell back to this level
+    level = get_level('math', level_number)
+    learner = get_learner(request)
+    user_age = learner.age
+    age_band = learner.age_band
+    
+    # Seeded problems plus problems harvested from AI output for this age band;
+    # harvesting grows the table, so only the rows a level can use are fetched
+    db_queue = MATH_PROBLEMS.queue(level_id=[level.pk], age_band=['', age_band])
+    available_db_problems = len(db_queue)
+    
+    return {
+        'level': level,
+        'level_number': level_number,
+        'user_age': user_age,
+        'age_band': age_band,
+        # AI slots that fail are filled from the database too, so take a full level's worth
+        'db_problems': db_queue.take(level.problems_required),
+        # Only the growth share of the level (or what the database can't cover) goes to the AI
+        'ai_slots': plan_ai_slots(level.problems_required, available_db_problems),
+    }
+
+def _math_batch_arguments(state):
+    level = state['level']
+    return {
+        'difficulty': level.difficulty,
+        'operations': level.operations,
+        'min_value': level.number_range_min,
+        'max_value': level.number_range_max,
+        'age': state['user_age'] or 10,
+        # The AI slots (plan_ai_slots) grow coverage: ask for new problems, not cached ones
+        'fresh': True,
+    }
+
+def _assemble_math_level(state, ai_problems):
+    """Build the level response from the AI problems (None for failed slots), filling gaps from the database"""
+    level = state['level']
+    db_problems = state['db_problems']
+    ai_slots = state['ai_slots']
+    ai_problems = list(ai_problems) + [None] * (level.problems_required - ai_slots)
+    
+    problems = []
+    ai_problems_count = 0
+    db_problems_count = 0
+    
+    for index, problem in enumerate(ai_problems):
+        if problem is None and index < ai_slots:
+            record_fallback("math problem", "db" if db_problems else "generated", "ai_error")
+        if problem is not None:
+            problem['display_text'] = problem.get('display_text') or f"{problem.get('problem_text')} = ?"
+            problem['tip'] = problem.get('tip') or build_math_tip(problem.get('operation', '+'))
+            problem['hint'] = problem.get('hint') or build_math_hint(problem.get('operation', '+'), 0, 0)
+            problem['explanation'] = problem.get('explanation') or f"{problem['problem_text']} = {problem['correct_answer']}"
+            problem['is_ai'] = True
+            harvest_math_problem(level, problem, problem.get('model', ''), state['age_band'])
+            ai_problems_count += 1
+        elif db_problems:
+            db_problem = db_problems.pop(0)
+            problem = serialize_db_problem(db_problem)
+            db_problems_count += 1
+        else:
+            problem = generate_math_problem(state['level_number'], state['user_age'], level_config=level)
+        problems.append(problem)
+    
+    return {
+        'level_number': level.level_number,
+        'difficulty': level.difficulty,
+        'time_limit': level.time_limit,
+        'problems_required': level.problems_required,
+        'points_per_problem': level.points_per_problem,
+        'operations': level.operations,
+        'problems': problems,
+        'ai_problems_count': ai_problems_count,
+        'db_problems_count': db_problems_count
+    }
+
+@with_level_budget
 def get_math_level(request):
     """Get math problems for a specific level, filtered by user age"""
-    level_number = int(request.GET.get('level', 1))
+    try:
+        with spending('db'):
+            state = _prepare_math_level(request)
+    except MathGameLevel.DoesNotExist:
+        return JsonResponse({'error': 'Level not found'}, status=404)
     
+    # AI slots go out in concurrent batches; slots that failed or were not
+    # ready by the level's deadline come back as None
+    arguments = _math_batch_arguments(state)
+    with spending('ai'):
+        ai_problems = fan_out_batches(
+            lambda count: generate_ai_math_problems_batch(count=count, **arguments),
+            state['ai_slots']
+        )
+    with spending('db'):
+        level_data = _assemble_math_level(state, ai_problems)
+    level_data['budget'] = budget_report()
+    return JsonResponse(level_data)
+
+@with_level_budget
+async def get_math_level_async(request):
+    """get_math_level as an async view: the AI batches are awaited on the event loop"""
     try:
-        # Filter levels by age-appropriate difficulty
-        levels = MathGameLevel.objects.filter(level_number=level_number)
-        user = request.user if request.user.is_authenticated else None
-        levels_query = filter_by_age_appropriate(user, levels, 'difficulty')
-        level = levels_query.first()
-        
-        if not level:
-            # Fallback to default level if age filtering removes it
-            level = MathGameLevel.objects.get(level_number=level_number)
-        
-        user_age = None
-        if user and hasattr(user, 'profile') and user.profile.date_of_birth:
-            user_age = get_age_from_birthdate(user.profile.date_of_birth)
-        
-        db_problems = list(MathGameProblem.objects.filter(level=level, is_active=True))
-        random.shuffle(db_problems)
-        
-        problems = []
-        ai_problems_count = 0
-        db_problems_count = 0
-        
-        for idx in range(level.problems_required):
-            problem = None
-            try:
-                problem = generate_ai_math_problem(
-                    difficulty=level.difficulty,
-                    operations=level.operations,
-                    min_value=level.number_range_min,
-                    max_value=level.number_range_max,
-                    age=user_age or 10,
-                    problem_number=idx + 1
-                )
-                problem['display_text'] = problem.get('display_text') or f"{problem.get('problem_text')} = ?"
-                problem['tip'] = problem.get('tip') or build_math_tip(problem.get('operation', '+'))
-                problem['hint'] = problem.get('hint') or build_math_hint(problem.get('operation', '+'), 0, 0)
-                problem['explanation'] = problem.get('explanation') or f"{problem['problem_text']} = {problem['correct_answer']}"
-                problem['is_ai'] = True
-                ai_problems_count += 1
-            except Exception as exc:
-                logger.debug("AI math problem failed: %s", exc)
-                if db_problems:
-                    db_problem = db_problems.pop(0)
-                    problem = serialize_db_problem(db_problem)
-                    db_problems_count += 1
-                else:
-                    problem = generate_math_problem(level_number, user, level_config=level)
-            problems.append(problem)
-        
-        level_data = {
-            'level_number': level.level_number,
-            'difficulty': level.difficulty,
-            'time_limit': level.time_limit,
-            'problems_required': level.problems_required,
-            'points_per_problem': level.points_per_problem,
-            'operations': level.operations,
-            'problems': problems,
-            'ai_problems_count': ai_problems_count,
-            'db_problems_count': db_problems_count
-        }
-        
-        return JsonResponse(level_data)
-        
+        with spending('db'):
+            state = await sync_to_async(_prepare_math_level)(request)
     except MathGameLevel.DoesNotExist:
         return JsonResponse({'error': 'Level not found'}, status=404)
+    
+    arguments = _math_batch_arguments(state)
+    with spending('ai'):
+        ai_problems = await afan_out_batches(
+            lambda count: agenerate_ai_math_problems_batch(count=count, **arguments),
+            state['ai_slots']
+        )
+    with spending('db'):
+        level_data = await sync_to_async(_assemble_math_level)(state, ai_problems)
+    level_data['budget'] = budget_report()
+    return JsonResponse(level_data)
 
 @csrf_exempt
 @require_http_methods(["POST"])
@@ -269,15 +330,7 @@ def get_next_math_level(request):
     next_level = current_level + 1
     
     try:
-        # Filter levels by age-appropriate difficulty
-        levels = MathGameLevel.objects.filter(level_number=next_level)
-        user = request.user if request.user.is_authenticated else None
-        levels_query = filter_by_age_appropriate(user, levels, 'difficulty')
-        level = levels_query.first()
-        
-        if not level:
-            # Fallback to default level if age filtering removes it
-            level = MathGameLevel.objects.get(level_number=next_level)
+        level = get_level('math', next_level)
         
         return JsonResponse({
             'level_number': level.level_number,
@@ -1,17 +1,73 @@
 # auth/middleware.py
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings as django_settings
 from django.shortcuts import redirect
 from django.urls import reverse
 from django.utils.cache import add_never_cache_headers
+from whitenoise.middleware import WhiteNoiseMiddleware
+from .game_utils import LearnerContext, get_learner
+from .llm_metrics import current_endpoint
+from .llm_quota import INTERACTIVE, call_priority
+
+class LearnerContextMiddleware:
+    """
+    Give every request a lazy request.learner (core.game_utils.LearnerContext)
+    so the profile, age and difficulty are worked out once per request
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        request.learner = LearnerContext(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        request.learner = LearnerContext(request)
+        return await self.get_response(request)
+
 
 class ProfileSetupMiddleware:
     """
     Middleware to ensure users complete their profile setup
     before accessing other pages
     """
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
         
     def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        redirect_response = self._profile_redirect(request)
+        if redirect_response:
+            return redirect_response
+        
+        response = self.get_response(request)
+        return self._add_no_cache_headers(request, response)
+
+    async def __acall__(self, request):
+        # request.user is loaded from the database on first access
+        redirect_response = await sync_to_async(self._profile_redirect)(request)
+        if redirect_response:
+            return redirect_response
+
+        response = await self.get_response(request)
+        return self._add_no_cache_headers(request, response)
+
+    def _profile_redirect(self, request):
         # URLs that should be accessible without profile completion
         allowed_urls = [
             reverse('login'),
@@ -23,19 +79,15 @@ class ProfileSetupMiddleware:
         ]
         
         # Check if user is authenticated and profile is not completed
-        if request.user.is_authenticated:
-            try:
-                profile = request.user.profile
-                if not profile.profile_completed:
-                    # Allow access to profile setup and allowed URLs
-                    if not any(request.path.startswith(url) for url in allowed_urls):
-                        return redirect('profile_setup')
-            except:
-                # If profile doesn't exist, create it
-                pass
-        
-        response = self.get_response(request)
-        
+        # (the learner context keeps the profile for the views)
+        profile = get_learner(request).profile
+        if profile is not None and not profile.profile_completed:
+            # Allow access to profile setup and allowed URLs
+            if not any(request.path.startswith(url) for url in allowed_urls):
+                return redirect('profile_setup')
+        return None
+
+    def _add_no_cache_headers(self, request, response):
         # Add no-cache headers for authenticated users to prevent back button access
         if request.user.is_authenticated:
             add_never_cache_headers(response)
@@ -43,4 +95,70 @@ class ProfileSetupMiddleware:
             response['Pragma'] = 'no-cache'
             response['Expires'] = '0'
         
-        return response
\ No newline at end of file
+        return response
+
+
+class LLMEndpointMiddleware:
+    """
+    Attribute LLM calls made while handling a request to its path
+    (see core.llm_metrics) and give them interactive priority under the
+    Groq quota (see core.llm_quota)
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        token = current_endpoint.set(request.path)
+        priority_token = call_priority.set(INTERACTIVE)
+        try:
+            return self.get_response(request)
+        finally:
+            call_priority.reset(priority_token)
+            current_endpoint.reset(token)
+
+    async def __acall__(self, request):
+        token = current_endpoint.set(request.path)
+        priority_token = call_priority.set(INTERACTIVE)
+        try:
+            return await self.get_response(request)
+        finally:
+            call_priority.reset(priority_token)
+            current_endpoint.reset(token)
+
+
+class AsyncWhiteNoiseMiddleware(WhiteNoiseMiddleware):
+    """
+    WhiteNoiseMiddleware that also runs in async mode. The stock middleware
+    is sync-only, which makes Django run every request under ASGI - async
+    level views included - in a thread. Static lookups need no I/O beyond a
+    file stat, so they are answered inline.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, settings=django_settings):
+        super().__init__(get_response, settings)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = self.find_file(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return self.serve(static_file, request)
+        return await self.get_response(request)
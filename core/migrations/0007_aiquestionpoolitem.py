@@ -0,0 +1,33 @@
+# Generated by Django 4.2.26 on 2026-10-17 17:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_riddlecategory_userriddleprogress_riddlequestion_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AIQuestionPoolItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('difficulty', models.CharField(choices=[('easy', 'Easy'), ('medium', 'Medium'), ('hard', 'Hard'), ('expert', 'Expert')], max_length=10)),
+                ('age_band', models.CharField(max_length=10)),
+                ('topic', models.CharField(max_length=100)),
+                ('question_text', models.TextField()),
+                ('options', models.JSONField(default=list)),
+                ('correct_option', models.CharField(max_length=1)),
+                ('explanation', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'AI Question Pool Item',
+                'verbose_name_plural': 'AI Question Pool',
+                'ordering': ['created_at'],
+                'indexes': [models.Index(fields=['difficulty', 'age_band', 'topic', 'created_at'], name='core_aiques_difficu_82f61c_idx')],
+            },
+        ),
+    ]
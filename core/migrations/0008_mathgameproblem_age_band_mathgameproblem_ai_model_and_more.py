@@ -0,0 +1,111 @@
+# Generated by Django 4.2.26 on 2026-10-17 17:58
+
+import hashlib
+import re
+
+from django.db import migrations, models
+
+
+def _content_hash(*parts):
+    # Frozen copy of core.ai_harvest.content_hash
+    normalized = "|".join(" ".join(re.sub(r'[^\w\s]', ' ', str(part).lower()).split()) for part in parts)
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+def backfill_content_hashes(apps, schema_editor):
+    """Hash the seeded rows so harvested AI items are deduplicated against them"""
+    for model_name in ('QuizQuestion', 'RiddleQuestion'):
+        model = apps.get_model('core', model_name)
+        rows = list(model.objects.only('pk', 'question_text'))
+        for row in rows:
+            row.content_hash = _content_hash(row.question_text)
+        model.objects.bulk_update(rows, ['content_hash'], batch_size=500)
+
+    MathGameProblem = apps.get_model('core', 'MathGameProblem')
+    rows = list(MathGameProblem.objects.only('pk', 'level_id', 'problem_text'))
+    for row in rows:
+        row.content_hash = _content_hash(row.level_id, row.problem_text)
+    MathGameProblem.objects.bulk_update(rows, ['content_hash'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_aiquestionpoolitem'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mathgameproblem',
+            name='age_band',
+            field=models.CharField(blank=True, max_length=10),
+        ),
+        migrations.AddField(
+            model_name='mathgameproblem',
+            name='ai_model',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='mathgameproblem',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='mathgameproblem',
+            name='source',
+            field=models.CharField(choices=[('seed', 'Seed'), ('ai', 'AI')], default='seed', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='quizquestion',
+            name='age_band',
+            field=models.CharField(blank=True, max_length=10),
+        ),
+        migrations.AddField(
+            model_name='quizquestion',
+            name='ai_model',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='quizquestion',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='quizquestion',
+            name='source',
+            field=models.CharField(choices=[('seed', 'Seed'), ('ai', 'AI')], default='seed', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='riddlequestion',
+            name='age_band',
+            field=models.CharField(blank=True, max_length=10),
+        ),
+        migrations.AddField(
+            model_name='riddlequestion',
+            name='ai_model',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='riddlequestion',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='riddlequestion',
+            name='source',
+            field=models.CharField(choices=[('seed', 'Seed'), ('ai', 'AI')], default='seed', max_length=10),
+        ),
+        migrations.AddIndex(
+            model_name='mathgameproblem',
+            index=models.Index(fields=['level', 'is_active'], name='core_mathga_level_i_62ae26_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='quizquestion',
+            index=models.Index(fields=['category', 'is_active', 'age_band'], name='core_quizqu_categor_e6dde2_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='riddlequestion',
+            index=models.Index(fields=['category', 'is_active', 'age_band'], name='core_riddle_categor_58fa29_idx'),
+        ),
+        migrations.RunPython(backfill_content_hashes, migrations.RunPython.noop),
+    ]
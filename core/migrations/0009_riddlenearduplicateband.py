@@ -0,0 +1,22 @@
+# Generated by Django 4.2.26 on 2026-10-17 18:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_mathgameproblem_age_band_mathgameproblem_ai_model_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RiddleNearDuplicateBand',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('band_key', models.CharField(db_index=True, max_length=20)),
+                ('riddle', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lsh_bands', to='core.riddlequestion')),
+            ],
+        ),
+    ]
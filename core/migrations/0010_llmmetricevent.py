@@ -0,0 +1,33 @@
+# Generated by Django 4.2.26 on 2026-10-17 18:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_riddlenearduplicateband'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LLMMetricEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event', models.CharField(choices=[('call', 'Call'), ('validation_failure', 'Validation failure'), ('fallback', 'Fallback')], max_length=20)),
+                ('endpoint', models.CharField(max_length=200)),
+                ('model', models.CharField(max_length=100)),
+                ('outcome', models.CharField(max_length=100)),
+                ('latency_ms', models.IntegerField(blank=True, null=True)),
+                ('prompt_tokens', models.IntegerField(default=0)),
+                ('completion_tokens', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'verbose_name': 'LLM Metric Event',
+                'verbose_name_plural': 'LLM Metric Events',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['event', 'endpoint', 'created_at'], name='core_llmmet_event_356285_idx')],
+            },
+        ),
+    ]
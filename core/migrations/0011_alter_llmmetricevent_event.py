@@ -0,0 +1,18 @@
+# Generated by Django 4.2.26 on 2026-10-17 18:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_llmmetricevent'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='llmmetricevent',
+            name='event',
+            field=models.CharField(choices=[('call', 'Call'), ('validation_failure', 'Validation failure'), ('fallback', 'Fallback'), ('first_item', 'Time to first item')], max_length=20),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.26 on 2026-10-17 18:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_alter_llmmetricevent_event'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='llmmetricevent',
+            name='event',
+            field=models.CharField(choices=[('call', 'Call'), ('validation_failure', 'Validation failure'), ('fallback', 'Fallback'), ('first_item', 'Time to first item'), ('hedge', 'Hedged request')], max_length=20),
+        ),
+    ]
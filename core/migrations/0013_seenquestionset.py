@@ -0,0 +1,30 @@
+# Generated by Django 4.2.26 on 2026-10-17 18:42
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('core', '0012_alter_llmmetricevent_event'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SeenQuestionSet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('session_id', models.CharField(blank=True, max_length=100)),
+                ('kind', models.CharField(choices=[('quiz', 'Quiz question'), ('riddle', 'Riddle')], max_length=10)),
+                ('bitmap', models.BinaryField(default=b'')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='seen_question_sets', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'kind'], name='core_seenqu_user_id_9117f7_idx'), models.Index(fields=['session_id', 'kind'], name='core_seenqu_session_306bf3_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.26 on 2026-10-17 18:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_seenquestionset'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='aiquestionpoolitem',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+    ]
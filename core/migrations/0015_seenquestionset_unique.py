@@ -0,0 +1,42 @@
+# Generated by Django 4.2.26 on 2026-10-17 19:00
+
+from django.db import migrations, models
+
+
+def drop_duplicate_sets(apps, schema_editor):
+    """Keep the most recently updated set of each learner and kind"""
+    SeenQuestionSet = apps.get_model('core', 'SeenQuestionSet')
+    kept = set()
+    for row in SeenQuestionSet.objects.order_by('-updated_at', '-pk').values('pk', 'user_id', 'session_id', 'kind'):
+        key = (row['user_id'], '' if row['user_id'] else row['session_id'], row['kind'])
+        if key in kept:
+            SeenQuestionSet.objects.filter(pk=row['pk']).delete()
+        else:
+            kept.add(key)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_aiquestionpoolitem_content_hash'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='seenquestionset',
+            name='core_seenqu_user_id_9117f7_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='seenquestionset',
+            name='core_seenqu_session_306bf3_idx',
+        ),
+        migrations.RunPython(drop_duplicate_sets, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='seenquestionset',
+            constraint=models.UniqueConstraint(condition=models.Q(('user__isnull', False)), fields=('user', 'kind'), name='seen_set_unique_user_kind'),
+        ),
+        migrations.AddConstraint(
+            model_name='seenquestionset',
+            constraint=models.UniqueConstraint(condition=models.Q(('user__isnull', True)), fields=('session_id', 'kind'), name='seen_set_unique_session_kind'),
+        ),
+    ]
@@ -6,6 +6,12 @@ from django.contrib.auth.models import User
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 
+# Where a stored game item came from; 'ai' items are harvested from validated AI output
+CONTENT_SOURCE_CHOICES = [
+    ('seed', 'Seed'),
+    ('ai', 'AI'),
+]
+
 # User Profile Model
 class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
@@ -514,10 +520,17 @@ class MathGameProblem(models.Model):
     level = models.ForeignKey(MathGameLevel, on_delete=models.CASCADE, related_name='problems')
     hint = models.TextField(blank=True)
     is_active = models.BooleanField(default=True)
+    source = models.CharField(max_length=10, choices=CONTENT_SOURCE_CHOICES, default='seed')
+    ai_model = models.CharField(max_length=100, blank=True)
+    age_band = models.CharField(max_length=10, blank=True)  # '3-6', '7-9', '10-12', '13+'; blank = any age
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
         ordering = ['level__level_number']
+        indexes = [
+            models.Index(fields=['level', 'is_active']),
+        ]
     
     def __str__(self):
         return f"{self.problem_text} = {self.correct_answer}"
@@ -610,10 +623,17 @@ class QuizQuestion(models.Model):
     explanation = models.TextField(blank=True, help_text="Explanation for the correct answer")
     points = models.IntegerField(default=10)
     is_active = models.BooleanField(default=True)
+    source = models.CharField(max_length=10, choices=CONTENT_SOURCE_CHOICES, default='seed')
+    ai_model = models.CharField(max_length=100, blank=True)
+    age_band = models.CharField(max_length=10, blank=True)  # '3-6', '7-9', '10-12', '13+'; blank = any age
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
         ordering = ['category__difficulty', 'points']
+        indexes = [
+            models.Index(fields=['category', 'is_active', 'age_band']),
+        ]
     
     def __str__(self):
         return f"{self.question_text[:50]}..."
@@ -702,6 +722,75 @@ class UserQuizProgress(models.Model):
             return 0
         return round((self.correct_answers / self.total_questions) * 100, 1)
 
+class AIQuestionPoolItem(models.Model):
+    """Pre-generated AI quiz questions waiting to be served"""
+    difficulty = models.CharField(max_length=10, choices=QuizCategory.DIFFICULTY_CHOICES)
+    age_band = models.CharField(max_length=10)  # '3-6', '7-9', '10-12', '13+'
+    topic = models.CharField(max_length=100)
+    question_text = models.TextField()
+    options = models.JSONField(default=list)  # ['option 1', 'option 2', 'option 3', 'option 4']
+    correct_option = models.CharField(max_length=1)
+    explanation = models.TextField(blank=True)
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True)  # ai_harvest.content_hash of question_text
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "AI Question Pool Item"
+        verbose_name_plural = "AI Question Pool"
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['difficulty', 'age_band', 'topic', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"[{self.difficulty}/{self.age_band}/{self.topic}] {self.question_text[:50]}"
+
+    def to_ai_question(self):
+        """Return the item in the same shape generate_ai_question returns"""
+        return {
+            'question': self.question_text,
+            'options': list(self.options),
+            'correct': self.correct_option,
+            'explanation': self.explanation
+        }
+
+
+class LLMMetricEvent(models.Model):
+    """
+    One instrumented LLM event (see core.llm_metrics).
+    For 'call' events `model` is the LLM and `outcome` how the call ended;
+    for 'validation_failure' and 'fallback' events `model` is the item kind
+    and `outcome` the reason; 'hedge' events name the model a hedged request
+    went to and which call won; 'first_item' events carry a streamed level's
+    time to its first question in `latency_ms`.
+    """
+    EVENT_CHOICES = [
+        ('call', 'Call'),
+        ('validation_failure', 'Validation failure'),
+        ('fallback', 'Fallback'),
+        ('first_item', 'Time to first item'),
+        ('hedge', 'Hedged request'),
+    ]
+
+    event = models.CharField(max_length=20, choices=EVENT_CHOICES)
+    endpoint = models.CharField(max_length=200)
+    model = models.CharField(max_length=100)
+    outcome = models.CharField(max_length=100)
+    latency_ms = models.IntegerField(null=True, blank=True)
+    prompt_tokens = models.IntegerField(default=0)
+    completion_tokens = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        verbose_name = "LLM Metric Event"
+        verbose_name_plural = "LLM Metric Events"
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['event', 'endpoint', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.event} {self.endpoint} {self.model} {self.outcome}"
 
 # ============================================
 # Riddle GAME MODELS
@@ -739,15 +828,31 @@ class RiddleQuestion(models.Model):
     answer = models.TextField()
     explanation = models.TextField(blank=True, help_text="Explanation for the correct answer")
     is_active = models.BooleanField(default=True)
+    source = models.CharField(max_length=10, choices=CONTENT_SOURCE_CHOICES, default='seed')
+    ai_model = models.CharField(max_length=100, blank=True)
+    age_band = models.CharField(max_length=10, blank=True)  # '3-6', '7-9', '10-12', '13+'; blank = any age
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
         ordering = ['category__difficulty']
+        indexes = [
+            models.Index(fields=['category', 'is_active', 'age_band']),
+        ]
     
     def __str__(self):
         return f"{self.question_text[:50]}..."
     
 
+class RiddleNearDuplicateBand(models.Model):
+    """MinHash LSH band key of a riddle, for near-duplicate lookups (see core.near_duplicates)"""
+    riddle = models.ForeignKey(RiddleQuestion, on_delete=models.CASCADE, related_name='lsh_bands')
+    band_key = models.CharField(max_length=20, db_index=True)
+
+    def __str__(self):
+        return f"{self.band_key} -> {self.riddle_id}"
+
+
 class RiddleLevel(models.Model):
     """Level configurations for Quiz Game"""
     level_number = models.IntegerField(unique=True)
@@ -811,4 +916,26 @@ class UserRiddleProgress(models.Model):
     def accuracy_rate(self):
         if self.total_questions == 0:
             return 0
-        return round((self.correct_answers / self.total_questions) * 100, 1)
\ No newline at end of file
+        return round((self.correct_answers / self.total_questions) * 100, 1)
+
+class SeenQuestionSet(models.Model):
+    """Ids of the quiz questions or riddles a learner has been served, as a zlib-compressed bitmap (see core.seen_questions)"""
+    KIND_CHOICES = [
+        ('quiz', 'Quiz question'),
+        ('riddle', 'Riddle'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='seen_question_sets')
+    session_id = models.CharField(max_length=100, blank=True)  # For learners who are not signed in
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    bitmap = models.BinaryField(default=b'')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'kind'], condition=models.Q(user__isnull=False), name='seen_set_unique_user_kind'),
+            models.UniqueConstraint(fields=['session_id', 'kind'], condition=models.Q(user__isnull=True), name='seen_set_unique_session_kind'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} seen set of {self.user or self.session_id}"
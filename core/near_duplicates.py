@@ -0,0 +1,290 @@
+"""
+Near-duplicate detection for riddles with MinHash and locality-sensitive hashing.
+
+A riddle is reduced to character shingles and summarised by a MinHash
+signature of NUM_PERMUTATIONS values, cut into LSH_BANDS bands of LSH_ROWS
+values. Riddles that share a band are candidates; a candidate is a
+near-duplicate when the signatures estimate a shingle Jaccard similarity of
+at least NEAR_DUPLICATE_THRESHOLD. A probe therefore costs LSH_BANDS bucket
+lookups plus the few candidates found, not a comparison against every riddle
+seen so far.
+
+RecentRiddles holds the riddles a session or user has already been served,
+in the Django cache, in bounded memory: a Bloom filter over 64-bit
+fingerprints of every riddle served catches exact repeats, and a ring buffer
+of the last RECENT_RIDDLES_CAPACITY riddles' band keys and 1-byte-per-value
+(b-bit) signatures catches near-duplicates. The ring is stored in pages and
+a save writes only the pages that changed. NearDuplicateIndex is the
+unbounded in-memory version for deduplicating a batch (imports,
+harvesting). The RiddleNearDuplicateBand table holds the band keys of every
+RiddleQuestion so imports and harvesting can reject riddles that are
+near-duplicates of stored ones.
+"""
+import hashlib
+import random
+import re
+from array import array
+from collections import namedtuple
+from django.core.cache import cache
+from .models import RiddleNearDuplicateBand, RiddleQuestion
+
+SHINGLE_SIZE = 4
+NUM_PERMUTATIONS = 64
+LSH_BANDS = 16
+LSH_ROWS = NUM_PERMUTATIONS // LSH_BANDS
+NEAR_DUPLICATE_THRESHOLD = 0.6
+
+# Riddles a RecentRiddles ring remembers, kept in cache pages of RECENT_RIDDLES_PAGE_SIZE
+RECENT_RIDDLES_CAPACITY = 256
+RECENT_RIDDLES_PAGE_SIZE = 32
+# Bloom filter of served fingerprints: about 2% false positives at BLOOM_MAX_ITEMS, then it starts over
+BLOOM_BITS = 16384
+BLOOM_HASHES = 5
+BLOOM_MAX_ITEMS = 2000
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+# Fixed seed: band keys are stored, so the permutations must never change
+_permutation_random = random.Random(1337)
+_PERMUTATIONS = [
+    (_permutation_random.randint(1, _MERSENNE_PRIME - 1), _permutation_random.randint(0, _MERSENNE_PRIME - 1))
+    for _ in range(NUM_PERMUTATIONS)
+]
+
+Sketch = namedtuple('Sketch', ['signature', 'keys', 'fingerprint'])
+
+
+def _normalize(text):
+    return " ".join(re.sub(r'[^\w\s]', ' ', text.lower()).split())
+
+
+def _shingles(text):
+    normalized = _normalize(text)
+    if len(normalized) <= SHINGLE_SIZE:
+        return {normalized}
+    return {normalized[i:i + SHINGLE_SIZE] for i in range(len(normalized) - SHINGLE_SIZE + 1)}
+
+
+def minhash_signature(text):
+    """MinHash signature (NUM_PERMUTATIONS ints) of the text's character shingles"""
+    hashes = [
+        int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=4).digest(), 'big')
+        for shingle in _shingles(text)
+    ]
+    return tuple(
+        min(((a * value + b) % _MERSENNE_PRIME) & _MAX_HASH for value in hashes)
+        for a, b in _PERMUTATIONS
+    )
+
+
+def sketch(text):
+    """MinHash signature of a text, its LSH_BANDS bucket keys and a 64-bit fingerprint of the normalized text"""
+    signature = minhash_signature(text)
+    keys = []
+    for band in range(LSH_BANDS):
+        rows = signature[band * LSH_ROWS:(band + 1) * LSH_ROWS]
+        digest = hashlib.blake2b(repr(rows).encode('ascii'), digest_size=8).hexdigest()
+        keys.append(f"{band:x}{digest}")
+    fingerprint = int.from_bytes(hashlib.blake2b(_normalize(text).encode('utf-8'), digest_size=8).digest(), 'big')
+    return Sketch(signature, keys, fingerprint)
+
+
+def similarity(signature_a, signature_b):
+    """Estimated Jaccard similarity of the shingle sets behind two signatures"""
+    return sum(a == b for a, b in zip(signature_a, signature_b)) / NUM_PERMUTATIONS
+
+
+class NearDuplicateIndex:
+    """Sketches of the riddles a player has seen, stored in the Django cache"""
+
+    def __init__(self, cache_key=None, buckets=None, signatures=None):
+        self.cache_key = cache_key
+        self.buckets = buckets or {}  # band key -> positions in self.signatures
+        self.signatures = signatures or []
+
+    @classmethod
+    def load(cls, cache_key):
+        data = cache.get(cache_key)
+        # Entries written before the index existed were lists of question texts
+        if not isinstance(data, dict):
+            data = {}
+        return cls(cache_key, data.get('buckets'), data.get('signatures'))
+
+    def save(self, timeout=3600):
+        cache.set(self.cache_key, {'buckets': self.buckets, 'signatures': self.signatures}, timeout)
+
+    def contains(self, riddle_sketch):
+        """True when a near-duplicate of the sketched riddle is in the index"""
+        for key in riddle_sketch.keys:
+            for position in self.buckets.get(key, ()):
+                if similarity(riddle_sketch.signature, self.signatures[position]) >= NEAR_DUPLICATE_THRESHOLD:
+                    return True
+        return False
+
+    def add(self, riddle_sketch):
+        position = len(self.signatures)
+        self.signatures.append(riddle_sketch.signature)
+        for key in riddle_sketch.keys:
+            self.buckets.setdefault(key, []).append(position)
+
+    def __len__(self):
+        return len(self.signatures)
+
+
+# Bytes per ring entry: fingerprint, one 64-bit key per band, one byte per signature value
+_ENTRY_SIZE = 8 + 8 * LSH_BANDS + NUM_PERMUTATIONS
+
+
+def _b_bit_similarity(low_bytes_a, low_bytes_b):
+    """Jaccard similarity estimated from the lowest byte of each signature value (b-bit MinHash, b = 8)"""
+    matches = sum(a == b for a, b in zip(low_bytes_a, low_bytes_b)) / NUM_PERMUTATIONS
+    # Unrelated values still agree on their low byte 1 time in 256
+    return (matches - 1 / 256) / (1 - 1 / 256)
+
+
+class RecentRiddles:
+    """
+    Bounded record of the riddles a player was served, stored in the Django
+    cache under cache_key (nothing is stored when it is None). Answers the
+    same contains()/add() as NearDuplicateIndex.
+    """
+
+    def __init__(self, cache_key=None, meta=None, pages=None):
+        meta = meta or {}
+        self.cache_key = cache_key
+        self.head = meta.get('head', 0)  # riddles added so far; the next one goes to slot head % capacity
+        self.bloom = bytearray(meta.get('bloom') or bytes(BLOOM_BITS // 8))
+        self.bloom_items = meta.get('bloom_items', 0)
+        self.pages = [bytearray(page) if page else bytearray() for page in (pages or [])]
+        self.pages += [bytearray() for _ in range(RECENT_RIDDLES_CAPACITY // RECENT_RIDDLES_PAGE_SIZE - len(self.pages))]
+        self.dirty_pages = set()
+        self.buckets = {}  # (band, key) -> slots
+        for slot in range(min(self.head, RECENT_RIDDLES_CAPACITY)):
+            entry = self._entry(slot)
+            if entry is not None:
+                for band, key in enumerate(array('Q', entry[8:8 + 8 * LSH_BANDS])):
+                    self.buckets.setdefault((band, key), []).append(slot)
+
+    @staticmethod
+    def _page_keys(cache_key):
+        return [f"{cache_key}:page:{page}" for page in range(RECENT_RIDDLES_CAPACITY // RECENT_RIDDLES_PAGE_SIZE)]
+
+    @classmethod
+    def load(cls, cache_key):
+        if cache_key is None:
+            return cls()
+        page_keys = cls._page_keys(cache_key)
+        data = cache.get_many([f"{cache_key}:meta"] + page_keys)
+        return cls(cache_key, data.get(f"{cache_key}:meta"), [data.get(key) for key in page_keys])
+
+    @classmethod
+    def clear(cls, cache_key):
+        if cache_key is not None:
+            cache.delete_many([f"{cache_key}:meta"] + cls._page_keys(cache_key))
+
+    def save(self, timeout=3600):
+        """Write the Bloom filter and the pages that changed since load"""
+        if self.cache_key is None:
+            return
+        values = {f"{self.cache_key}:meta": {'head': self.head, 'bloom': bytes(self.bloom), 'bloom_items': self.bloom_items}}
+        page_keys = self._page_keys(self.cache_key)
+        for page in self.dirty_pages:
+            values[page_keys[page]] = bytes(self.pages[page])
+        cache.set_many(values, timeout)
+        self.dirty_pages = set()
+
+    def _entry(self, slot):
+        page, offset = divmod(slot, RECENT_RIDDLES_PAGE_SIZE)
+        start = offset * _ENTRY_SIZE
+        entry = self.pages[page][start:start + _ENTRY_SIZE]
+        # A page that expired from the cache before the others reads as empty
+        return bytes(entry) if len(entry) == _ENTRY_SIZE else None
+
+    def _bloom_positions(self, fingerprint):
+        first, second = fingerprint & 0xFFFFFFFF, (fingerprint >> 32) | 1
+        return [(first + i * second) % BLOOM_BITS for i in range(BLOOM_HASHES)]
+
+    @staticmethod
+    def _band_keys(riddle_sketch):
+        return [int(key[-16:], 16) for key in riddle_sketch.keys]
+
+    def contains(self, riddle_sketch):
+        """True when the riddle was served before, or a near-duplicate of it was recently"""
+        if all(self.bloom[position >> 3] >> (position & 7) & 1 for position in self._bloom_positions(riddle_sketch.fingerprint)):
+            return True
+        low_bytes = bytes(value & 0xFF for value in riddle_sketch.signature)
+        for band, key in enumerate(self._band_keys(riddle_sketch)):
+            for slot in self.buckets.get((band, key), ()):
+                entry = self._entry(slot)
+                if entry is not None and _b_bit_similarity(low_bytes, entry[-NUM_PERMUTATIONS:]) >= NEAR_DUPLICATE_THRESHOLD:
+                    return True
+        return False
+
+    def add(self, riddle_sketch):
+        if self.bloom_items >= BLOOM_MAX_ITEMS:
+            self.bloom = bytearray(BLOOM_BITS // 8)
+            self.bloom_items = 0
+        for position in self._bloom_positions(riddle_sketch.fingerprint):
+            self.bloom[position >> 3] |= 1 << (position & 7)
+        self.bloom_items += 1
+
+        slot = self.head % RECENT_RIDDLES_CAPACITY
+        old_entry = self._entry(slot)
+        if old_entry is not None:
+            # The ring is full: the oldest riddle leaves the near-duplicate buckets
+            for band, key in enumerate(array('Q', old_entry[8:8 + 8 * LSH_BANDS])):
+                slots = self.buckets.get((band, key))
+                if slots and slot in slots:
+                    slots.remove(slot)
+        band_keys = self._band_keys(riddle_sketch)
+        entry = (
+            riddle_sketch.fingerprint.to_bytes(8, 'big')
+            + array('Q', band_keys).tobytes()
+            + bytes(value & 0xFF for value in riddle_sketch.signature)
+        )
+        page, offset = divmod(slot, RECENT_RIDDLES_PAGE_SIZE)
+        start = offset * _ENTRY_SIZE
+        page_bytes = self.pages[page]
+        if len(page_bytes) < start:
+            page_bytes.extend(bytes(start - len(page_bytes)))
+        page_bytes[start:start + _ENTRY_SIZE] = entry
+        self.dirty_pages.add(page)
+        for band, key in enumerate(band_keys):
+            self.buckets.setdefault((band, key), []).append(slot)
+        self.head += 1
+
+    def __len__(self):
+        return min(self.head, RECENT_RIDDLES_CAPACITY)
+
+
+def find_stored_riddle_duplicate(riddle_sketch):
+    """A stored RiddleQuestion the sketched riddle is a near-duplicate of, or None"""
+    candidate_ids = set(
+        RiddleNearDuplicateBand.objects
+        .filter(band_key__in=riddle_sketch.keys)
+        .values_list('riddle_id', flat=True)
+    )
+    for candidate in RiddleQuestion.objects.filter(pk__in=candidate_ids).only('pk', 'question_text'):
+        if similarity(riddle_sketch.signature, minhash_signature(candidate.question_text)) >= NEAR_DUPLICATE_THRESHOLD:
+            return candidate
+    return None
+
+
+def index_riddles(riddles):
+    """Store the band keys of saved RiddleQuestion rows"""
+    RiddleNearDuplicateBand.objects.bulk_create(
+        [
+            RiddleNearDuplicateBand(riddle_id=riddle.pk, band_key=key)
+            for riddle in riddles
+            for key in sketch(riddle.question_text).keys
+        ],
+        batch_size=1000
+    )
+
+
+def ensure_riddle_index():
+    """Index every RiddleQuestion that has no band keys yet. Returns how many were indexed."""
+    missing = list(RiddleQuestion.objects.filter(lsh_bands__isnull=True).only('pk', 'question_text'))
+    index_riddles(missing)
+    return len(missing)
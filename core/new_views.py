@@ -4,7 +4,8 @@ from django.views.decorators.csrf import csrf_exempt
 import json
 import random
 from .models import GameLevel, GameEmoji, GameSession, UserGameProgress
-from .game_utils import get_age_from_birthdate, get_difficulty_by_age
+from .game_utils import get_learner
+from .level_catalog import get_level
 
 def memory_game(request):
     """Render the main game page"""
@@ -18,14 +19,11 @@ def get_level_data(request):
     level = int(request.GET.get('level', 1))
     
     # Get user age for difficulty adjustment
-    user = request.user if request.user.is_authenticated else None
-    user_age = None
-    if user and hasattr(user, 'profile') and user.profile.date_of_birth:
-        user_age = get_age_from_birthdate(user.profile.date_of_birth)
+    user_age = get_learner(request).age
     
     try:
         # Try to get level configuration from database
-        level_config = GameLevel.objects.get(level_number=level)
+        level_config = get_level('memory', level)
         rows = level_config.rows
         cols = level_config.columns
         
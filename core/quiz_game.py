@@ -1,164 +1,252 @@
 import json
+import logging
 import random
+import time
+from asgiref.sync import sync_to_async
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
-from .models import QuizCategory, QuizQuestion, QuizLevel, QuizGameSession, UserQuizProgress
-from .game_utils import filter_by_age_appropriate, get_age_from_birthdate, get_difficulty_by_age
+from .models import QuizLevel, QuizGameSession, UserQuizProgress
+from .game_utils import get_learner
 from django.shortcuts import render
 from .ai_question_generator import generate_ai_question, create_unique_fallback_question
+from .ai_question_pool import harvested_question_ids, pop_pool_questions, select_quiz_categories
+from .ai_harvest import plan_ai_slots
+from .llm_metrics import record_fallback, record_time_to_first_item
+from .streaming import ndjson_response
+from .deadlines import budget_report, spending, timed, with_level_budget
+from .sampling import QUIZ_QUESTIONS
+from .seen_questions import load_seen_set, queue_unseen
+from .category_catalog import category_catalog_response
+from .level_catalog import get_level
+
+logger = logging.getLogger(__name__)
 
 def quizes(request):
     return render(request, 'quizes/quizes.html')    
 
-def get_quiz_level(request):
-    """Get quiz questions for a specific level, mixing AI and database questions"""
+def _prepare_quiz_level(request):
+    """
+    Resolve the level, categories and learner age band for a quiz level
+    request. Shared by the JSON and streaming level views; raises
+    QuizLevel.DoesNotExist.
+    """
     level_number = int(request.GET.get('level', 1))
     
-    # Get list of already answered question IDs to exclude
-    answered_ids_param = request.GET.get('answered_ids', '')
-    answered_ids = []
-    if answered_ids_param:
-        try:
-            answered_ids = [int(id) for id in answered_ids_param.split(',') if id.strip()]
-        except ValueError:
-            answered_ids = []
+    # Questions this learner was already served (plus any answered_ids sent)
+    seen = load_seen_set(request, 'quiz', request.GET.get('session_id'))
     
-    try:
-        # Filter levels by age-appropriate difficulty
-        levels = QuizLevel.objects.filter(level_number=level_number)
-        user = request.user if request.user.is_authenticated else None
-        levels_query = filter_by_age_appropriate(user, levels, 'category__difficulty')
-        level = levels_query.first()
-        
-        if not level:
-            # Fallback to default level if age filtering removes it
-            level = QuizLevel.objects.get(level_number=level_number)
-        
-        # Filter categories by age-appropriate difficulty
-        categories = QuizCategory.objects.filter(is_active=True)
-        categories_query = filter_by_age_appropriate(user, categories, 'difficulty')
-        
-        # Use age-appropriate category if available
-        if user and hasattr(user, 'profile') and user.profile.date_of_birth:
-            user_age = get_age_from_birthdate(user.profile.date_of_birth)
-            age_difficulty = get_difficulty_by_age(user_age)
-            if age_difficulty:
-                categories_query = categories_query.filter(difficulty=age_difficulty)
-        
-        # If no age-appropriate category, fall back to level's category
-        if not categories_query.exists():
-            categories_query = QuizCategory.objects.filter(pk=level.category.pk)
-        
-        # Get available database questions (excluding answered ones)
-        questions_query = QuizQuestion.objects.filter(
-            category__in=categories_query.values_list('pk', flat=True),
-            is_active=True
-        )
-        
-        # Exclude already answered questions
-        if answered_ids:
-            questions_query = questions_query.exclude(id__in=answered_ids)
-        
-        # Get available database questions
-        available_db_questions = list(questions_query.order_by('?'))  # Random order
-        available_count = len(available_db_questions)
-        questions_needed = level.questions_required
-        
-        questions_data = []
-        
-        # Define points based on difficulty
-        difficulty_points_map = {
-            'easy': 10,
-            'medium': 15,
-            'hard': 20,
-            'expert': 25
+    # Level numbers are unique, so age filtering always fell back to this level
+    level = get_level('quiz', level_number)
+    
+    # User age for category selection and the AI question pool
+    learner = get_learner(request)
+    user_age = learner.age
+    
+    categories_query = select_quiz_categories(level, user_age)
+    age_band = learner.age_band
+    
+    # Available database questions in random order (excluding seen ones);
+    # harvested AI questions are limited to the learner's age band
+    db_questions = queue_unseen(
+        QUIZ_QUESTIONS,
+        seen,
+        level.questions_required,
+        category_id=list(categories_query.values_list('pk', flat=True)),
+        age_band=['', age_band]
+    )
+    
+    # Define points based on difficulty
+    difficulty_points_map = {
+        'easy': 10,
+        'medium': 15,
+        'hard': 20,
+        'expert': 25
+    }
+    
+    current_difficulty = level.category.difficulty
+    
+    # Get category for AI questions context
+    category = categories_query.first()
+    
+    return {
+        'level': level,
+        'level_number': level_number,
+        'db_questions': db_questions,
+        'seen': seen,
+        'current_difficulty': current_difficulty,
+        'points': difficulty_points_map.get(current_difficulty, 10),
+        'age_band': age_band,
+        'topic': category.name if category else "general knowledge",
+        'ai_questions_count': 0,
+        'db_questions_count': 0,
+    }
+
+def _quiz_level_questions(state):
+    """
+    Yield the level's questions one at a time: pooled AI questions first (no
+    database work needed), then database questions, then static fallbacks.
+    Counts are kept in state.
+    """
+    level_number = state['level_number']
+    questions_needed = state['level'].questions_required
+    
+    # STRATEGY: Serve mostly database questions (seeded and harvested AI ones)
+    # and take only the growth share of the level from the pre-generated AI
+    # pool, or more when the database runs short. Never wait on the AI here.
+    ai_slots = plan_ai_slots(questions_needed, len(state['db_questions']))
+    pool_questions = pop_pool_questions(
+        difficulty=state['current_difficulty'],
+        age_band=state['age_band'],
+        topic=state['topic'],
+        count=ai_slots
+    )
+    
+    for i, ai_question in enumerate(pool_questions):
+        state['ai_questions_count'] += 1
+        yield {
+            'id': f"ai_{level_number}_{i}_{random.randint(1000,9999)}",
+            'question_text': ai_question['question'],
+            'options': [
+                {'letter': 'A', 'text': ai_question['options'][0]},
+                {'letter': 'B', 'text': ai_question['options'][1]},
+                {'letter': 'C', 'text': ai_question['options'][2]},
+                {'letter': 'D', 'text': ai_question['options'][3]}
+            ],
+            'correct_option': ai_question['correct'],
+            'explanation': ai_question['explanation'],
+            'points': state['points'],
+            'is_ai': True
         }
-        
-        current_difficulty = level.category.difficulty
-        points = difficulty_points_map.get(current_difficulty, 10)
-        
-        # Get category for AI questions context
-        category = categories_query.first()
-        topic = category.name if category else "general knowledge"
-        
-        # Get user age for AI question generation
-        user_age = 10  # default
-        if user and hasattr(user, 'profile') and user.profile.date_of_birth:
-            user_age = get_age_from_birthdate(user.profile.date_of_birth)
+    
+    # Get available database questions (random order) for the remaining slots
+    remaining = questions_needed - len(pool_questions)
+    available_db_questions = state['db_questions'].take(remaining) if remaining > 0 else []
+    state['seen'].update(question.id for question in available_db_questions)
+    # The pooled questions were also harvested into the bank: don't serve those copies later
+    state['seen'].update(harvested_question_ids(pool_questions))
+    state['seen'].save()
+    
+    for i in range(len(pool_questions), questions_needed):
+        # Slots below ai_slots were meant for the pool but it ran dry
+        reason = 'pool_empty' if i < ai_slots else 'db_exhausted'
+        if available_db_questions:
+            if i < ai_slots:
+                record_fallback("question", "db", reason)
+            db_question = available_db_questions.pop(0)
+            state['db_questions_count'] += 1
+            yield {
+                'id': db_question.id,
+                'question_text': db_question.question_text,
+                'options': db_question.get_options(),
+                'correct_option': db_question.correct_option,
+                'explanation': db_question.explanation,
+                'points': db_question.points,
+                'is_ai': False
+            }
+        else:
+            # Last resort: use simple fallback
+            record_fallback("question", "static", reason)
+            yield create_unique_fallback_question(level_number, i, state['current_difficulty'], state['topic'])
 
+def _quiz_level_info(state):
+    level = state['level']
+    return {
+        'level_number': level.level_number,
+        'category': level.category.name,
+        'difficulty': state['current_difficulty'],
+        'color': level.category.color,
+        'icon': level.category.icon,
+        'time_limit': level.time_limit,
+        'questions_required': level.questions_required,
+    }
 
-        # STRATEGY: Use AI questions first, fallback to database questions when AI fails
-        ai_questions_count = 0
-        db_questions_count = 0
+def _build_quiz_level(state):
+    questions_data = list(_quiz_level_questions(state))
+    
+    # Shuffle the final questions to mix AI and database questions randomly
+    #random.shuffle(questions_data)
+    
+    level_data = _quiz_level_info(state)
+    level_data.update({
+        'questions': questions_data,
+        'ai_questions_count': state['ai_questions_count'],
+        'db_questions_count': state['db_questions_count']
+    })
+    
+    logger.info(f"Level {state['level_number']}: {state['db_questions_count']} DB questions, {state['ai_questions_count']} AI questions")
+    return level_data
 
-        for i in range(questions_needed):
-            # Try AI question first
-            try:
-                ai_question = generate_ai_question(
-                    difficulty=current_difficulty,
-                    age=user_age,
-                    topic=topic,
-                    question_number=i + 1
-                )
-                
-                questions_data.append({
-                    'id': f"ai_{level_number}_{i}_{random.randint(1000,9999)}",
-                    'question_text': ai_question['question'],
-                    'options': [
-                        {'letter': 'A', 'text': ai_question['options'][0]},
-                        {'letter': 'B', 'text': ai_question['options'][1]},
-                        {'letter': 'C', 'text': ai_question['options'][2]},
-                        {'letter': 'D', 'text': ai_question['options'][3]}
-                    ],
-                    'correct_option': ai_question['correct'],
-                    'explanation': ai_question['explanation'],
-                    'points': points,
-                    'is_ai': True
-                })
-                ai_questions_count += 1
-                
-            except Exception as e:
-                print(f"Error generating AI question: {e}")
-                # AI failed, use database question as fallback
-                if available_db_questions:
-                    db_question = available_db_questions.pop(0)
-                    questions_data.append({
-                        'id': db_question.id,
-                        'question_text': db_question.question_text,
-                        'options': db_question.get_options(),
-                        'correct_option': db_question.correct_option,
-                        'explanation': db_question.explanation,
-                        'points': db_question.points,
-                        'is_ai': False
-                    })
-                    db_questions_count += 1
-                else:
-                    # Last resort: use simple fallback
-                    questions_data.append(create_unique_fallback_question(level_number, i, current_difficulty, topic))
-        
-        # Shuffle the final questions to mix AI and database questions randomly
-        #random.shuffle(questions_data)
-        
-        level_data = {
-            'level_number': level.level_number,
-            'category': level.category.name,
-            'difficulty': current_difficulty,
-            'color': level.category.color,
-            'icon': level.category.icon,
-            'time_limit': level.time_limit,
-            'questions_required': level.questions_required,
-            'questions': questions_data,
-            'ai_questions_count': ai_questions_count,
-            'db_questions_count': db_questions_count
-        }
-        
-        print(f"Level {level_number}: {db_questions_count} DB questions, {ai_questions_count} AI questions")
-        
-        return JsonResponse(level_data)
-        
+@with_level_budget
+def get_quiz_level(request):
+    """Get quiz questions for a specific level, mixing AI and database questions"""
+    try:
+        with spending('db'):
+            state = _prepare_quiz_level(request)
+    except QuizLevel.DoesNotExist:
+        return JsonResponse({'error': 'Level not found'}, status=404)
+    
+    with spending('db'):
+        level_data = _build_quiz_level(state)
+    level_data['budget'] = budget_report()
+    return JsonResponse(level_data)
+
+@with_level_budget
+async def get_quiz_level_async(request):
+    """
+    get_quiz_level as an async view. Quiz levels never wait on the LLM (AI
+    questions come from the pre-generated pool), so this only moves the
+    database work off the event loop.
+    """
+    try:
+        with spending('db'):
+            state = await sync_to_async(_prepare_quiz_level)(request)
+    except QuizLevel.DoesNotExist:
+        return JsonResponse({'error': 'Level not found'}, status=404)
+    
+    with spending('db'):
+        level_data = await sync_to_async(_build_quiz_level)(state)
+    level_data['budget'] = budget_report()
+    return JsonResponse(level_data)
+
+@with_level_budget
+def stream_quiz_level(request):
+    """
+    Streaming variant of get_quiz_level (NDJSON): a 'level' record, a
+    'question' record per question as soon as it is ready and a final
+    'summary' record with the counts and time to first question.
+    """
+    started = time.monotonic()
+    try:
+        with spending('db'):
+            state = _prepare_quiz_level(request)
     except QuizLevel.DoesNotExist:
         return JsonResponse({'error': 'Level not found'}, status=404)
+    return ndjson_response(_quiz_level_records(state, started))
+
+def _quiz_level_records(state, started):
+    yield dict(_quiz_level_info(state), type='level')
+    
+    sent = 0
+    first_question_ms = None
+    for question in timed(_quiz_level_questions(state), 'db'):
+        if first_question_ms is None:
+            first_question_ms = round((time.monotonic() - started) * 1000)
+            record_time_to_first_item("question", first_question_ms)
+        sent += 1
+        yield {'type': 'question', 'question': question}
+    
+    total_ms = round((time.monotonic() - started) * 1000)
+    logger.info(f"Level {state['level_number']} streamed: {state['db_questions_count']} DB questions, {state['ai_questions_count']} AI questions, first question after {first_question_ms}ms, all after {total_ms}ms")
+    yield {
+        'type': 'summary',
+        'ai_questions_count': state['ai_questions_count'],
+        'db_questions_count': state['db_questions_count'],
+        'questions_count': sent,
+        'time_to_first_question_ms': first_question_ms,
+        'total_ms': total_ms,
+        'budget': budget_report(),
+    }
 
 
 @csrf_exempt
@@ -239,15 +327,7 @@ def get_next_quiz_level(request):
     next_level = current_level + 1
     
     try:
-        # Filter levels by age-appropriate difficulty
-        levels = QuizLevel.objects.filter(level_number=next_level)
-        user = request.user if request.user.is_authenticated else None
-        levels_query = filter_by_age_appropriate(user, levels, 'category__difficulty')
-        level = levels_query.first()
-        
-        if not level:
-            # Fallback to default level if age filtering removes it
-            level = QuizLevel.objects.get(level_number=next_level)
+        level = get_level('quiz', next_level)
         
         return JsonResponse({
             'level_number': level.level_number,
@@ -260,35 +340,17 @@ def get_next_quiz_level(request):
 
 def get_quiz_categories(request):
     """Get all available quiz categories, filtered by user age"""
-    categories = QuizCategory.objects.filter(is_active=True)
-    user = request.user if request.user.is_authenticated else None
-    categories_query = filter_by_age_appropriate(user, categories, 'difficulty')
-    
-    categories_data = [
-        {
-            'id': cat.id,
-            'name': cat.name,
-            'difficulty': cat.difficulty,
-            'color': cat.color,
-            'icon': cat.icon,
-            'description': cat.description,
-            'question_count': cat.questions.filter(is_active=True).count()
-        }
-        for cat in categories_query
-    ]
-    return JsonResponse({'categories': categories_data})
+    return category_catalog_response(request, 'quiz')
 
 
 @csrf_exempt
 def get_next_question(request):
-    user = request.user
-    
     # Example simple difficulty rule:
     difficulty = "easy"  # or "medium" / "hard"
     
     question_data = generate_ai_question(
         difficulty=difficulty,
-        age=user.profile.age if hasattr(user, "profile") else 10,
+        age=get_learner(request).age or 10,
         topic="mathematics"  # can change dynamically
     )
 
@@ -0,0 +1,135 @@
+"""
+Keeps the riddle levels in step with the quiz levels.
+
+Riddles share the quiz game's level structure: every QuizLevel has a
+RiddleLevel with the same number, settings and a RiddleCategory named after
+(and copying) its QuizCategory. sync_riddle_levels() brings the riddle side
+up to date with a handful of queries: one read of each side and bulk
+inserts and updates for what differs.
+
+Saving a QuizLevel or QuizCategory syncs just the levels involved once the
+transaction commits (receivers connected in CoreConfig.ready()). Deleting a
+QuizLevel deletes its RiddleLevel; deleting a QuizCategory deactivates its
+RiddleCategory rather than deleting it with its riddles. The
+sync_riddle_levels management command does a full sync, for a fresh
+database or data loaded without signals (bulk inserts, loaddata).
+"""
+import logging
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .category_catalog import invalidate_category_catalog
+from .level_catalog import invalidate_level_catalog
+from .models import QuizCategory, QuizLevel, RiddleCategory, RiddleLevel
+
+logger = logging.getLogger(__name__)
+
+CATEGORY_FIELDS = ['difficulty', 'description', 'color', 'icon', 'is_active']
+LEVEL_FIELDS = ['questions_required', 'time_limit', 'unlock_score']
+
+
+def _sync_categories(quiz_categories):
+    """The RiddleCategory for each quiz category, by quiz category pk, created or updated in bulk"""
+    existing = {}
+    for riddle_category in RiddleCategory.objects.filter(name__in={c.name for c in quiz_categories}).order_by('pk'):
+        existing.setdefault(riddle_category.name, riddle_category)
+
+    new, changed = [], []
+    for quiz_category in quiz_categories:
+        riddle_category = existing.get(quiz_category.name)
+        if riddle_category is None:
+            riddle_category = existing[quiz_category.name] = RiddleCategory(
+                name=quiz_category.name,
+                **{field: getattr(quiz_category, field) for field in CATEGORY_FIELDS}
+            )
+            new.append(riddle_category)
+        elif any(getattr(riddle_category, field) != getattr(quiz_category, field) for field in CATEGORY_FIELDS):
+            for field in CATEGORY_FIELDS:
+                setattr(riddle_category, field, getattr(quiz_category, field))
+            changed.append(riddle_category)
+
+    RiddleCategory.objects.bulk_create(new)
+    RiddleCategory.objects.bulk_update(changed, CATEGORY_FIELDS)
+    if new or changed:
+        # Bulk writes send no post_save
+        invalidate_category_catalog('riddle')
+    if new and new[0].pk is None:
+        # Backends that don't return bulk-inserted keys
+        for riddle_category in RiddleCategory.objects.filter(name__in=[c.name for c in new]).order_by('-pk'):
+            existing[riddle_category.name] = riddle_category
+    return {c.pk: existing[c.name] for c in quiz_categories}, len(new), len(changed)
+
+
+def sync_riddle_levels(quiz_levels=None):
+    """
+    Create or update the RiddleLevel (and RiddleCategory) of every quiz
+    level in quiz_levels, a QuizLevel queryset (all of them by default).
+    Returns counts of what was created and updated.
+    """
+    if quiz_levels is None:
+        quiz_levels = QuizLevel.objects.all()
+    quiz_levels = list(quiz_levels.select_related('category'))
+    if not quiz_levels:
+        return {'categories_created': 0, 'categories_updated': 0, 'levels_created': 0, 'levels_updated': 0}
+
+    with transaction.atomic():
+        quiz_categories = list({level.category_id: level.category for level in quiz_levels}.values())
+        riddle_categories, categories_created, categories_updated = _sync_categories(quiz_categories)
+
+        existing = RiddleLevel.objects.in_bulk([level.level_number for level in quiz_levels], field_name='level_number')
+        new, changed = [], []
+        for quiz_level in quiz_levels:
+            riddle_category = riddle_categories[quiz_level.category_id]
+            riddle_level = existing.get(quiz_level.level_number)
+            if riddle_level is None:
+                new.append(RiddleLevel(
+                    level_number=quiz_level.level_number,
+                    category=riddle_category,
+                    **{field: getattr(quiz_level, field) for field in LEVEL_FIELDS}
+                ))
+            elif riddle_level.category_id != riddle_category.pk or any(
+                getattr(riddle_level, field) != getattr(quiz_level, field) for field in LEVEL_FIELDS
+            ):
+                riddle_level.category = riddle_category
+                for field in LEVEL_FIELDS:
+                    setattr(riddle_level, field, getattr(quiz_level, field))
+                changed.append(riddle_level)
+
+        RiddleLevel.objects.bulk_create(new)
+        RiddleLevel.objects.bulk_update(changed, ['category'] + LEVEL_FIELDS)
+        if categories_created or categories_updated or new or changed:
+            # Bulk writes send no post_save
+            invalidate_level_catalog('riddle')
+
+    counts = {
+        'categories_created': categories_created,
+        'categories_updated': categories_updated,
+        'levels_created': len(new),
+        'levels_updated': len(changed),
+    }
+    if any(counts.values()):
+        logger.info(f"Synced riddle levels from quiz levels: {counts}")
+    return counts
+
+
+@receiver(post_save, sender=QuizLevel)
+def _quiz_level_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        transaction.on_commit(lambda: sync_riddle_levels(QuizLevel.objects.filter(pk=instance.pk)))
+
+
+@receiver(post_save, sender=QuizCategory)
+def _quiz_category_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        transaction.on_commit(lambda: sync_riddle_levels(QuizLevel.objects.filter(category_id=instance.pk)))
+
+
+@receiver(post_delete, sender=QuizLevel)
+def _quiz_level_deleted(sender, instance, **kwargs):
+    RiddleLevel.objects.filter(level_number=instance.level_number).delete()
+
+
+@receiver(post_delete, sender=QuizCategory)
+def _quiz_category_deleted(sender, instance, **kwargs):
+    RiddleCategory.objects.filter(name=instance.name).update(is_active=False)
+    invalidate_category_catalog('riddle')
@@ -472,38 +472,57 @@
 
 
 import json
+import logging
 import random
+import time
+from asgiref.sync import sync_to_async
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.shortcuts import render
-from django.db import transaction, models
-from django.core.cache import cache
+from django.db import models
 from .models import (
     RiddleCategory,
     RiddleQuestion,
     RiddleLevel,
     RiddleGameSession,
     UserRiddleProgress,
-    QuizLevel,
 )
 from .game_utils import (
     filter_by_age_appropriate,
-    get_age_from_birthdate,
-    get_difficulty_by_age,
+    get_age_band,
+    get_learner,
 )
-from .ai_riddles_generator import generate_ai_riddle, create_unique_fallback_riddle
-
-# Cache keys for tracking used riddles
+from .ai_riddles_generator import agenerate_ai_riddles_batch, generate_ai_riddle, generate_ai_riddles_batch, create_unique_fallback_riddle
+from .ai_harvest import harvest_riddle, plan_ai_slots
+from .level_assembly import LEVEL_STREAM_FIRST_BATCH_SIZE, afan_out_batches, fan_out_batches, iter_fan_out_batches
+from .deadlines import budget_report, deadline_passed, spending, timed, with_level_budget
+from .distractor_index import sample_distractors
+from .sampling import RIDDLE_QUESTIONS
+from .seen_questions import load_seen_set, queue_unseen
+from .category_catalog import category_catalog_response
+from .level_catalog import get_level
+from .near_duplicates import RecentRiddles, sketch
+from .llm_metrics import record_fallback, record_time_to_first_item
+from .streaming import ndjson_response
+
+logger = logging.getLogger(__name__)
+
+# Cache keys for tracking used riddles (RecentRiddles); None when the player
+# is unknown, so players without a session never share one record
 def get_used_riddles_cache_key(session_id, level_number):
-    return f"used_riddles_{session_id}_level_{level_number}"
+    if not session_id or session_id == 'anonymous':
+        return None
+    return f"recent_riddles_{session_id}_level_{level_number}"
 
-def get_global_used_riddles_cache_key(user_id=None):
+def get_global_used_riddles_cache_key(user_id=None, session_id=None):
     if user_id:
-        return f"global_used_riddles_user_{user_id}"
-    return "global_used_riddles_anonymous"
+        return f"recent_riddles_user_{user_id}"
+    if session_id and session_id != 'anonymous':
+        return f"recent_riddles_session_{session_id}"
+    return None
 
-def generate_options(correct_answer, answer_pool, distractors=None, num_options=4):
+def generate_options(correct_answer, category_id=None, distractors=None, num_options=4):
     """Generate multiple-choice options using AI distractors when available."""
     options = []
     normalized = set()
@@ -526,17 +545,9 @@ def generate_options(correct_answer, answer_pool, distractors=None, num_options=
                 break
             add_option(distractor)
     
-    # Priority 2: Use answers from other questions in the pool
+    # Priority 2: Use answers of other riddles, alike in category and shape
     if len(options) < num_options:
-        distractors_from_pool = [
-            ans for ans in answer_pool 
-            if ans and ans.strip().lower() != correct_answer.strip().lower()
-        ]
-        random.shuffle(distractors_from_pool)
-        
-        for ans in distractors_from_pool:
-            if len(options) >= num_options:
-                break
+        for ans in sample_distractors(correct_answer, num_options - len(options), category_id, exclude=options):
             add_option(ans)
     
     # Priority 3: Simple fallback generation based on answer characteristics
@@ -605,65 +616,6 @@ def build_hint(answer):
         return f"The answer starts with '{answer[0].upper()}'."
     return f"The answer starts with '{answer[0].upper()}' and ends with '{answer[-1].upper()}'."
 
-LEVELS_SYNCED = False
-
-def sync_riddle_levels_from_quiz():
-    """Ensure riddles share the same level structure as the quiz game."""
-    global LEVELS_SYNCED
-    if LEVELS_SYNCED:
-        return
-
-    with transaction.atomic():
-        quiz_levels = QuizLevel.objects.select_related('category').all()
-
-        for quiz_level in quiz_levels:
-            quiz_cat = quiz_level.category
-            riddle_category, created = RiddleCategory.objects.get_or_create(
-                name=quiz_cat.name,
-                defaults={
-                    'difficulty': quiz_cat.difficulty,
-                    'description': quiz_cat.description,
-                    'color': quiz_cat.color,
-                    'icon': quiz_cat.icon,
-                    'is_active': quiz_cat.is_active,
-                }
-            )
-
-            if not created:
-                updated = False
-                for field in ['difficulty', 'description', 'color', 'icon', 'is_active']:
-                    quiz_value = getattr(quiz_cat, field)
-                    if getattr(riddle_category, field) != quiz_value:
-                        setattr(riddle_category, field, quiz_value)
-                        updated = True
-                if updated:
-                    riddle_category.save()
-
-            riddle_level, created = RiddleLevel.objects.get_or_create(
-                level_number=quiz_level.level_number,
-                defaults={
-                    'category': riddle_category,
-                    'questions_required': quiz_level.questions_required,
-                    'time_limit': quiz_level.time_limit,
-                    'unlock_score': quiz_level.unlock_score,
-                }
-            )
-
-            if not created:
-                needs_save = False
-                if riddle_level.category != riddle_category:
-                    riddle_level.category = riddle_category
-                    needs_save = True
-                for field in ['questions_required', 'time_limit', 'unlock_score']:
-                    quiz_val = getattr(quiz_level, field)
-                    if getattr(riddle_level, field) != quiz_val:
-                        setattr(riddle_level, field, quiz_val)
-                        needs_save = True
-                if needs_save:
-                    riddle_level.save()
-
-    LEVELS_SYNCED = True
-
 def riddles_game(request):
     """Main riddles game view."""
     return render(request, 'riddles/riddles.html')
@@ -671,247 +623,409 @@ def riddles_game(request):
 # Backwards compatibility for any legacy imports
 riddles = riddles_game
 
-def is_riddle_used(question_text, used_riddles, threshold=0.8):
+def is_riddle_used(riddle_sketch, *indexes):
     """
-    Check if a riddle is too similar to already used ones.
-    Uses simple text similarity to prevent similar riddles.
+    Check if a riddle is a near-duplicate of one already used.
+    riddle_sketch comes from near_duplicates.sketch; each index probe looks at
+    a few LSH buckets, independent of how many riddles were used.
     """
-    question_lower = question_text.lower().strip()
-    
-    for used_question in used_riddles:
-        used_lower = used_question.lower().strip()
-        
-        # Simple similarity check - if they share many common words
-        question_words = set(question_lower.split())
-        used_words = set(used_lower.split())
-        
-        if len(question_words & used_words) / max(len(question_words), 1) > threshold:
-            return True
-            
-        # Check if one is a substring of the other (for very similar riddles)
-        if question_lower in used_lower or used_lower in question_lower:
-            if len(question_lower) > 20 or len(used_lower) > 20:  # Only for longer texts
-                return True
-                
-    return False
+    return any(index.contains(riddle_sketch) for index in indexes)
 
-def get_riddle_level(request):
-    """Get riddle questions for a specific level, ensuring no repetitions"""
+def _prepare_riddle_level(request):
+    """
+    Resolve the level, category, learner age, candidate database riddles and
+    used-riddle indexes for a riddle level request. Shared by the JSON and
+    streaming level views; raises RiddleLevel.DoesNotExist.
+    """
     level_number = int(request.GET.get('level', 1))
     session_id = request.GET.get('session_id', 'anonymous')
     
-    sync_riddle_levels_from_quiz()
+    # Riddles this learner was already served (plus any answered_ids sent)
+    seen = load_seen_set(request, 'riddle', session_id)
     
-    # Get list of already answered question IDs to exclude
-    answered_ids_param = request.GET.get('answered_ids', '')
-    answered_ids = []
-    if answered_ids_param:
-        for raw_id in answered_ids_param.split(','):
-            raw_id = raw_id.strip()
-            if raw_id.isdigit():
-                answered_ids.append(int(raw_id))
+    # Level numbers are unique, so age filtering always fell back to this level
+    level = get_level('riddle', level_number)
+    learner = get_learner(request)
+    user = learner.user
     
-    try:
-        # Filter levels by age-appropriate difficulty
-        levels = RiddleLevel.objects.filter(level_number=level_number)
-        user = request.user if request.user.is_authenticated else None
-        levels_query = filter_by_age_appropriate(user, levels, 'category__difficulty')
-        level = levels_query.first()
-        
-        if not level:
-            # Fallback to default level if age filtering removes it
-            level = RiddleLevel.objects.get(level_number=level_number)
-        
-        # Filter categories by age-appropriate difficulty
-        categories = RiddleCategory.objects.filter(is_active=True)
-        categories_query = filter_by_age_appropriate(user, categories, 'difficulty')
-        
-        # Use age-appropriate category if available
-        if user and hasattr(user, 'profile') and user.profile.date_of_birth:
-            user_age = get_age_from_birthdate(user.profile.date_of_birth)
-            age_difficulty = get_difficulty_by_age(user_age)
-            if age_difficulty:
-                categories_query = categories_query.filter(difficulty=age_difficulty)
+    # Filter categories by age-appropriate difficulty
+    categories = RiddleCategory.objects.filter(is_active=True)
+    categories_query = filter_by_age_appropriate(learner, categories, 'difficulty')
+    
+    # Use age-appropriate category if available
+    if learner.difficulty:
+        categories_query = categories_query.filter(difficulty=learner.difficulty)
+    
+    # If no age-appropriate category, fall back to level's category
+    if not categories_query.exists():
+        categories_query = RiddleCategory.objects.filter(pk=level.category.pk)
+    
+    # Get user age for AI riddle generation and harvested riddles
+    user_age = learner.age if learner.age is not None else 10  # default
+    age_band = get_age_band(user_age)
+    
+    # Get available database questions (excluding seen ones); harvested
+    # AI riddles are limited to the learner's age band
+    db_questions = queue_unseen(
+        RIDDLE_QUESTIONS,
+        seen,
+        level.questions_required,
+        category_id=list(categories_query.values_list('pk', flat=True)),
+        age_band=['', age_band]
+    )
+    
+    # Get category for AI questions context
+    category = categories_query.first()
+    
+    return {
+        'level': level,
+        'level_number': level_number,
+        'session_id': session_id,
+        'category': category,
+        'topic': category.name if category else "general knowledge",
+        'current_difficulty': level.category.difficulty,
+        'user_age': user_age,
+        'age_band': age_band,
+        'riddles_needed': level.questions_required,
+        # Available database questions in random order, fetched as they are popped
+        'available_db_questions': db_questions,
+        'seen': seen,
+        # TRACKING SYSTEM: Bounded records of riddles used in this session
+        # and level, and by this user/session overall
+        'used_riddles': RecentRiddles.load(get_used_riddles_cache_key(session_id, level_number)),
+        'global_used_riddles': RecentRiddles.load(get_global_used_riddles_cache_key(user.id if user else None, session_id)),
+        'ai_riddles_count': 0,
+        'db_riddles_count': 0,
+    }
+
+def _generate_riddles_batch(state):
+    # The AI slots (plan_ai_slots) grow coverage: ask for new riddles, not cached ones
+    return lambda count: generate_ai_riddles_batch(
+        difficulty=state['current_difficulty'],
+        age=state['user_age'],
+        topic=state['topic'],
+        count=count,
+        fresh=True
+    )
+
+def _riddle_data(riddle_id, question_text, answer, explanation, is_ai, category_id, distractors=None, hint=None):
+    return {
+        'id': riddle_id,
+        'question_text': question_text,
+        'answer': answer,
+        'explanation': explanation,
+        'is_ai': is_ai,
+        'options': generate_options(answer, category_id, distractors),
+        'tip': build_tip(question_text, answer),
+        'hint': hint or build_hint(answer)
+    }
+
+def _mark_riddle_used(state, riddle_sketch):
+    state['used_riddles'].add(riddle_sketch)
+    state['global_used_riddles'].add(riddle_sketch)
+
+def _use_ai_riddle(state, i, ai_riddle):
+    """
+    Riddle data for slot i from an AI riddle, or None when it is too similar
+    to one already used. Accepted riddles are tracked and harvested.
+    """
+    riddle_sketch = sketch(ai_riddle['question'])
+    if is_riddle_used(riddle_sketch, state['used_riddles'], state['global_used_riddles']):
+        return None
+    
+    # Use AI-generated distractors when available
+    riddle = _riddle_data(
+        f"ai_{state['level_number']}_{i}_{random.randint(1000,9999)}",
+        ai_riddle['question'],
+        ai_riddle['answer'],
+        ai_riddle['explanation'],
+        True,
+        state['category'].pk if state['category'] else None,
+        distractors=ai_riddle.get('distractors', []),
+        hint=ai_riddle.get('hint')
+    )
+    _mark_riddle_used(state, riddle_sketch)
+    
+    if state['category']:
+        harvest_riddle(state['category'], ai_riddle, ai_riddle.get('model', ''), state['age_band'])
+    state['ai_riddles_count'] += 1
+    return riddle
+
+def _fill_riddle_slot(state, i, ai_failure=None):
+    """
+    Riddle data for a slot the AI did not fill: the next unused database
+    riddle, else a static fallback. ai_failure is why the slot's AI riddle
+    could not be used (None for slots never sent to the AI).
+    """
+    available_db_questions = state['available_db_questions']
+    
+    # If AI failed or produced duplicates, try database questions
+    while available_db_questions:
+        db_question = available_db_questions.pop()
         
-        # If no age-appropriate category, fall back to level's category
-        if not categories_query.exists():
-            categories_query = RiddleCategory.objects.filter(pk=level.category.pk)
+        # Check if this database riddle is too similar to used ones
+        riddle_sketch = sketch(db_question.question_text)
+        if is_riddle_used(riddle_sketch, state['used_riddles'], state['global_used_riddles']):
+            logger.debug("DB riddle too similar, trying next...")
+            continue
         
-        # Get available database questions (excluding answered ones)
-        questions_query = RiddleQuestion.objects.filter(
-            category__in=categories_query.values_list('pk', flat=True),
-            is_active=True
+        _mark_riddle_used(state, riddle_sketch)
+        state['seen'].add(db_question.id)
+        if ai_failure:
+            record_fallback("riddle", "db", ai_failure)
+        state['db_riddles_count'] += 1
+        logger.debug(f"DB riddle {i+1} used successfully")
+        return _riddle_data(
+            db_question.id,
+            db_question.question_text,
+            db_question.answer,
+            db_question.explanation,
+            False,
+            db_question.category_id
         )
-        answer_pool = list(
-            RiddleQuestion.objects.filter(is_active=True).values_list('answer', flat=True)
+    
+    # Last resort: use simple fallback (ensure it's unique)
+    for fallback_attempts in range(1, 4):  # Try up to 3 different fallbacks
+        fallback_riddle = create_unique_fallback_riddle(
+            state['level_number'], i + fallback_attempts - 1, state['current_difficulty'], state['topic']
         )
         
-        # Exclude already answered questions
-        if answered_ids:
-            questions_query = questions_query.exclude(id__in=answered_ids)
-        
-        # Get available database questions with randomization
-        available_db_questions = list(questions_query.order_by('?'))
-        riddles_needed = level.questions_required
-        questions_data = []
+        riddle_sketch = sketch(fallback_riddle['question'])
+        if not is_riddle_used(riddle_sketch, state['used_riddles'], state['global_used_riddles']):
+            _mark_riddle_used(state, riddle_sketch)
+            record_fallback("riddle", "static", ai_failure or 'db_exhausted')
+            logger.info(f"Fallback riddle {i+1} used successfully")
+            return _riddle_data(
+                f"fallback_{state['level_number']}_{i}_{fallback_attempts}",
+                fallback_riddle['question'],
+                fallback_riddle['answer'],
+                fallback_riddle['explanation'],
+                False,
+                state['category'].pk if state['category'] else None,
+                hint=fallback_riddle.get('hint')
+            )
+    return None
+
+def _riddle_level_info(state):
+    level = state['level']
+    return {
+        'level_number': level.level_number,
+        'category': level.category.name,
+        'difficulty': state['current_difficulty'],
+        'color': level.category.color,
+        'icon': level.category.icon,
+        'time_limit': level.time_limit,
+        'riddles_required': level.questions_required,
+        'session_id': state['session_id']  # Return session_id for client to use
+    }
+
+def _place_ai_riddles(state, open_slots, ai_riddles, slot_questions, slot_failures, attempts):
+    """
+    Put one round of AI riddles into their slots. Returns the slots whose
+    riddle was too similar to a used one, to re-request in the next round.
+    """
+    retry_slots = []
+    for i, ai_riddle in zip(open_slots, ai_riddles):
+        if ai_riddle is None:
+            logger.info(f"Error generating AI riddle {i+1}")
+            slot_failures[i] = 'ai_error'
+            continue  # AI failed, leave this slot for the database
         
-        current_difficulty = level.category.difficulty
+        # Check if this riddle is too similar to already used ones
+        try:
+            slot_questions[i] = _use_ai_riddle(state, i, ai_riddle)
+        except Exception as e:
+            # One bad riddle must not fail the level: its slot comes from the database
+            logger.error(f"Error using AI riddle {i+1}: {e}")
+            slot_failures[i] = 'ai_error'
+            continue
+        if slot_questions[i] is None:
+            logger.info(f"AI riddle {i+1} too similar to used ones, attempt {attempts}")
+            slot_failures[i] = 'duplicate'
+            retry_slots.append(i)
+            continue
         
-        # Get category for AI questions context
-        category = categories_query.first()
-        topic = category.name if category else "general knowledge"
+        slot_failures.pop(i, None)
+        logger.debug(f"AI riddle {i+1} generated successfully")
+    return retry_slots
+
+def _complete_riddle_level(state, slot_questions, slot_failures):
+    """Fill the slots the AI left empty, save the used-riddle indexes and build the level response"""
+    for i in range(state['riddles_needed']):
+        if slot_questions[i] is None:
+            slot_questions[i] = _fill_riddle_slot(state, i, slot_failures.get(i))
+    
+    questions_data = [question for question in slot_questions if question is not None]
+    
+    # Update cache with used riddles (store for 1 hour)
+    state['used_riddles'].save(3600)
+    state['global_used_riddles'].save(3600)
+    state['seen'].save()
+    
+    # Shuffle the final riddles
+    random.shuffle(questions_data)
+    
+    level_data = _riddle_level_info(state)
+    level_data.update({
+        'questions': questions_data,
+        'ai_riddles_count': state['ai_riddles_count'],
+        'db_riddles_count': state['db_riddles_count'],
+    })
+    
+    logger.info(f"Level {state['level_number']}: {state['db_riddles_count']} DB riddles, {state['ai_riddles_count']} AI riddles, {len(questions_data)} total unique riddles")
+    return level_data
+
+# STRATEGY: Serve mostly database riddles (seeded and harvested AI ones);
+# only the growth share of the level, or more when the database runs
+# short, goes to the AI. Failed AI slots fall back to the database.
+MAX_ATTEMPTS_PER_RIDDLE = 3  # Maximum attempts to generate a unique riddle
+
+@with_level_budget
+def get_riddle_level(request):
+    """Get riddle questions for a specific level, ensuring no repetitions"""
+    try:
+        with spending('db'):
+            state = _prepare_riddle_level(request)
+    except RiddleLevel.DoesNotExist:
+        return JsonResponse({'error': 'Level not found'}, status=404)
+    
+    # Request the AI riddles in concurrent batches. Slots whose riddle is too
+    # similar to a used one are re-requested together in the next round,
+    # until the level's deadline; slots still open come from the database.
+    slot_questions = [None] * state['riddles_needed']
+    slot_failures = {}  # slot -> why the AI riddle could not be used
+    open_slots = list(range(plan_ai_slots(state['riddles_needed'], len(state['available_db_questions']))))
+    
+    for attempts in range(1, MAX_ATTEMPTS_PER_RIDDLE + 1):
+        if not open_slots or deadline_passed():
+            break
+        with spending('ai'):
+            ai_riddles = fan_out_batches(_generate_riddles_batch(state), len(open_slots))
+        open_slots = _place_ai_riddles(state, open_slots, ai_riddles, slot_questions, slot_failures, attempts)
+    
+    with spending('db'):
+        level_data = _complete_riddle_level(state, slot_questions, slot_failures)
+    level_data['budget'] = budget_report()
+    return JsonResponse(level_data)
+
+@with_level_budget
+async def get_riddle_level_async(request):
+    """
+    get_riddle_level as an async view for ASGI: the AI batches are awaited on
+    the event loop through the shared async client, so a level waiting on
+    the LLM holds no worker thread. Database work runs in sync_to_async.
+    """
+    try:
+        with spending('db'):
+            state = await sync_to_async(_prepare_riddle_level)(request)
+    except RiddleLevel.DoesNotExist:
+        return JsonResponse({'error': 'Level not found'}, status=404)
+    
+    slot_questions = [None] * state['riddles_needed']
+    slot_failures = {}  # slot -> why the AI riddle could not be used
+    open_slots = list(range(plan_ai_slots(state['riddles_needed'], len(state['available_db_questions']))))
+    
+    for attempts in range(1, MAX_ATTEMPTS_PER_RIDDLE + 1):
+        if not open_slots or deadline_passed():
+            break
+        with spending('ai'):
+            ai_riddles = await afan_out_batches(
+                lambda count: agenerate_ai_riddles_batch(
+                    difficulty=state['current_difficulty'],
+                    age=state['user_age'],
+                    topic=state['topic'],
+                    count=count,
+                    fresh=True
+                ),
+                len(open_slots)
+            )
+        open_slots = await sync_to_async(_place_ai_riddles)(state, open_slots, ai_riddles, slot_questions, slot_failures, attempts)
+    
+    with spending('db'):
+        level_data = await sync_to_async(_complete_riddle_level)(state, slot_questions, slot_failures)
+    level_data['budget'] = budget_report()
+    return JsonResponse(level_data)
+
+@with_level_budget
+def stream_riddle_level(request):
+    """
+    Streaming variant of get_riddle_level (NDJSON). Sends a 'level' record,
+    then a 'question' record per riddle as soon as it is ready - database
+    riddles straight away, AI riddles as their batch completes - and a
+    final 'summary' record with the counts and time to first question.
+    An AI slot whose riddle fails or repeats a used one is filled from the
+    database at once instead of being re-requested, so the stream never
+    waits on a retry round.
+    """
+    started = time.monotonic()
+    try:
+        with spending('db'):
+            state = _prepare_riddle_level(request)
+    except RiddleLevel.DoesNotExist:
+        return JsonResponse({'error': 'Level not found'}, status=404)
+    return ndjson_response(_riddle_level_records(state, started))
+
+def _riddle_level_records(state, started):
+    riddles_needed = state['riddles_needed']
+    ai_slots = plan_ai_slots(riddles_needed, len(state['available_db_questions']))
+    sent = 0
+    first_question_ms = None
+    
+    def question_record(riddle):
+        nonlocal sent, first_question_ms
+        sent += 1
+        if first_question_ms is None:
+            first_question_ms = round((time.monotonic() - started) * 1000)
+            record_time_to_first_item("riddle", first_question_ms)
+        return {'type': 'question', 'question': riddle}
+    
+    try:
+        # Start the AI batches first so they run while database riddles go out;
+        # when every slot is the AI's, a small first batch gets a riddle out sooner
+        ai_riddles = iter_fan_out_batches(
+            _generate_riddles_batch(state),
+            ai_slots,
+            first_batch_size=LEVEL_STREAM_FIRST_BATCH_SIZE if ai_slots == riddles_needed else None
+        )
         
-        # Get user age for AI question generation
-        user_age = 10  # default
-        if user and hasattr(user, 'profile') and user.profile.date_of_birth:
-            user_age = get_age_from_birthdate(user.profile.date_of_birth)
-
-        # TRACKING SYSTEM: Get used riddles from cache
-        used_riddles_cache_key = get_used_riddles_cache_key(session_id, level_number)
-        used_riddles = cache.get(used_riddles_cache_key, [])
+        yield dict(_riddle_level_info(state), type='level')
         
-        # Also track global used riddles for this user/session
-        global_used_key = get_global_used_riddles_cache_key(user.id if user else None)
-        global_used_riddles = cache.get(global_used_key, [])
+        for i in range(ai_slots, riddles_needed):
+            with spending('db'):
+                riddle = _fill_riddle_slot(state, i)
+            if riddle is not None:
+                yield question_record(riddle)
         
-        # STRATEGY: Use AI riddles first, fallback to database riddles when AI fails
-        ai_riddles_count = 0
-        db_riddles_count = 0
-        max_attempts_per_riddle = 3  # Maximum attempts to generate a unique riddle
-
-        for i in range(riddles_needed):
-            riddle_found = False
-            attempts = 0
-            
-            while not riddle_found and attempts < max_attempts_per_riddle:
-                attempts += 1
-                
-                # Try AI riddle first
+        for i, ai_riddle in timed(ai_riddles, 'ai'):
+            riddle, failure = None, 'ai_error'
+            if ai_riddle is not None:
                 try:
-                    ai_riddle = generate_ai_riddle(
-                        difficulty=current_difficulty,
-                        age=user_age,
-                        topic=topic,
-                        riddle_number=i + 1
-                    )
-                    
-                    # Check if this riddle is too similar to already used ones
-                    if is_riddle_used(ai_riddle['question'], used_riddles + global_used_riddles):
-                        print(f"AI riddle {i+1} too similar to used ones, attempt {attempts}")
-                        continue
-                    
-                    # Use AI-generated distractors when available
-                    ai_distractors = ai_riddle.get('distractors', [])
-                    
-                    questions_data.append({
-                        'id': f"ai_{level_number}_{i}_{random.randint(1000,9999)}",
-                        'question_text': ai_riddle['question'],
-                        'answer': ai_riddle['answer'],
-                        'explanation': ai_riddle['explanation'],
-                        'is_ai': True,
-                        'options': generate_options(ai_riddle['answer'], answer_pool, ai_distractors),
-                        'tip': build_tip(ai_riddle['question'], ai_riddle['answer']),
-                        'hint': ai_riddle.get('hint') or build_hint(ai_riddle['answer'])
-                    })
-                    
-                    # Track this riddle as used
-                    used_riddles.append(ai_riddle['question'])
-                    global_used_riddles.append(ai_riddle['question'])
-                    
-                    ai_riddles_count += 1
-                    riddle_found = True
-                    print(f"AI riddle {i+1} generated successfully")
-                    
+                    riddle = _use_ai_riddle(state, i, ai_riddle)
+                    failure = 'duplicate'
                 except Exception as e:
-                    print(f"Error generating AI riddle: {e}")
-                    break  # Break out of attempts loop for AI
-            
-            # If AI failed or produced duplicates, try database questions
-            if not riddle_found and available_db_questions:
-                db_attempts = 0
-                while available_db_questions and db_attempts < len(available_db_questions):
-                    db_question = available_db_questions.pop(0)
-                    db_attempts += 1
-                    
-                    # Check if this database riddle is too similar to used ones
-                    if is_riddle_used(db_question.question_text, used_riddles + global_used_riddles):
-                        print(f"DB riddle too similar, trying next...")
-                        continue
-                    
-                    questions_data.append({
-                        'id': db_question.id,
-                        'question_text': db_question.question_text,
-                        'answer': db_question.answer,
-                        'explanation': db_question.explanation,
-                        'is_ai': False,
-                        'options': generate_options(db_question.answer, answer_pool),
-                        'tip': build_tip(db_question.question_text, db_question.answer),
-                        'hint': build_hint(db_question.answer)
-                    })
-                    
-                    # Track this riddle as used
-                    used_riddles.append(db_question.question_text)
-                    global_used_riddles.append(db_question.question_text)
-                    
-                    db_riddles_count += 1
-                    riddle_found = True
-                    print(f"DB riddle {i+1} used successfully")
-                    break
-            
-            # Last resort: use simple fallback (ensure it's unique)
-            if not riddle_found:
-                fallback_attempts = 0
-                while fallback_attempts < 3:  # Try up to 3 different fallbacks
-                    fallback_riddle = create_unique_fallback_riddle(level_number, i + fallback_attempts, current_difficulty, topic)
-                    fallback_attempts += 1
-                    
-                    if not is_riddle_used(fallback_riddle['question'], used_riddles + global_used_riddles):
-                        questions_data.append({
-                            'id': f"fallback_{level_number}_{i}_{fallback_attempts}",
-                            'question_text': fallback_riddle['question'],
-                            'answer': fallback_riddle['answer'],
-                            'explanation': fallback_riddle['explanation'],
-                            'is_ai': False,
-                            'options': generate_options(fallback_riddle['answer'], answer_pool),
-                            'tip': build_tip(fallback_riddle['question'], fallback_riddle['answer']),
-                            'hint': fallback_riddle.get('hint') or build_hint(fallback_riddle['answer'])
-                        })
-                        
-                        # Track this riddle as used
-                        used_riddles.append(fallback_riddle['question'])
-                        global_used_riddles.append(fallback_riddle['question'])
-                        
-                        riddle_found = True
-                        print(f"Fallback riddle {i+1} used successfully")
-                        break
-        
-        # Update cache with used riddles (store for 1 hour)
-        cache.set(used_riddles_cache_key, used_riddles, 3600)
-        cache.set(global_used_key, global_used_riddles, 3600)
-        
-        # Shuffle the final riddles
-        random.shuffle(questions_data)
+                    logger.error(f"Error using AI riddle {i+1}: {e}")
+            if riddle is None:
+                with spending('db'):
+                    riddle = _fill_riddle_slot(state, i, failure)
+            if riddle is not None:
+                yield question_record(riddle)
         
-        level_data = {
-            'level_number': level.level_number,
-            'category': level.category.name,
-            'difficulty': current_difficulty,
-            'color': level.category.color,
-            'icon': level.category.icon,
-            'time_limit': level.time_limit,
-            'riddles_required': level.questions_required,
-            'questions': questions_data,
-            'ai_riddles_count': ai_riddles_count,
-            'db_riddles_count': db_riddles_count,
-            'session_id': session_id  # Return session_id for client to use
+        total_ms = round((time.monotonic() - started) * 1000)
+        logger.info(f"Level {state['level_number']} streamed: {state['db_riddles_count']} DB riddles, {state['ai_riddles_count']} AI riddles, first riddle after {first_question_ms}ms, all after {total_ms}ms")
+        yield {
+            'type': 'summary',
+            'ai_riddles_count': state['ai_riddles_count'],
+            'db_riddles_count': state['db_riddles_count'],
+            'questions_count': sent,
+            'time_to_first_question_ms': first_question_ms,
+            'total_ms': total_ms,
+            'budget': budget_report(),
         }
-        
-        print(f"Level {level_number}: {db_riddles_count} DB riddles, {ai_riddles_count} AI riddles, {len(questions_data)} total unique riddles")
-        
-        return JsonResponse(level_data)
-        
-    except RiddleLevel.DoesNotExist:
-        return JsonResponse({'error': 'Level not found'}, status=404)
+    finally:
+        # Update cache with used riddles (store for 1 hour), also when the client disconnects
+        state['used_riddles'].save(3600)
+        state['global_used_riddles'].save(3600)
+        state['seen'].save()
 
 @csrf_exempt
 @require_http_methods(["POST"])
@@ -932,9 +1046,8 @@ def start_riddle_session(request):
             is_active=True
         )
         
-        # Initialize global used riddles cache for this session
-        global_used_key = get_global_used_riddles_cache_key(user.id if user else None)
-        cache.set(global_used_key, [], 3600)  # 1 hour expiration
+        # Start global used riddles tracking over for this session
+        RecentRiddles.clear(get_global_used_riddles_cache_key(user.id if user else None, session_id))
         
         return JsonResponse({
             'status': 'success',
@@ -956,12 +1069,10 @@ def clear_used_riddles(request):
         user = request.user if request.user.is_authenticated else None
         
         if session_id and level_number:
-            cache_key = get_used_riddles_cache_key(session_id, level_number)
-            cache.delete(cache_key)
+            RecentRiddles.clear(get_used_riddles_cache_key(session_id, level_number))
         
         # Also clear global used riddles
-        global_key = get_global_used_riddles_cache_key(user.id if user else None)
-        cache.delete(global_key)
+        RecentRiddles.clear(get_global_used_riddles_cache_key(user.id if user else None, session_id))
         
         return JsonResponse({'status': 'success', 'message': 'Used riddles cleared'})
         
@@ -1016,13 +1127,7 @@ def get_next_riddle_level(request):
     next_level = current_level + 1
 
     try:
-        levels = RiddleLevel.objects.filter(level_number=next_level)
-        user = request.user if request.user.is_authenticated else None
-        levels_query = filter_by_age_appropriate(user, levels, 'category__difficulty')
-        level = levels_query.first()
-
-        if not level:
-            level = RiddleLevel.objects.get(level_number=next_level)
+        level = get_level('riddle', next_level)
 
         return JsonResponse({
             'level_number': level.level_number,
@@ -1036,34 +1141,17 @@ def get_next_riddle_level(request):
 
 def get_riddle_categories(request):
     """List active riddle categories filtered by age difficulty."""
-    categories = RiddleCategory.objects.filter(is_active=True)
-    user = request.user if request.user.is_authenticated else None
-    categories_query = filter_by_age_appropriate(user, categories, 'difficulty')
-
-    categories_data = [
-        {
-            'id': cat.id,
-            'name': cat.name,
-            'difficulty': cat.difficulty,
-            'color': cat.color,
-            'icon': cat.icon,
-            'description': cat.description,
-            'riddle_count': cat.questions.filter(is_active=True).count()
-        }
-        for cat in categories_query
-    ]
-    return JsonResponse({'categories': categories_data})
+    return category_catalog_response(request, 'riddle')
 
 
 @csrf_exempt
 def get_next_riddle(request):
     """Return a single AI-generated riddle (quick play)."""
-    user = request.user
     difficulty = "easy"
 
     riddle_data = generate_ai_riddle(
         difficulty=difficulty,
-        age=user.profile.age if hasattr(user, "profile") else 10,
+        age=get_learner(request).age or 10,
         topic="riddles"
     )
 
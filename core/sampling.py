@@ -0,0 +1,210 @@
+"""
+Random sampling of question rows without order_by('?').
+
+order_by('?') makes the database number and sort every matching row on each
+level load. An IdSampler instead keeps the ids of a model's active rows in
+memory as compact sorted arrays, one per bucket of key field values (e.g.
+category and age band), read with one query. A level draws random positions
+over the buckets that match its filters, skips the ids it must exclude and
+fetches only the rows drawn, by primary key: O(k) work for k rows plus a
+binary search per excluded id, whatever the size of the table.
+
+sampler.queue(...) returns a RandomQueue, a random-order queue of the
+matching rows that fetches them in small chunks as they are popped, for
+callers that keep drawing until a row passes their own checks (riddle
+levels skip near-duplicates of riddles already served).
+
+The arrays are versioned like core.distractor_index: post_save and
+post_delete of the model, and bulk inserts (which call invalidate()
+themselves), bump the version in the Django cache and the arrays are
+rebuilt on next use; with a per-process cache, other workers rebuild when
+their copy is SAMPLING_MAX_AGE_SECONDS old. Rows deactivated or deleted
+since the build are dropped when fetched.
+"""
+import bisect
+import logging
+import random
+import threading
+import time
+from array import array
+from itertools import product
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from .models import MathGameProblem, QuizQuestion, RiddleQuestion, SentenceBuilderSentence
+
+logger = logging.getLogger(__name__)
+
+SAMPLING_MAX_AGE_SECONDS = getattr(settings, 'SAMPLING_MAX_AGE_SECONDS', 300)
+
+# Rows a RandomQueue fetches per query
+QUEUE_CHUNK_SIZE = 10
+
+
+class IdSampler:
+    """Ids of a model's active rows, bucketed by key_fields, to sample rows from"""
+
+    def __init__(self, model, key_fields, filters=None):
+        self.model = model
+        self.key_fields = tuple(key_fields)
+        self.filters = filters or {'is_active': True}
+        self.version_key = f'id_sampler_version_{model._meta.label_lower}'
+        self._lock = threading.Lock()
+        self._buckets = None  # {'version', 'built_at', 'ids': {key values: sorted array of ids}}
+
+        uid = f'id_sampler_{model._meta.label_lower}'
+        post_save.connect(self._changed, sender=model, dispatch_uid=uid, weak=False)
+        post_delete.connect(self._changed, sender=model, dispatch_uid=uid, weak=False)
+
+    def _changed(self, sender, **kwargs):
+        self.invalidate()
+
+    def invalidate(self):
+        """Mark every process's arrays stale, after rows were added, changed or removed"""
+        try:
+            cache.incr(self.version_key)
+        except ValueError:
+            cache.set(self.version_key, 1, None)
+
+    def _build(self, version):
+        ids = {}
+        rows = self.model.objects.filter(**self.filters).order_by('pk').values_list('pk', *self.key_fields)
+        for pk, *key in rows.iterator(chunk_size=10000):
+            bucket = ids.get(tuple(key))
+            if bucket is None:
+                bucket = ids[tuple(key)] = array('q')
+            bucket.append(pk)
+        logger.debug(f"Built id sampler for {self.model.__name__} v{version}: {sum(map(len, ids.values()))} ids in {len(ids)} buckets")
+        return {'version': version, 'built_at': time.monotonic(), 'ids': ids}
+
+    def _current(self):
+        version = cache.get(self.version_key, 0)
+        buckets = self._buckets
+        if buckets is not None and buckets['version'] == version and time.monotonic() - buckets['built_at'] < SAMPLING_MAX_AGE_SECONDS:
+            return buckets['ids']
+        with self._lock:
+            if self._buckets is buckets:
+                self._buckets = self._build(version)
+            return self._buckets['ids']
+
+    def max_pk(self):
+        """Largest id among the active rows, 0 when there are none"""
+        return max((bucket[-1] for bucket in self._current().values() if bucket), default=0)
+
+    def queue(self, exclude=(), **criteria):
+        """
+        RandomQueue of the rows whose key fields take one of the given values,
+        e.g. queue(exclude=seen, category_id=[1, 2], age_band=['', '7-9']),
+        leaving out the ids in exclude (a sequence or any container of ids).
+        """
+        unknown = set(criteria) - set(self.key_fields)
+        if unknown:
+            raise ValueError(f"{self.model.__name__} sampler has no key field {', '.join(sorted(unknown))}")
+        ids = self._current()
+        values = [criteria[field] if field in criteria else None for field in self.key_fields]
+        if None in values:
+            # A key field without criteria matches any value
+            keys = [key for key in ids if all(allowed is None or value in allowed for value, allowed in zip(key, values))]
+        else:
+            keys = [key for key in product(*values) if key in ids]
+        return RandomQueue(self.model, [ids[key] for key in keys], exclude)
+
+    def sample(self, k, exclude=(), **criteria):
+        """Up to k random matching rows (see queue()), fetched in one query"""
+        return self.queue(exclude, **criteria).take(k)
+
+
+class RandomQueue:
+    """The matching rows of a sampler in random order, fetched as they are taken"""
+
+    def __init__(self, model, buckets, exclude=()):
+        self.model = model
+        self._buckets = [bucket for bucket in buckets if bucket]
+        self._offsets = []
+        total = 0
+        for bucket in self._buckets:
+            self._offsets.append(total)
+            total += len(bucket)
+        self._total = total
+        # Any container of ids works, e.g. a core.seen_questions.SeenSet; plain sequences become a set
+        self._excluded = set(map(int, exclude)) if isinstance(exclude, (list, tuple)) else exclude
+        self._drawn = set()  # positions already taken or skipped
+        self._remaining = total - sum(1 for pk in self._excluded if self._contains(pk))
+        self._fetched = []
+
+    def matches(self, pk):
+        """True when pk is one of the sampler's matching rows, excluded or not"""
+        return self._contains(pk)
+
+    def _contains(self, pk):
+        for bucket in self._buckets:
+            i = bisect.bisect_left(bucket, pk)
+            if i < len(bucket) and bucket[i] == pk:
+                return True
+        return False
+
+    def _id_at(self, position):
+        index = bisect.bisect_right(self._offsets, position) - 1
+        return self._buckets[index][position - self._offsets[index]]
+
+    def _draw_ids(self, count):
+        """count random ids not drawn or excluded yet"""
+        ids = []
+        while len(ids) < count and self._remaining:
+            if len(self._drawn) > self._total // 2:
+                # Mostly drawn: rejection would miss often, list what is left instead
+                positions = [p for p in range(self._total) if p not in self._drawn]
+                random.shuffle(positions)
+            else:
+                positions = (random.randrange(self._total) for _ in range(count - len(ids)))
+            for position in positions:
+                if position in self._drawn:
+                    continue
+                self._drawn.add(position)
+                pk = self._id_at(position)
+                if pk in self._excluded:
+                    continue
+                self._remaining -= 1
+                ids.append(pk)
+                if len(ids) == count:
+                    break
+        return ids
+
+    def _fetch(self, count):
+        ids = self._draw_ids(count)
+        rows = self.model.objects.in_bulk(ids)
+        # Keep the drawn order; rows gone since the arrays were built are skipped
+        return [rows[pk] for pk in ids if pk in rows]
+
+    def take(self, k):
+        """Up to k rows, in one query"""
+        rows, self._fetched = self._fetched[:k], self._fetched[k:]
+        while len(rows) < k and self._remaining:
+            rows += self._fetch(k - len(rows))
+        return rows
+
+    def pop(self):
+        """The next row; IndexError when none are left"""
+        while not self._fetched and self._remaining:
+            self._fetched = self._fetch(QUEUE_CHUNK_SIZE)
+        if not self._fetched:
+            raise IndexError("pop from empty RandomQueue")
+        return self._fetched.pop()
+
+    def __len__(self):
+        return self._remaining + len(self._fetched)
+
+
+QUIZ_QUESTIONS = IdSampler(QuizQuestion, ['category_id', 'age_band'])
+RIDDLE_QUESTIONS = IdSampler(RiddleQuestion, ['category_id', 'age_band'])
+SENTENCES = IdSampler(SentenceBuilderSentence, ['level_id'])
+MATH_PROBLEMS = IdSampler(MathGameProblem, ['level_id', 'age_band'])
+
+_SAMPLERS = {sampler.model: sampler for sampler in (QUIZ_QUESTIONS, RIDDLE_QUESTIONS, SENTENCES, MATH_PROBLEMS)}
+
+
+def invalidate_samplers(model):
+    """Bulk inserts send no post_save: callers that bulk_create rows of a sampled model call this"""
+    sampler = _SAMPLERS.get(model)
+    if sampler is not None:
+        sampler.invalidate()
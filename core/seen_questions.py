@@ -0,0 +1,175 @@
+"""
+Server-side record of the questions a learner has already been served.
+
+Quiz and riddle levels used to learn a learner's history only from the
+answered_ids query parameter, which grows with every level played and became
+an ever longer exclude(id__in=...) clause. A SeenSet is a bitmap over question
+ids (bit n set when question n was served), stored zlib-compressed in
+SeenQuestionSet per signed-in user, or per session_id for learners who are
+not signed in, and per kind ('quiz' or 'riddle'). Membership is one byte
+lookup, and the sampler in core.sampling checks it for every id it draws.
+
+Levels add the database questions they serve and save the set once per
+level, one small write. answered_ids is still read, from clients that send
+it, and merged in: at most ANSWERED_IDS_MAX_COUNT ids, and only ids of
+questions that exist, so a crafted parameter can't grow the bitmap. When the set leaves fewer unseen questions than a level
+needs, queue_unseen() forgets the seen questions of that level's categories
+and age bands only, so learners who have seen everything there get repeats
+instead of only fallbacks, and keep their history everywhere else.
+
+Sets keyed by session_id are client-supplied and expire
+SEEN_QUESTIONS_SESSION_RETENTION_DAYS after their last update: load()
+ignores them and prune_seen_sets() (the prune_seen_questions command)
+deletes them.
+"""
+import logging
+import zlib
+from datetime import timedelta
+from django.conf import settings
+from django.utils import timezone
+from .models import SeenQuestionSet
+from .sampling import QUIZ_QUESTIONS, RIDDLE_QUESTIONS
+
+logger = logging.getLogger(__name__)
+
+SEEN_QUESTIONS_SESSION_RETENTION_DAYS = getattr(settings, 'SEEN_QUESTIONS_SESSION_RETENTION_DAYS', 30)
+# answered_ids beyond this many are ignored
+ANSWERED_IDS_MAX_COUNT = 1000
+
+# Kind -> the sampler of its questions, which knows the largest id a seen set can hold
+_SAMPLERS = {'quiz': QUIZ_QUESTIONS, 'riddle': RIDDLE_QUESTIONS}
+
+
+def _session_cutoff():
+    return timezone.now() - timedelta(days=SEEN_QUESTIONS_SESSION_RETENTION_DAYS)
+
+
+class SeenSet:
+    """Bitmap of served question ids of one kind for one learner; not saved when the learner is unknown"""
+
+    def __init__(self, kind, user=None, session_id='', bits=None):
+        self.kind = kind
+        self.user = user
+        self.session_id = session_id
+        self.bits = bits if bits is not None else bytearray()
+        self.changed = False
+
+    @classmethod
+    def load(cls, kind, user=None, session_id=None):
+        """The learner's set: by user when signed in, else by session_id; a transient set when neither is known"""
+        if user is None and (not session_id or session_id == 'anonymous'):
+            return cls(kind)
+        rows = SeenQuestionSet.objects.filter(kind=kind)
+        if user is not None:
+            rows = rows.filter(user=user)
+        else:
+            rows = rows.filter(user__isnull=True, session_id=session_id, updated_at__gte=_session_cutoff())
+        row = rows.only('id', 'bitmap').first()
+        bits = bytearray()
+        if row is not None and row.bitmap:
+            try:
+                bits = bytearray(zlib.decompress(bytes(row.bitmap)))
+            except zlib.error:
+                logger.warning(f"Discarding unreadable {kind} seen set {row.id}")
+        return cls(kind, user, session_id or '', bits)
+
+    def __contains__(self, pk):
+        byte = pk >> 3
+        return byte < len(self.bits) and bool(self.bits[byte] >> (pk & 7) & 1)
+
+    def __iter__(self):
+        for byte_index, byte in enumerate(self.bits):
+            if byte:
+                for bit in range(8):
+                    if byte >> bit & 1:
+                        yield byte_index * 8 + bit
+
+    def __len__(self):
+        return int.from_bytes(self.bits, 'little').bit_count()
+
+    def add(self, pk):
+        byte = pk >> 3
+        if byte >= len(self.bits):
+            self.bits.extend(bytes(byte + 1 - len(self.bits)))
+        if not self.bits[byte] >> (pk & 7) & 1:
+            self.bits[byte] |= 1 << (pk & 7)
+            self.changed = True
+
+    def update(self, pks):
+        for pk in pks:
+            self.add(pk)
+
+    def discard(self, pk):
+        byte = pk >> 3
+        if byte < len(self.bits) and self.bits[byte] >> (pk & 7) & 1:
+            self.bits[byte] &= ~(1 << (pk & 7)) & 0xFF
+            self.changed = True
+
+    def clear(self):
+        if self.bits:
+            self.bits = bytearray()
+            self.changed = True
+
+    def save(self):
+        """Write the set if it changed; the unique constraints keep one row per learner and kind"""
+        if not self.changed or (self.user is None and not self.session_id):
+            return
+        SeenQuestionSet.objects.update_or_create(
+            user=self.user,
+            session_id='' if self.user else self.session_id,
+            kind=self.kind,
+            defaults={'bitmap': zlib.compress(bytes(self.bits)), 'updated_at': timezone.now()}
+        )
+        self.changed = False
+
+
+def parse_answered_ids(raw, max_pk=None):
+    """
+    Question ids from a comma-separated answered_ids parameter, at most
+    ANSWERED_IDS_MAX_COUNT of them; anything not a number, or above max_pk
+    when given, is skipped
+    """
+    ids = []
+    for part in (raw or '').split(',', ANSWERED_IDS_MAX_COUNT)[:ANSWERED_IDS_MAX_COUNT]:
+        part = part.strip()
+        # Ids are at most 18 ASCII digits; longer numbers can't be question ids
+        if not (part.isascii() and part.isdigit() and len(part) <= 18):
+            continue
+        pk = int(part)
+        if max_pk is None or pk <= max_pk:
+            ids.append(pk)
+    return ids
+
+
+def load_seen_set(request, kind, session_id=None):
+    """The requesting learner's SeenSet of `kind`, with the request's answered_ids merged in"""
+    user = request.user if request.user.is_authenticated else None
+    seen = SeenSet.load(kind, user, session_id)
+    raw = request.GET.get('answered_ids')
+    if raw:
+        sampler = _SAMPLERS.get(kind)
+        seen.update(parse_answered_ids(raw, sampler.max_pk() if sampler is not None else 0))
+    return seen
+
+
+def queue_unseen(sampler, seen, needed, **criteria):
+    """
+    sampler.queue() of the questions not in seen. When fewer than needed are
+    left, the seen questions matching the criteria are forgotten (the rest
+    of the learner's history stays).
+    """
+    queue = sampler.queue(exclude=seen, **criteria)
+    if len(queue) < needed and len(seen):
+        matching = [pk for pk in seen if queue.matches(pk)]
+        if matching:
+            logger.debug(f"Learner has seen all but {len(queue)} matching {seen.kind} questions, forgetting {len(matching)} of them")
+            for pk in matching:
+                seen.discard(pk)
+            queue = sampler.queue(exclude=seen, **criteria)
+    return queue
+
+
+def prune_seen_sets():
+    """Delete the session-keyed seen sets not updated for SEEN_QUESTIONS_SESSION_RETENTION_DAYS; returns how many"""
+    deleted, _ = SeenQuestionSet.objects.filter(user__isnull=True, updated_at__lt=_session_cutoff()).delete()
+    return deleted
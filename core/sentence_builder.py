@@ -3,9 +3,11 @@ import random
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
-from .models import SentenceBuilderLevel, SentenceBuilderSentence, SentenceBuilderGameSession, UserSentenceProgress
-from .game_utils import filter_by_age_appropriate, get_age_from_birthdate, get_difficulty_by_age
+from .models import SentenceBuilderLevel, SentenceBuilderGameSession, UserSentenceProgress
+from .game_utils import get_age_from_birthdate, get_difficulty_by_age
 from django.shortcuts import render
+from .sampling import SENTENCES
+from .level_catalog import get_level
 
 def sentence_builder(request):
     return render(request, 'sentence_builder/sentence_builder.html')
@@ -15,21 +17,11 @@ def get_level_sentences(request):
     level_number = int(request.GET.get('level', 1))
     
     try:
-        # Filter levels by age-appropriate difficulty
-        levels = SentenceBuilderLevel.objects.filter(level_number=level_number)
-        user = request.user if request.user.is_authenticated else None
-        levels_query = filter_by_age_appropriate(user, levels, 'difficulty')
-        level = levels_query.first()
-        
-        if not level:
-            # Fallback to default level if age filtering removes it
-            level = SentenceBuilderLevel.objects.get(level_number=level_number)
+        # Level numbers are unique, so age filtering always fell back to this level
+        level = get_level('sentence_builder', level_number)
         
         # Filter sentences by age-appropriate level
-        sentences = SentenceBuilderSentence.objects.filter(
-            level=level,
-            is_active=True
-        ).order_by('?')[:level.sentences_required]  # Random selection
+        sentences = SENTENCES.sample(level.sentences_required, level_id=[level.pk])  # Random selection
         
         sentences_data = []
         for sentence_obj in sentences:
@@ -133,15 +125,7 @@ def get_next_level(request):
     next_level = current_level + 1
     
     try:
-        # Filter levels by age-appropriate difficulty
-        levels = SentenceBuilderLevel.objects.filter(level_number=next_level)
-        user = request.user if request.user.is_authenticated else None
-        levels_query = filter_by_age_appropriate(user, levels, 'difficulty')
-        level = levels_query.first()
-        
-        if not level:
-            # Fallback to default level if age filtering removes it
-            level = SentenceBuilderLevel.objects.get(level_number=next_level)
+        level = get_level('sentence_builder', next_level)
         
         return JsonResponse({
             'level_number': level.level_number,
@@ -0,0 +1,225 @@
+"""
+Single-flight coalescing of identical AI batch generations.
+
+When a class starts a lesson, dozens of learners of the same age ask for the
+same level within seconds and each level would send its own identical batch
+completions. The ai_*_generator batch functions go through coalesce() with
+their generation parameters as the key, so identical requests share calls:
+
+- The first request for a key sends the batch (it leads the flight). When
+  the key was asked for within the last LLM_COALESCE_BURST_SECONDS it also
+  asks for up to LLM_COALESCE_MAX_SPARE_ITEMS extra items, sized by that
+  recent demand, for the requests still to come.
+- A request arriving while a flight is in the air reserves items of it if
+  the flight asked for enough, and waits for it instead of sending its own.
+  Otherwise it leads a new flight.
+- Each request gets its own items of the flight's result, never one another
+  request got. Items nobody reserved are kept for LLM_COALESCE_LEFTOVER_SECONDS
+  and handed to the next request for the key without any call.
+
+A waiting request gives up after LLM_COALESCE_WAIT_SECONDS, or at its level's
+deadline, and gets empty slots, which the views fill like any failed AI slot.
+acoalesce() is the same for the async level views; sync and async requests
+share flights.
+"""
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from django.conf import settings
+from .deadlines import clamp_timeout
+
+logger = logging.getLogger(__name__)
+
+LLM_COALESCE_ENABLED = getattr(settings, 'LLM_COALESCE_ENABLED', True)
+LLM_COALESCE_BURST_SECONDS = getattr(settings, 'LLM_COALESCE_BURST_SECONDS', 10)
+LLM_COALESCE_MAX_SPARE_ITEMS = getattr(settings, 'LLM_COALESCE_MAX_SPARE_ITEMS', 2)
+LLM_COALESCE_LEFTOVER_SECONDS = getattr(settings, 'LLM_COALESCE_LEFTOVER_SECONDS', 120)
+LLM_COALESCE_WAIT_SECONDS = getattr(settings, 'LLM_COALESCE_WAIT_SECONDS', 20)
+
+_lock = threading.Lock()
+_keys = {}  # key -> {'flights': [...], 'leftovers': deque of (expires_at, item), 'demand': deque of (at, count)}
+_stats = {}  # kind -> counters
+
+
+class _Flight:
+    """One batch generation in the air and the share of it each request reserved"""
+
+    def __init__(self, size):
+        self.size = size
+        self.reserved = 0
+        self.abandoned = []  # (offset, count) of reservations whose request stopped waiting
+        self.items = None
+        self.landed = Future()
+
+
+def _entry(key):
+    # Callers hold _lock
+    entry = _keys.get(key)
+    if entry is None:
+        entry = _keys[key] = {'flights': [], 'leftovers': deque(), 'demand': deque()}
+    return entry
+
+
+def _count(kind, counter, amount=1):
+    # Callers hold _lock
+    stats = _stats.get(kind)
+    if stats is None:
+        stats = _stats[kind] = {
+            'requests': 0,
+            'flights': 0,
+            'joined': 0,
+            'spare_items': 0,
+            'leftover_items_served': 0,
+            'leftover_items_expired': 0,
+            'wait_timeouts': 0,
+        }
+    stats[counter] += amount
+
+
+def _plan(key, count):
+    """
+    Decide how a request for `count` items of `key` is served. Returns
+    (leftover items, flight, offset, lead): the request takes the leftovers,
+    then count - len(leftovers) items at offset of flight, sending the
+    flight itself when lead is True. flight is None when leftovers cover it.
+    """
+    kind = key[0]
+    now = time.monotonic()
+    with _lock:
+        entry = _entry(key)
+        _count(kind, 'requests')
+
+        demand = entry['demand']
+        while demand and demand[0][0] < now - LLM_COALESCE_BURST_SECONDS:
+            demand.popleft()
+        recent_demand = sum(requested for _, requested in demand)
+        demand.append((now, count))
+
+        leftovers = entry['leftovers']
+        while leftovers and leftovers[0][0] < now:
+            leftovers.popleft()
+            _count(kind, 'leftover_items_expired')
+        taken = []
+        while leftovers and len(taken) < count:
+            taken.append(leftovers.popleft()[1])
+        if taken:
+            _count(kind, 'leftover_items_served', len(taken))
+
+        needed = count - len(taken)
+        if not needed:
+            return taken, None, 0, False
+
+        for flight in entry['flights']:
+            if flight.size - flight.reserved >= needed:
+                offset = flight.reserved
+                flight.reserved += needed
+                _count(kind, 'joined')
+                return taken, flight, offset, False
+
+        spare = min(LLM_COALESCE_MAX_SPARE_ITEMS, recent_demand)
+        flight = _Flight(needed + spare)
+        flight.reserved = needed
+        entry['flights'].append(flight)
+        _count(kind, 'flights')
+        _count(kind, 'spare_items', spare)
+        return taken, flight, 0, True
+
+
+def _land(key, flight, items):
+    """Publish a flight's items and keep what nobody reserved as leftovers"""
+    items = list(items or [])[:flight.size]
+    # Valid items go to the earliest reservations, empty slots to the last ones
+    valid = [item for item in items if item is not None]
+    items = valid + [None] * (flight.size - len(valid))
+
+    expires_at = time.monotonic() + LLM_COALESCE_LEFTOVER_SECONDS
+    with _lock:
+        flight.items = items
+        entry = _entry(key)
+        entry['flights'].remove(flight)
+        unclaimed = items[flight.reserved:]
+        for offset, count in flight.abandoned:
+            unclaimed += items[offset:offset + count]
+        entry['leftovers'].extend((expires_at, item) for item in unclaimed if item is not None)
+    flight.landed.set_result(None)
+
+
+def _share(key, flight, offset, count):
+    with _lock:
+        if flight.items is None:
+            # Stopped waiting: whatever lands for this reservation becomes leftovers
+            flight.abandoned.append((offset, count))
+            _count(key[0], 'wait_timeouts')
+            return [None] * count
+    return flight.items[offset:offset + count]
+
+
+def coalesce(key, count, generate):
+    """
+    Run generate(n) -> list of n items (None for empty slots) for `count`
+    items of `key`, sharing the call with identical requests in flight.
+    key is a tuple of the generation parameters starting with the item kind.
+    Returns a list of length count.
+    """
+    if not LLM_COALESCE_ENABLED or count <= 0:
+        return generate(count) if count > 0 else []
+
+    taken, flight, offset, lead = _plan(key, count)
+    if flight is None:
+        return taken
+
+    needed = count - len(taken)
+    if lead:
+        items = None
+        try:
+            items = generate(flight.size)
+        finally:
+            _land(key, flight, items)
+    else:
+        logger.debug(f"Waiting on the in-flight {key[0]} batch for {key}")
+        try:
+            flight.landed.result(timeout=clamp_timeout(LLM_COALESCE_WAIT_SECONDS))
+        except FutureTimeoutError:
+            pass
+    return taken + _share(key, flight, offset, needed)
+
+
+async def acoalesce(key, count, agenerate):
+    """coalesce for the async generators: agenerate(n) is a coroutine function"""
+    if not LLM_COALESCE_ENABLED or count <= 0:
+        return await agenerate(count) if count > 0 else []
+
+    taken, flight, offset, lead = _plan(key, count)
+    if flight is None:
+        return taken
+
+    needed = count - len(taken)
+    if lead:
+        items = None
+        try:
+            items = await agenerate(flight.size)
+        finally:
+            # Also runs when the level timed out and cancelled this batch
+            _land(key, flight, items)
+    else:
+        logger.debug(f"Waiting on the in-flight {key[0]} batch for {key}")
+        try:
+            await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(flight.landed)), clamp_timeout(LLM_COALESCE_WAIT_SECONDS))
+        except asyncio.TimeoutError:
+            pass
+    return taken + _share(key, flight, offset, needed)
+
+
+def get_coalescing_snapshot():
+    """Per item kind: requests, flights sent, requests that joined a flight and leftover/spare item counters"""
+    with _lock:
+        snapshot = {kind: dict(stats) for kind, stats in _stats.items()}
+        for key, entry in _keys.items():
+            stats = snapshot.get(key[0])
+            if stats is not None:
+                stats['in_flight'] = stats.get('in_flight', 0) + len(entry['flights'])
+                stats['leftover_items'] = stats.get('leftover_items', 0) + len(entry['leftovers'])
+    return snapshot
@@ -0,0 +1,39 @@
+"""
+Newline-delimited JSON (NDJSON) responses for the streaming level endpoints.
+
+A streaming level view returns ndjson_response(records) where records is a
+generator of dicts; each one is sent as a JSON line as soon as it is
+produced. The generator runs while the response body is being sent, after
+the view and the middleware have returned, so it is run inside a copy of the
+view's context (LLMEndpointMiddleware has reset the endpoint by then).
+"""
+import contextvars
+import json
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+
+def ndjson_response(records):
+    """StreamingHttpResponse sending every dict from records as one JSON line"""
+    context = contextvars.copy_context()
+    iterator = iter(records)
+
+    def lines():
+        try:
+            while True:
+                try:
+                    record = context.run(next, iterator)
+                except StopIteration:
+                    return
+                yield json.dumps(record, cls=DjangoJSONEncoder) + "\n"
+        finally:
+            # Client went away: let the generator run its cleanup in the same context
+            close = getattr(iterator, 'close', None)
+            if close:
+                context.run(close)
+
+    response = StreamingHttpResponse(lines(), content_type='application/x-ndjson')
+    response['Cache-Control'] = 'no-cache'
+    # Don't let a proxy (nginx) hold lines back until the level is complete
+    response['X-Accel-Buffering'] = 'no'
+    return response
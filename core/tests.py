@@ -1,3 +1,548 @@
-from django.test import TestCase
+import os
+import random
+import tempfile
+import threading
+import time
+import uuid
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.test import RequestFactory, SimpleTestCase, TestCase
+from django.utils import timezone
+
+from core import deadlines, llm_client, llm_metrics, llm_quota, near_duplicates, single_flight
+from core import ai_question_pool
+from core.ai_batch import collect_batch
+from core.ai_harvest import content_hash
+from core.ai_math_generator import validate_ai_math_problem
+from core.ai_riddles_generator import validate_ai_riddle
+from core.deadlines import DeadlineExceeded
+from core.llm_client import CLOSED, HALF_OPEN, OPEN, CircuitOpenError
+from core.llm_quota import BACKGROUND, INTERACTIVE, PREFETCH, QuotaExceeded
+from core.models import AIQuestionPoolItem, QuizCategory, QuizQuestion, SeenQuestionSet
+from core.near_duplicates import RECENT_RIDDLES_CAPACITY, RecentRiddles, sketch
+from core.sampling import QUIZ_QUESTIONS
+from core.seen_questions import (
+    ANSWERED_IDS_MAX_COUNT, SeenSet, load_seen_set, parse_answered_ids, prune_seen_sets, queue_unseen,
+)
+
+
+def unique_name(prefix):
+    return f"{prefix}-{uuid.uuid4().hex[:8]}"
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def setUp(self):
+        self.model = unique_name('breaker-test')
+
+    def state(self):
+        return llm_client.get_breaker_snapshot()[self.model]['state']
+
+    def fail(self, times):
+        for _ in range(times):
+            llm_client._acquire_call(self.model)
+            llm_client._record_result(self.model, False)
+
+    def test_opens_after_consecutive_failures(self):
+        self.fail(llm_client.LLM_BREAKER_FAILURE_THRESHOLD - 1)
+        self.assertEqual(self.state(), CLOSED)
+
+        self.fail(1)
+        self.assertEqual(self.state(), OPEN)
+        with self.assertRaises(CircuitOpenError):
+            llm_client._acquire_call(self.model)
+        self.assertEqual(llm_client.get_breaker_snapshot()[self.model]['short_circuited'], 1)
+
+    def test_success_resets_the_failure_count(self):
+        self.fail(llm_client.LLM_BREAKER_FAILURE_THRESHOLD - 1)
+        llm_client._acquire_call(self.model)
+        llm_client._record_result(self.model, True)
+        self.fail(llm_client.LLM_BREAKER_FAILURE_THRESHOLD - 1)
+        self.assertEqual(self.state(), CLOSED)
+
+    def test_half_open_lets_one_probe_through(self):
+        self.fail(llm_client.LLM_BREAKER_FAILURE_THRESHOLD)
+        with mock.patch.object(llm_client, 'LLM_BREAKER_RESET_TIMEOUT', 0):
+            self.assertTrue(llm_client.is_available(self.model))
+            llm_client._acquire_call(self.model)
+            self.assertEqual(self.state(), HALF_OPEN)
+            # A second call while the probe is in flight is short-circuited
+            self.assertFalse(llm_client.is_available(self.model))
+            with self.assertRaises(CircuitOpenError):
+                llm_client._acquire_call(self.model)
+
+    def test_successful_probe_closes(self):
+        self.fail(llm_client.LLM_BREAKER_FAILURE_THRESHOLD)
+        with mock.patch.object(llm_client, 'LLM_BREAKER_RESET_TIMEOUT', 0):
+            llm_client._acquire_call(self.model)
+        llm_client._record_result(self.model, True)
+        self.assertEqual(self.state(), CLOSED)
+        llm_client._acquire_call(self.model)
+
+    def test_failed_probe_reopens(self):
+        self.fail(llm_client.LLM_BREAKER_FAILURE_THRESHOLD)
+        with mock.patch.object(llm_client, 'LLM_BREAKER_RESET_TIMEOUT', 0):
+            llm_client._acquire_call(self.model)
+        llm_client._record_result(self.model, False)
+        self.assertEqual(self.state(), OPEN)
+        self.assertEqual(llm_client.get_breaker_snapshot()[self.model]['trips'], 2)
+        with self.assertRaises(CircuitOpenError):
+            llm_client._acquire_call(self.model)
+
+
+class CoalesceTests(SimpleTestCase):
+    def setUp(self):
+        self.key = ('test', unique_name('coalesce'))
+        # A request for the key within the burst window makes the next flight ask for a spare item
+        self.assertEqual(single_flight.coalesce(self.key, 1, lambda n: ['warm-up'] * n), ['warm-up'])
+
+    def start_flight(self, generate):
+        """Leader request in a thread, blocked in generate until the returned event is set"""
+        started, release, results = threading.Event(), threading.Event(), {}
+
+        def blocked_generate(n):
+            started.set()
+            release.wait(5)
+            return generate(n)
+
+        def lead():
+            try:
+                results['leader'] = single_flight.coalesce(self.key, 1, blocked_generate)
+            except Exception as e:
+                results['leader_error'] = e
+
+        leader = threading.Thread(target=lead)
+        leader.start()
+        self.assertTrue(started.wait(5))
+        return leader, release, results
+
+    def join_flight(self, results):
+        waiter = threading.Thread(target=lambda: results.setdefault('waiter', single_flight.coalesce(self.key, 1, self.must_not_generate)))
+        waiter.start()
+        flight = single_flight._keys[self.key]['flights'][0]
+        deadline = time.monotonic() + 5
+        while flight.reserved < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(flight.reserved, 2)
+        return waiter
+
+    @staticmethod
+    def must_not_generate(n):
+        raise AssertionError("a request that could join a flight sent its own")
+
+    def test_waiters_get_distinct_items(self):
+        sizes = []
+
+        def generate(n):
+            sizes.append(n)
+            return [f'item-{i}' for i in range(n)]
+
+        leader, release, results = self.start_flight(generate)
+        waiter = self.join_flight(results)
+        release.set()
+        leader.join(5)
+        waiter.join(5)
+
+        self.assertEqual(sizes, [2])
+        self.assertEqual(sorted(results['leader'] + results['waiter']), ['item-0', 'item-1'])
+
+    def test_unreserved_items_are_served_as_leftovers(self):
+        self.assertEqual(single_flight.coalesce(self.key, 1, lambda n: [f'item-{i}' for i in range(n)]), ['item-0'])
+        # The spare item of that flight answers the next request without a call
+        self.assertEqual(single_flight.coalesce(self.key, 1, self.must_not_generate), ['item-1'])
+
+    def test_empty_slots_go_to_the_last_reservations(self):
+        self.assertEqual(single_flight.coalesce(self.key, 1, lambda n: [None, 'item']), ['item'])
+
+    def test_leader_failure_leaves_waiters_empty_slots(self):
+        def generate(n):
+            raise RuntimeError("batch failed")
+
+        leader, release, results = self.start_flight(generate)
+        waiter = self.join_flight(results)
+        release.set()
+        leader.join(5)
+        waiter.join(5)
+
+        self.assertIsInstance(results['leader_error'], RuntimeError)
+        self.assertEqual(results['waiter'], [None])
+        # The failed flight is gone: the next request sends its own
+        self.assertEqual(single_flight._keys[self.key]['flights'], [])
+        self.assertEqual(single_flight.coalesce(self.key, 1, lambda n: ['retry'] * n)[0], 'retry')
+
+
+class QuotaTests(SimpleTestCase):
+    """Buckets of {'rpm': 100, 'tpm': 1000} in a throwaway SQLite file; calls never wait"""
+
+    def setUp(self):
+        self.model = unique_name('quota-test')
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.reset_connection()
+        self.addCleanup(self.reset_connection)
+        for patcher in (
+            mock.patch.object(llm_quota, 'LLM_CACHE_PATH', os.path.join(directory.name, 'quota.sqlite3')),
+            mock.patch.object(llm_quota, 'LLM_QUOTA_ENABLED', True),
+            mock.patch.object(llm_quota, 'LLM_QUOTA_MAX_WAIT_SECONDS', 0),
+            mock.patch.dict(llm_quota.LLM_QUOTA_LIMITS, {self.model: {'rpm': 100, 'tpm': 1000}}),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    @staticmethod
+    def reset_connection():
+        conn = getattr(llm_quota._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            llm_quota._local.conn = None
+
+    def bucket(self):
+        row = llm_quota._connection().execute(
+            "SELECT requests, tokens FROM llm_quota_buckets WHERE model = ?", (self.model,)
+        ).fetchone()
+        # Buckets refill while the test runs; whole units are enough here
+        return (int(row[0]), int(row[1])) if row else None
+
+    def test_lower_priorities_leave_headroom(self):
+        llm_quota.acquire(self.model, 550, INTERACTIVE)
+
+        # 450 of 1000 tokens left: background calls must leave 500
+        with self.assertRaises(QuotaExceeded):
+            llm_quota.acquire(self.model, 100, BACKGROUND)
+        # ...prefetch calls 250
+        llm_quota.acquire(self.model, 100, PREFETCH)
+        with self.assertRaises(QuotaExceeded):
+            llm_quota.acquire(self.model, 150, PREFETCH)
+        # ...and interactive calls may take the rest
+        llm_quota.acquire(self.model, 300, INTERACTIVE)
+        self.assertEqual(self.bucket(), (97, 50))
+
+    def test_priority_comes_from_the_context(self):
+        token = llm_quota.call_priority.set(INTERACTIVE)
+        self.addCleanup(llm_quota.call_priority.reset, token)
+        llm_quota.acquire(self.model, 900)
+        self.assertEqual(self.bucket(), (99, 100))
+
+    def test_release_returns_unused_tokens(self):
+        llm_quota.acquire(self.model, 500, INTERACTIVE)
+        llm_quota.release(self.model, 500, 200)
+        self.assertEqual(self.bucket(), (99, 800))
+
+    def test_release_of_an_unsent_call_returns_the_whole_reservation(self):
+        llm_quota.acquire(self.model, 500, INTERACTIVE)
+        llm_quota.release(self.model, 500, sent=False)
+        self.assertEqual(self.bucket(), (100, 1000))
+
+    def test_no_quota_is_taken_once_the_deadline_passed(self):
+        with mock.patch.object(llm_client, 'client', mock.Mock()), \
+                mock.patch.object(llm_metrics, 'LLM_METRICS_PERSIST', False), \
+                deadlines.level_budget(0):
+            with self.assertRaises(DeadlineExceeded):
+                llm_client.chat_completion(self.model, [{'role': 'user', 'content': 'hi'}], fresh=True)
+        self.assertIsNone(self.bucket())
+
+
+def make_quiz_questions(category, count, age_band=''):
+    return [
+        QuizQuestion.objects.create(
+            category=category, question_text=f"{category.name} question {i}", option_a='a', option_b='b',
+            option_c='c', option_d='d', correct_option='A', age_band=age_band,
+        )
+        for i in range(count)
+    ]
+
+
+class RandomQueueTests(TestCase):
+    def setUp(self):
+        self.category = QuizCategory.objects.create(name='Animals', difficulty='easy')
+        self.other_category = QuizCategory.objects.create(name='Plants', difficulty='easy')
+        self.questions = make_quiz_questions(self.category, 20) + make_quiz_questions(self.category, 5, age_band='7-9')
+        self.other_questions = make_quiz_questions(self.other_category, 10)
+        self.ids = {question.pk for question in self.questions}
+
+    def test_returns_every_matching_row_once(self):
+        queue = QUIZ_QUESTIONS.queue(category_id=[self.category.pk])
+        self.assertEqual(len(queue), 25)
+        taken = [row.pk for row in queue.take(10)] + [queue.pop().pk for _ in range(15)]
+        self.assertEqual(len(taken), len(set(taken)))
+        self.assertEqual(set(taken), self.ids)
+        self.assertEqual(len(queue), 0)
+        self.assertEqual(queue.take(5), [])
+        with self.assertRaises(IndexError):
+            queue.pop()
+
+    def test_leaves_out_excluded_ids(self):
+        excluded = [question.pk for question in self.questions[:18]] + [self.other_questions[0].pk]
+        queue = QUIZ_QUESTIONS.queue(exclude=excluded, category_id=[self.category.pk])
+        # Excluded ids outside the criteria don't count against what is left
+        self.assertEqual(len(queue), 7)
+        taken = {row.pk for row in queue.take(25)}
+        self.assertEqual(taken, self.ids - set(excluded))
+
+    def test_filters_by_every_key_field(self):
+        queue = QUIZ_QUESTIONS.queue(category_id=[self.category.pk, self.other_category.pk], age_band=['7-9'])
+        self.assertEqual({row.age_band for row in queue.take(30)}, {'7-9'})
+        self.assertEqual(len(QUIZ_QUESTIONS.queue(age_band=[''])), 30)
+        with self.assertRaises(ValueError):
+            QUIZ_QUESTIONS.queue(level_id=[1])
+
+    def test_sees_rows_added_after_it_was_built(self):
+        self.assertEqual(len(QUIZ_QUESTIONS.queue(category_id=[self.other_category.pk])), 10)
+        added = make_quiz_questions(self.other_category, 1)[0]
+        self.assertIn(added.pk, {row.pk for row in QUIZ_QUESTIONS.sample(11, category_id=[self.other_category.pk])})
+
+
+class SeenSetTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='learner', password='secret')
+
+    def test_round_trip_for_a_user(self):
+        seen = SeenSet.load('quiz', self.user)
+        seen.update([3, 17, 1000])
+        seen.save()
+
+        loaded = SeenSet.load('quiz', self.user)
+        self.assertEqual(sorted(loaded), [3, 17, 1000])
+        self.assertNotIn(4, loaded)
+        self.assertEqual(len(SeenSet.load('riddle', self.user)), 0)
+
+    def test_round_trip_for_an_anonymous_session(self):
+        seen = SeenSet.load('quiz', None, 'session-1')
+        seen.add(42)
+        seen.save()
+
+        self.assertIn(42, SeenSet.load('quiz', None, 'session-1'))
+        self.assertEqual(len(SeenSet.load('quiz', None, 'session-2')), 0)
+        self.assertEqual(len(SeenSet.load('quiz', self.user)), 0)
+
+    def test_unknown_learners_are_not_saved(self):
+        for session_id in (None, '', 'anonymous'):
+            seen = SeenSet.load('quiz', None, session_id)
+            seen.add(1)
+            seen.save()
+        self.assertFalse(SeenQuestionSet.objects.exists())
+
+    def test_one_row_per_learner_and_kind(self):
+        first, second = SeenSet.load('quiz', None, 'session-1'), SeenSet.load('quiz', None, 'session-1')
+        first.add(1)
+        first.save()
+        second.add(2)
+        second.save()
+        self.assertEqual(SeenQuestionSet.objects.filter(session_id='session-1', kind='quiz').count(), 1)
+        self.assertEqual(list(SeenSet.load('quiz', None, 'session-1')), [2])
+
+    def test_expired_session_sets_are_ignored_and_pruned(self):
+        for session_id in ('old', 'recent'):
+            seen = SeenSet.load('quiz', None, session_id)
+            seen.add(5)
+            seen.save()
+        seen = SeenSet.load('quiz', self.user)
+        seen.add(5)
+        seen.save()
+        SeenQuestionSet.objects.exclude(session_id='recent').update(updated_at=timezone.now() - timedelta(days=365))
+
+        self.assertEqual(len(SeenSet.load('quiz', None, 'old')), 0)
+        self.assertIn(5, SeenSet.load('quiz', self.user))
+        self.assertEqual(prune_seen_sets(), 1)
+        self.assertEqual(SeenQuestionSet.objects.count(), 2)
+
+    def answered_ids_request(self, answered_ids):
+        request = RequestFactory().get('/', {'answered_ids': answered_ids})
+        request.user = AnonymousUser()
+        return request
+
+    def test_load_seen_set_merges_answered_ids(self):
+        category = QuizCategory.objects.create(name='Animals', difficulty='easy')
+        first, second = make_quiz_questions(category, 2)
+        seen = load_seen_set(self.answered_ids_request(f'{first.pk},x,{second.pk},²'), 'quiz', 'session-1')
+        self.assertEqual(sorted(seen), [first.pk, second.pk])
+
+    def test_answered_ids_cannot_grow_the_set_past_the_questions(self):
+        category = QuizCategory.objects.create(name='Animals', difficulty='easy')
+        question = make_quiz_questions(category, 1)[0]
+        answered_ids = f'{question.pk},1000000000,100000000000,{"9" * 5000}'
+        seen = load_seen_set(self.answered_ids_request(answered_ids), 'quiz', 'session-1')
+        self.assertEqual(list(seen), [question.pk])
+        self.assertLessEqual(len(seen.bits), question.pk // 8 + 1)
+
+    def test_answered_ids_are_capped(self):
+        self.assertEqual(len(parse_answered_ids(','.join(['1'] * 5000))), ANSWERED_IDS_MAX_COUNT)
+
+    def test_queue_unseen_forgets_only_the_exhausted_questions(self):
+        category = QuizCategory.objects.create(name='Animals', difficulty='easy')
+        other_category = QuizCategory.objects.create(name='Plants', difficulty='easy')
+        questions = {question.pk for question in make_quiz_questions(category, 6)}
+        other_questions = {question.pk for question in make_quiz_questions(other_category, 6)}
+        seen = SeenSet('quiz', self.user)
+        seen.update(questions | other_questions)
+
+        queue = queue_unseen(QUIZ_QUESTIONS, seen, 3, category_id=[category.pk])
+
+        self.assertEqual(len(queue), 6)
+        self.assertEqual({row.pk for row in queue.take(6)}, questions)
+        self.assertEqual(set(seen), other_questions)
+        self.assertTrue(seen.changed)
+
+
+class RecentRiddlesTests(SimpleTestCase):
+    def setUp(self):
+        self.cache_key = unique_name('recent-riddles-test')
+        self.addCleanup(RecentRiddles.clear, self.cache_key)
+        words_random = random.Random(7)
+        self.words = [''.join(words_random.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(6)) for _ in range(500)]
+        self.texts_random = random.Random(11)
+
+    def riddle_text(self):
+        return ' '.join(self.texts_random.choice(self.words) for _ in range(12))
+
+    @staticmethod
+    def reworded(text):
+        """A near-duplicate of text that is not an exact repeat"""
+        return text + ' indeed'
+
+    def test_finds_repeats_and_near_duplicates(self):
+        recent = RecentRiddles(self.cache_key)
+        text = self.riddle_text()
+        recent.add(sketch(text))
+        self.assertTrue(recent.contains(sketch(text)))
+        self.assertTrue(recent.contains(sketch(self.reworded(text))))
+        self.assertFalse(recent.contains(sketch(self.riddle_text())))
+
+    def test_ring_wraps_around(self):
+        recent = RecentRiddles(self.cache_key)
+        texts = [self.riddle_text() for _ in range(RECENT_RIDDLES_CAPACITY + 10)]
+        for text in texts:
+            recent.add(sketch(text))
+
+        self.assertEqual(len(recent), RECENT_RIDDLES_CAPACITY)
+        self.assertEqual(recent.head, RECENT_RIDDLES_CAPACITY + 10)
+        # The oldest riddles left the ring: only exact repeats (the Bloom filter) still match them
+        self.assertTrue(recent.contains(sketch(texts[0])))
+        self.assertFalse(any(recent.contains(sketch(self.reworded(text))) for text in texts[:10]))
+        self.assertTrue(all(recent.contains(sketch(self.reworded(text))) for text in texts[-10:]))
+
+    def test_save_and_load(self):
+        recent = RecentRiddles(self.cache_key)
+        texts = [self.riddle_text() for _ in range(RECENT_RIDDLES_CAPACITY + 10)]
+        for text in texts:
+            recent.add(sketch(text))
+        recent.save()
+
+        loaded = RecentRiddles.load(self.cache_key)
+        self.assertEqual(len(loaded), RECENT_RIDDLES_CAPACITY)
+        self.assertTrue(loaded.contains(sketch(self.reworded(texts[-1]))))
+        self.assertFalse(loaded.contains(sketch(self.reworded(texts[0]))))
+
+        # A later save writes only the page that changed
+        loaded.add(sketch(self.riddle_text()))
+        with mock.patch.object(cache, 'set_many', wraps=cache.set_many) as set_many:
+            loaded.save()
+        self.assertEqual(len(set_many.call_args[0][0]), 2)
+
+    def test_anonymous_players_are_not_stored(self):
+        recent = RecentRiddles.load(None)
+        recent.add(sketch(self.riddle_text()))
+        recent.save()
+        self.assertEqual(len(RecentRiddles.load(None)), 0)
+
+    def test_bloom_filter_starts_over_when_full(self):
+        recent = RecentRiddles(self.cache_key)
+        with mock.patch.object(near_duplicates, 'BLOOM_MAX_ITEMS', 3):
+            for _ in range(3):
+                recent.add(sketch(self.riddle_text()))
+            self.assertEqual(recent.bloom_items, 3)
+
+            last = sketch(self.riddle_text())
+            recent.add(last)
+
+        self.assertEqual(recent.bloom_items, 1)
+        set_bits = {position for position in range(len(recent.bloom) * 8) if recent.bloom[position >> 3] >> (position & 7) & 1}
+        self.assertEqual(set_bits, set(recent._bloom_positions(last.fingerprint)))
+        # The ring still remembers the riddles the filter forgot
+        self.assertEqual(len(recent), 4)
+
+
+class AIValidationTests(SimpleTestCase):
+    riddle = {
+        'question': "I have hands but cannot clap. What am I?",
+        'answer': "A clock",
+        'distractors': ["A glove", "A tree", "A chair"],
+        'explanation': "A clock has hands that point at the time.",
+    }
+    math_problem = {'problem_text': "12 + 7", 'display_text': "12 + 7 = ?", 'correct_answer': "19", 'operation': '+'}
+
+    def setUp(self):
+        patcher = mock.patch.object(llm_metrics, 'LLM_METRICS_PERSIST', False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_valid_riddle_passes(self):
+        self.assertEqual(validate_ai_riddle(dict(self.riddle)), self.riddle)
+
+    def test_riddles_must_be_text(self):
+        for changes in (
+            {'answer': 4, 'distractors': [1, 2, 3]},
+            {'question': None},
+            {'explanation': '  '},
+            {'distractors': ["A glove", 7, "A chair"]},
+            {'distractors': "A glove, A tree, A chair"},
+            {'distractors': ["A glove", "a clock", "A chair"]},
+        ):
+            with self.subTest(changes=changes), self.assertRaises(ValueError):
+                validate_ai_riddle(dict(self.riddle, **changes))
+
+    def test_math_problems_need_text_and_a_whole_answer(self):
+        self.assertEqual(validate_ai_math_problem(dict(self.math_problem))['correct_answer'], 19)
+        for changes in (
+            {'correct_answer': [19]},
+            {'correct_answer': None},
+            {'correct_answer': True},
+            {'correct_answer': 'nineteen'},
+            {'correct_answer': 19.5},
+            {'problem_text': 12},
+            {'hint': ['add']},
+        ):
+            with self.subTest(changes=changes), self.assertRaises(ValueError):
+                validate_ai_math_problem(dict(self.math_problem, **changes))
+
+    def test_wrongly_typed_batch_item_leaves_only_its_slot_empty(self):
+        batch = [
+            {'question': "What has keys but opens no locks?", 'answer': 4, 'distractors': [1, 2, 3], 'explanation': None},
+            dict(self.riddle),
+        ]
+        items = collect_batch(lambda n: batch[:n], validate_ai_riddle, 2, max_rounds=1, label="riddle")
+        self.assertEqual(items, [self.riddle, None])
+
+
+class QuestionPoolTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(ai_question_pool, 'POOL_INLINE_REFILL', False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        AIQuestionPoolItem.objects.bulk_create([
+            AIQuestionPoolItem(
+                difficulty='easy', age_band='7-9', topic='Animals', question_text=f"Pooled question {i}",
+                options=['a', 'b', 'c', 'd'], correct_option='A', content_hash=content_hash(f"Pooled question {i}"),
+            )
+            for i in range(5)
+        ])
+
+    def test_pop_claims_each_question_once(self):
+        first = ai_question_pool.pop_pool_questions('easy', '7-9', 'Animals', 3)
+        second = ai_question_pool.pop_pool_questions('easy', '7-9', 'Animals', 3)
+        questions = [question['question'] for question in first + second]
+        self.assertEqual(len(questions), 5)
+        self.assertEqual(len(set(questions)), 5)
+        self.assertFalse(AIQuestionPoolItem.objects.exists())
+
+    def test_harvested_copies_of_served_questions_are_found(self):
+        category = QuizCategory.objects.create(name='Animals', difficulty='easy')
+        harvested = QuizQuestion.objects.create(
+            category=category, question_text="Pooled question 0", option_a='a', option_b='b', option_c='c',
+            option_d='d', correct_option='A', source='ai', content_hash=content_hash("Pooled question 0"),
+        )
+        served = ai_question_pool.pop_pool_questions('easy', '7-9', 'Animals', 2)
+        self.assertEqual(ai_question_pool.harvested_question_ids(served), [harvested.pk])
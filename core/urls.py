@@ -50,6 +50,8 @@ urlpatterns = [
     # Quiz Game
     path('quizes/', quiz_game.quizes, name='quizes'),
     path('api/quizes/level/', quiz_game.get_quiz_level, name='get_quiz_level'),
+    path('api/quizes/level/stream/', quiz_game.stream_quiz_level, name='stream_quiz_level'),
+    path('api/quizes/level/async/', quiz_game.get_quiz_level_async, name='get_quiz_level_async'),
     path('api/quizes/start-session/', quiz_game.start_quiz_session, name='start_quiz_session'),
     path('api/quizes/update-progress/', quiz_game.update_quiz_progress, name='update_quiz_progress'),
     path('api/quizes/next-level/', quiz_game.get_next_quiz_level, name='get_next_quiz_level'),
@@ -58,6 +60,8 @@ urlpatterns = [
     # Riddles Game URLs
     path('riddles/', riddles_game.riddles_game, name='riddles'),
     path('api/riddles/level/', riddles_game.get_riddle_level, name='get_riddle_level'),
+    path('api/riddles/level/stream/', riddles_game.stream_riddle_level, name='stream_riddle_level'),
+    path('api/riddles/level/async/', riddles_game.get_riddle_level_async, name='get_riddle_level_async'),
     path('api/riddles/start/', riddles_game.start_riddle_session, name='start_riddle_session'),
     path('api/riddles/update/', riddles_game.update_riddle_progress, name='update_riddle_progress'),
     path('api/riddles/next-level/', riddles_game.get_next_riddle_level, name='get_next_riddle_level'),
@@ -67,6 +71,7 @@ urlpatterns = [
     # Math Game
     path('math-game/', math_game.math_game, name='math_game'),
     path('api/math-game/level/', math_game.get_math_level, name='get_math_level'),
+    path('api/math-game/level/async/', math_game.get_math_level_async, name='get_math_level_async'),
     path('api/math-game/start-session/', math_game.start_math_session, name='start_math_session'),
     path('api/math-game/update-progress/', math_game.update_math_progress, name='update_math_progress'),
     path('api/math-game/next-level/', math_game.get_next_math_level, name='get_next_math_level'),
@@ -102,4 +107,5 @@ urlpatterns = [
 
     # ai question generator
     path('api/get-next-question/', quiz_game.get_next_question, name='get_next_question'),
+    path('api/llm/status/', views.llm_status, name='llm_status'),
 ]
\ No newline at end of file
@@ -6,6 +6,7 @@ from django.views.decorators.http import require_http_methods
 from django.views.decorators.cache import never_cache
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib import messages
 from django.utils import timezone
 from django.utils.cache import add_never_cache_headers
@@ -15,8 +16,10 @@ import random
 import uuid
 from .forms import *
 from .models import *
-from .game_utils import filter_by_age_appropriate, get_age_from_birthdate, get_difficulty_by_age
+from .game_utils import filter_by_age_appropriate, get_learner
 from . import riddles_game as riddles_views
+from .level_catalog import get_level
+from . import llm_cache, llm_client, llm_metrics, llm_quota, llm_router, single_flight
 from datetime import date
 from dateutil.relativedelta import relativedelta
 logger = logging.getLogger(__name__)
@@ -52,17 +55,14 @@ def get_capture_words(request):
             }, status=404)
         
         # Determine difficulty based on user age if authenticated
-        user = request.user if request.user.is_authenticated else None
-        if user and hasattr(user, 'profile') and user.profile.date_of_birth:
-            user_age = get_age_from_birthdate(user.profile.date_of_birth)
-            age_difficulty = get_difficulty_by_age(user_age)
-            if age_difficulty:
-                # Use age-appropriate difficulty, but allow easier levels
-                difficulty = age_difficulty
+        learner = get_learner(request)
+        if learner.difficulty:
+            # Use age-appropriate difficulty, but allow easier levels
+            difficulty = learner.difficulty
         
         # Get words for this type and difficulty, filtered by age
         base_query = CaptureWord.objects.filter(part_of_speech=pos)
-        words_query = filter_by_age_appropriate(user, base_query, 'difficulty')
+        words_query = filter_by_age_appropriate(learner, base_query, 'difficulty')
         words = list(words_query.filter(difficulty=difficulty))
         
         # If not enough words, get from easier difficulties (age-appropriate)
@@ -110,16 +110,13 @@ def get_mixed_capture_words(request):
             return JsonResponse({'error': 'Target type not found'}, status=404)
         
         # Determine difficulty based on user age if authenticated
-        user = request.user if request.user.is_authenticated else None
-        if user and hasattr(user, 'profile') and user.profile.date_of_birth:
-            user_age = get_age_from_birthdate(user.profile.date_of_birth)
-            age_difficulty = get_difficulty_by_age(user_age)
-            if age_difficulty:
-                difficulty = age_difficulty
+        learner = get_learner(request)
+        if learner.difficulty:
+            difficulty = learner.difficulty
         
         # Get target words, filtered by age
         base_query = CaptureWord.objects.filter(part_of_speech=target_pos)
-        words_query = filter_by_age_appropriate(user, base_query, 'difficulty')
+        words_query = filter_by_age_appropriate(learner, base_query, 'difficulty')
         target_words = list(words_query.filter(difficulty=difficulty))
         
         # Fallback to easier difficulties if needed (age-appropriate)
@@ -140,7 +137,7 @@ def get_mixed_capture_words(request):
         
         for pos in other_types:
             base_pos_query = CaptureWord.objects.filter(part_of_speech=pos)
-            pos_words_query = filter_by_age_appropriate(user, base_pos_query, 'difficulty')
+            pos_words_query = filter_by_age_appropriate(learner, base_pos_query, 'difficulty')
             words = list(pos_words_query.filter(difficulty=difficulty))
             
             # Fallback to easier difficulties (age-appropriate)
@@ -239,14 +236,8 @@ def words_search(request):
 def generate_word_search_puzzle(level_number, user=None):
     """Generate a word search puzzle for the given level, filtered by user age"""
     try:
-        # Filter levels by age-appropriate difficulty
-        levels = WordSearchLevel.objects.filter(level_number=level_number)
-        levels_query = filter_by_age_appropriate(user, levels, 'difficulty')
-        level = levels_query.first()
-        
-        if not level:
-            # Fallback to default level if age filtering removes it
-            level = WordSearchLevel.objects.get(level_number=level_number)
+        # Level numbers are unique, so age filtering always fell back to this level
+        level = get_level('word_search', level_number)
         
         # Get active categories
         categories = WordSearchCategory.objects.filter(is_active=True)
@@ -258,7 +249,7 @@ def generate_word_search_puzzle(level_number, user=None):
         
         # Get puzzles for this level and category
         puzzles = WordSearchPuzzle.objects.filter(
-            level=level,
+            level_id=level.pk,
             category=category,
             is_active=True
         )
@@ -505,7 +496,7 @@ def get_next_word_search_level(request):
     next_level = current_level + 1
     
     try:
-        level = WordSearchLevel.objects.get(level_number=next_level)
+        level = get_level('word_search', next_level)
         return JsonResponse({
             'level_number': level.level_number,
             'difficulty': level.difficulty,
@@ -792,4 +783,19 @@ def get_riddle_categories(request):
 
 @csrf_exempt
 def get_next_riddle(request):
-    return riddles_views.get_next_riddle(request)
\ No newline at end of file
+    return riddles_views.get_next_riddle(request)
+
+
+@staff_member_required
+@require_http_methods(["GET"])
+def llm_status(request):
+    """Circuit breaker state and routing stats per model, request coalescing counters, quota buckets, response cache counters and per-endpoint call metrics for this worker"""
+    return JsonResponse({
+        'configured': llm_client.is_configured(),
+        'breakers': llm_client.get_breaker_snapshot(),
+        'router': llm_router.get_router_snapshot(),
+        'coalescing': single_flight.get_coalescing_snapshot(),
+        'quota': llm_quota.get_quota_snapshot(),
+        'cache': llm_cache.get_stats(),
+        'endpoints': llm_metrics.get_summary(),
+    })